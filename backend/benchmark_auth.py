@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Benchmark /api/user/ with Basic auth versus the signed bearer token.
+
+Runs against a throwaway test database, so the real db.sqlite3 is never touched.
+BasicAuthentication is no longer configured, so the "before" pass re-enables it
+with override_settings to reproduce the original numbers.
+
+Usage:
+    python benchmark_auth.py
+    python benchmark_auth.py --requests 50
+"""
+
+import os
+import sys
+import time
+import base64
+import argparse
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transport_booking.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+
+
+def run(client, headers, count):
+    """Issue `count` GET /api/user/ calls and return requests per second"""
+    start = time.perf_counter()
+    for _ in range(count):
+        response = client.get('/api/user/', **headers)
+        assert response.status_code == 200, response.status_code
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark API authentication schemes')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per scheme')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        from booking.models import Student, SiteConfiguration
+
+        email, password = 'bench@example.com', 'Bench@12345'
+        Student.objects.create_user(
+            email=email, password=password, first_name='Bench', last_name='User',
+            roll_no='BENCH001', dept='CSE', year='3', gender='O',
+        )
+        SiteConfiguration.objects.create(pk=1, allowed_years=['1', '2', '3', '4'])
+        client = Client()
+
+        basic = 'Basic ' + base64.b64encode(f'{email}:{password}'.encode()).decode()
+        before = dict(settings.REST_FRAMEWORK, DEFAULT_AUTHENTICATION_CLASSES=(
+            settings.REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES']
+            + ['rest_framework.authentication.BasicAuthentication']
+        ))
+        with override_settings(REST_FRAMEWORK=before):
+            basic_rps = run(client, {'HTTP_AUTHORIZATION': basic}, args.requests)
+
+        response = client.post('/api/login/', {'email': email, 'password': password},
+                               content_type='application/json')
+        token = response.json()['token']
+        client = Client()  # drop the session cookie set by login
+        bearer_rps = run(client, {'HTTP_AUTHORIZATION': f'Bearer {token}'}, args.requests)
+
+        print(f"GET /api/user/ x {args.requests}")
+        print(f"  Basic auth:   {basic_rps:8.1f} req/s")
+        print(f"  Bearer token: {bearer_rps:8.1f} req/s")
+        print(f"  Speed-up:     {bearer_rps / basic_rps:8.1f}x")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
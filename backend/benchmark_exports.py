@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Benchmark the pickup CSV export: the old buffered HttpResponse built from model
+instances versus the streaming values() manifest.
+
+Runs against a throwaway test database, so the real db.sqlite3 is never touched.
+
+Usage:
+    python benchmark_exports.py
+    python benchmark_exports.py --bookings 20000
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import tracemalloc
+from datetime import date, time as dt_time
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).parent
+sys.path.insert(0, str(backend_dir))
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transport_booking.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.http import HttpResponse
+from django.test.utils import setup_test_environment
+
+
+def buffered_export(target_date):
+    """The export as it was: every row instantiated and written into one in-memory response"""
+    from booking.models import Booking
+    pickups = Booking.objects.filter(
+        trip_date=target_date,
+        is_outbound_trip=True,
+        status__in=['pending', 'confirmed']
+    ).select_related('student', 'bus').order_by('departure_time')
+
+    response = HttpResponse(content_type='text/csv')
+    writer = csv.writer(response)
+    writer.writerow(['Student Name', 'Roll No', 'Department', 'Phone', 'Pickup Location', 'Destination',
+                     'Departure Time', 'Bus Number', 'Route Name', 'Status', 'Booking Date'])
+    for pickup in pickups:
+        writer.writerow([
+            pickup.student.full_name, pickup.student.roll_no, pickup.student.dept,
+            pickup.student.phone_number, pickup.from_location, pickup.to_location,
+            pickup.departure_time.strftime('%H:%M'), pickup.bus.bus_no, pickup.bus.route_name,
+            pickup.status, pickup.booking_date.strftime('%Y-%m-%d %H:%M')
+        ])
+    return [response.content]
+
+
+def streaming_export(target_date):
+    from booking.manifests import Manifest
+    return Manifest(target_date, outbound=True).response('csv').streaming_content
+
+
+def measure(export, target_date):
+    """Return (seconds to first chunk, total seconds, bytes, peak traced memory in MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_chunk = None
+    size = 0
+    for chunk in export(target_date):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_chunk, total, size, peak / (1024 * 1024)
+
+
+def seed(count):
+    from booking.models import Student, Bus, Booking
+    students = Student.objects.bulk_create([
+        Student(email=f'bench{i}@example.com', first_name='Bench', last_name=str(i), phone_number='9999999999',
+                year='2', roll_no=f'BENCH{i:05d}', dept='CSE', gender='M')
+        for i in range(1000)
+    ])
+    buses = Bus.objects.bulk_create([
+        Bus(bus_no=f'TN{i:02d}', route_name=f'Route {i}', departure_time=dt_time(7, 30), capacity=60)
+        for i in range(40)
+    ])
+    today = date.today()
+    for start in range(0, count, 5000):
+        Booking.objects.bulk_create([
+            Booking(student=students[i % len(students)], bus=buses[i % len(buses)], trip_date=today,
+                    departure_time=dt_time(7, 30), from_location='REC', to_location='Town', status='confirmed')
+            for i in range(start, min(start + 5000, count))
+        ])
+    return today
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pickup CSV exports')
+    parser.add_argument('--bookings', type=int, default=100000, help='Bookings on the exported date')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        target_date = seed(args.bookings)
+        print(f"Pickup export of {args.bookings} bookings")
+        for label, export in (('Buffered HttpResponse', buffered_export), ('Streaming values()', streaming_export)):
+            first, total, size, peak = measure(export, target_date)
+            print(f"  {label:22} first byte {first:6.2f}s  total {total:6.2f}s  "
+                  f"{size / (1024 * 1024):5.1f} MB  peak memory {peak:7.1f} MB")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,63 +8,75 @@ from import_export.admin import ImportExportModelAdmin
 # Remove the problematic import - ImportValidationError doesn't exist in this version
 from django.core.exceptions import ValidationError
 
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 from django.urls import path
 from django.shortcuts import render
 from django.contrib.admin import SimpleListFilter
 import csv
 import os
-from .models import Student, Bus, Booking, BookingOTP, Stop, SiteConfiguration, PasswordResetOTP
+from .models import Student, Bus, Booking, BookingOTP, Stop, SiteConfiguration, PasswordResetOTP, BackgroundJob
 from .resources import StudentResource, BusResource, BookingResource, BookingOTPResource
+from . import otp as otp_service
+from . import versions
+from . import jobs
+from .pagination import EstimatedCountPaginator
+from .manifests import Manifest, FORMATS, parse_filters, artifact_response
+
+
+def go_action_breakdown(model, now=None):
+    """Plural noun and (label, condition) pairs that go_action reports for a model"""
+    from django.db.models import Q
+    now = now or timezone.now()
+    if model == Student:
+        return 'students', [('active', Q(is_active=True)), ('inactive', Q(is_active=False))]
+    if model == Bus:
+        return 'buses', [('booking open', Q(is_booking_open=True)), ('booking closed', Q(is_booking_open=False))]
+    if model == Booking:
+        return 'bookings', [
+            ('confirmed', Q(status='confirmed')),
+            ('pending', Q(status='pending')),
+            ('cancelled', Q(status='cancelled')),
+        ]
+    if model == BookingOTP:
+        return 'OTPs', [
+            ('verified', Q(verified=True)),
+            ('unverified', Q(verified=False)),
+            ('expired', Q(expires_at__lt=now)),
+        ]
+    if model == Stop:
+        return 'stops', [('active', Q(is_active=True)), ('inactive', Q(is_active=False))]
+    return model._meta.verbose_name_plural, []
 
 
 def go_action(modeladmin, request, queryset):
     """Custom 'Go' action that can be used for any model"""
     from django.contrib import messages
-    selected_count = queryset.count()
+    from django.db.models import Count
     model_name = modeladmin.model._meta.verbose_name_plural
+    noun, breakdown = go_action_breakdown(modeladmin.model)
+
+    # Works the same for "select all N matching": the selection stays a queryset,
+    # and the total plus every breakdown comes from one conditional aggregate
+    if queryset.query.annotations:
+        # Drop per-row annotations (e.g. StudentAdmin's EXISTS) from the scan
+        queryset = modeladmin.model._default_manager.filter(pk__in=queryset.values('pk'))
+    counts = queryset.order_by().aggregate(
+        total=Count('pk'),
+        **{f'c{i}': Count('pk', filter=condition) for i, (label, condition) in enumerate(breakdown)}
+    )
+    selected_count = counts['total']
     
     if selected_count == 0:
         messages.warning(request, f"No {model_name} selected.")
         return
     
-    # Customize action based on the model
-    if modeladmin.model == Student:
-        # For students, you could activate/deactivate them, send emails, etc.
-        active_count = queryset.filter(is_active=True).count()
-        inactive_count = queryset.filter(is_active=False).count()
-        messages.success(request, f"Selected {selected_count} students ({active_count} active, {inactive_count} inactive)")
-        
-    elif modeladmin.model == Bus:
-        # For buses, you could open/close booking, update schedules, etc.
-        open_count = queryset.filter(is_booking_open=True).count()
-        closed_count = queryset.filter(is_booking_open=False).count()
-        messages.success(request, f"Selected {selected_count} buses ({open_count} booking open, {closed_count} booking closed)")
-        
-    elif modeladmin.model == Booking:
-        # For bookings, you could confirm/cancel them, etc.
-        confirmed_count = queryset.filter(status='confirmed').count()
-        pending_count = queryset.filter(status='pending').count()
-        cancelled_count = queryset.filter(status='cancelled').count()
-        messages.success(request, f"Selected {selected_count} bookings ({confirmed_count} confirmed, {pending_count} pending, {cancelled_count} cancelled)")
-        
-    elif modeladmin.model == BookingOTP:
-        # For OTPs, you could resend them, etc.
-        verified_count = queryset.filter(verified=True).count()
-        unverified_count = queryset.filter(verified=False).count()
-        expired_count = queryset.filter(expires_at__lt=timezone.now()).count()
-        messages.success(request, f"Selected {selected_count} OTPs ({verified_count} verified, {unverified_count} unverified, {expired_count} expired)")
-        
-    elif modeladmin.model == Stop:
-        # For stops, you could activate/deactivate them, etc.
-        active_count = queryset.filter(is_active=True).count()
-        inactive_count = queryset.filter(is_active=False).count()
-        messages.success(request, f"Selected {selected_count} stops ({active_count} active, {inactive_count} inactive)")
-        
-    elif modeladmin.model == SiteConfiguration:
+    if modeladmin.model == SiteConfiguration:
         # For site configuration, you could reload settings, etc.
-        messages.success(request, f"Site configuration selected. Current allowed years: {queryset.first().allowed_years if queryset.exists() else 'Not set'}")
-        
+        config = queryset.first()
+        messages.success(request, f"Site configuration selected. Current allowed years: {config.allowed_years if config else 'Not set'}")
+    elif breakdown:
+        details = ', '.join(f"{counts[f'c{i}']} {label}" for i, (label, _) in enumerate(breakdown))
+        messages.success(request, f"Selected {selected_count} {noun} ({details})")
     else:
         messages.success(request, f"Processing {selected_count} selected {model_name}...")
     
@@ -74,6 +86,27 @@ def go_action(modeladmin, request, queryset):
 go_action.short_description = "Go - Process selected items"
 
 
+def start_background_job(modeladmin, request, task_name, ids):
+    """Queue a background job for the selected rows and send the admin to its progress page"""
+    from django.core.exceptions import ImproperlyConfigured
+    from django.shortcuts import redirect
+    from .tasks import OTP_TASKS
+    if task_name in OTP_TASKS:
+        # The worker would write OTPs the web processes cannot read; refuse instead of queueing
+        try:
+            otp_service.get_otp_store()
+        except ImproperlyConfigured as e:
+            modeladmin.message_user(request, f"❌ {jobs.task_label(task_name)} was not queued: {e}", level='ERROR')
+            return None
+    job = jobs.enqueue(task_name, created_by=request.user, total=len(ids), ids=ids)
+    modeladmin.message_user(
+        request,
+        f"⏳ {jobs.task_label(task_name)}: queued for {len(ids)} item(s). The job keeps running if you leave this page.",
+        level='INFO'
+    )
+    return redirect('admin:booking_backgroundjob_progress', job.pk)
+
+
 class DepartureDateFilter(admin.SimpleListFilter):
     title = 'Departure Date'
     parameter_name = 'departure_date_filter'
@@ -126,18 +159,51 @@ class TripTypeFilter(SimpleListFilter):
         return queryset
 
 
+def get_trip_date_index():
+    """Distinct booking trip dates, cached until the next booking write"""
+    from django.core.cache import cache
+    key = f'booking:trip-dates:{versions.get_version()}'
+    dates = cache.get(key)
+    if dates is None:
+        dates = list(Booking.objects.dates('trip_date', 'day'))
+        cache.set(key, dates, 60 * 60 * 24)
+    return dates
+
+
 class DateFilter(SimpleListFilter):
+    """Trip dates near today as single days; everything else grouped into "more" month ranges"""
     title = 'Trip Date'
     parameter_name = 'trip_date'
+    days_before = 7
+    days_after = 14
 
     def lookups(self, request, model_admin):
-        # Get unique trip dates from bookings
-        dates = Booking.objects.dates('trip_date', 'day')
-        return [(date.strftime('%Y-%m-%d'), date.strftime('%B %d, %Y')) for date in dates]
+        today = timezone.localdate()
+        window_start = today - timedelta(days=self.days_before)
+        window_end = today + timedelta(days=self.days_after)
+        days = []
+        months = {}
+        for date in get_trip_date_index():
+            if window_start <= date <= window_end:
+                days.append((date.strftime('%Y-%m-%d'), date.strftime('%B %d, %Y')))
+            else:
+                months.setdefault(date.strftime('%Y-%m'), f"More: {date.strftime('%B %Y')}")
+        # Keep a selected day from outside the window visible as the active choice
+        value = self.value()
+        if value and len(value) == 10 and value not in dict(days):
+            try:
+                date = datetime.strptime(value, '%Y-%m-%d').date()
+                days.append((value, date.strftime('%B %d, %Y')))
+            except ValueError:
+                pass
+        return days + sorted(months.items(), reverse=True)
 
     def queryset(self, request, queryset):
         if self.value():
             try:
+                if len(self.value()) == 7:
+                    month = datetime.strptime(self.value(), '%Y-%m').date()
+                    return queryset.filter(trip_date__year=month.year, trip_date__month=month.month)
                 date = datetime.strptime(self.value(), '%Y-%m-%d').date()
                 return queryset.filter(trip_date=date)
             except ValueError:
@@ -148,6 +214,47 @@ class DateFilter(SimpleListFilter):
 
 
 
+class StudentCSVImportForm(forms.Form):
+    csv_file = forms.FileField(label='CSV file')
+    update_existing = forms.BooleanField(required=False, label='Update existing students')
+
+    def clean_csv_file(self):
+        from .student_validation import REQUIRED_COLUMNS
+        upload = self.cleaned_data['csv_file']
+        if not upload.name.lower().endswith('.csv'):
+            raise ValidationError('File must be a CSV file')
+        try:
+            header = next(csv.reader([next(upload.chunks()).decode('utf-8').splitlines()[0]]), [])
+        except (StopIteration, IndexError):
+            raise ValidationError('The file is empty')
+        except UnicodeDecodeError:
+            raise ValidationError('File encoding error. Please save the CSV file as UTF-8.')
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in header]
+        if missing_columns:
+            raise ValidationError(f'Missing required columns: {", ".join(missing_columns)}')
+        return upload
+
+
+class TimetableImportForm(forms.Form):
+    csv_file = forms.FileField(label='Timetable CSV', required=False)
+    # The previewed file, posted back unchanged to apply it
+    csv_text = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('csv_file')
+        if upload:
+            if not upload.name.lower().endswith('.csv'):
+                raise ValidationError('File must be a CSV file')
+            try:
+                cleaned_data['csv_text'] = upload.read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise ValidationError('File encoding error. Please save the CSV file as UTF-8.')
+        elif not cleaned_data.get('csv_text'):
+            raise ValidationError('Choose a timetable file')
+        return cleaned_data
+
+
 class BusAdminForm(forms.ModelForm):
     class Meta:
         model = Bus
@@ -157,7 +264,7 @@ class BusAdminForm(forms.ModelForm):
 class StopInline(admin.TabularInline):
     model = Stop
     extra = 1
-    fields = ('stop_name', 'location', 'is_pickup', 'is_dropoff', 'is_active')
+    fields = ('sequence', 'stop_name', 'location', 'is_pickup', 'is_dropoff', 'is_active')
 
 
 # Users Group - Students
@@ -171,6 +278,7 @@ class StudentAdmin(ImportExportModelAdmin, UserAdmin):
     filter_horizontal = ()
     readonly_fields = ('last_login', 'date_joined', 'has_active_booking', 'password_status')
     actions = ['send_forgot_password_otp', 'set_default_passwords', go_action]
+    change_list_template = 'admin/booking/student/change_list.html'
     
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -198,17 +306,25 @@ class StudentAdmin(ImportExportModelAdmin, UserAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # One EXISTS subquery instead of a bookings query per row
+        from django.db.models import Exists, OuterRef
+        active_bookings = Booking.objects.filter(Booking.active_q(), student=OuterRef('pk'))
+        return super().get_queryset(request).annotate(_has_active_booking=Exists(active_bookings))
+
     def has_active_booking(self, obj):
+        if hasattr(obj, '_has_active_booking'):
+            return obj._has_active_booking
         return obj.has_active_booking()
     has_active_booking.boolean = True
     has_active_booking.short_description = 'Active Booking'
+    has_active_booking.admin_order_field = '_has_active_booking'
     
     def password_status(self, obj):
         """Display password status for imported users"""
         if obj.password:
-            # Check if password is the default imported password
-            from django.contrib.auth.hashers import check_password
-            if check_password('Changeme@123', obj.password):
+            # Stored flag, so no password hashing while rendering
+            if obj.has_default_password:
                 return mark_safe(
                     '<span style="color: #856404; background-color: #fff3cd; padding: 4px 8px; border-radius: 4px; border: 1px solid #ffeaa7;">'
                     '🔑 Default Password Set (Changeme@123)<br>'
@@ -234,60 +350,27 @@ class StudentAdmin(ImportExportModelAdmin, UserAdmin):
     def password_status_short(self, obj):
         """Short version of password status for list display"""
         if obj.password:
-            from django.contrib.auth.hashers import check_password
-            if check_password('Changeme@123', obj.password):
+            if obj.has_default_password:
                 return mark_safe('<span style="color: #856404;">🔑 Default</span>')
             else:
                 return mark_safe('<span style="color: #155724;">✅ Set</span>')
         else:
             return mark_safe('<span style="color: #721c24;">❌ None</span>')
     password_status_short.short_description = 'Password'
+    password_status_short.admin_order_field = 'has_default_password'
     
     def send_forgot_password_otp(self, request, queryset):
-        """Send forgot password OTP to selected students"""
-        count = 0
-        for student in queryset:
-            try:
-                otp = PasswordResetOTP.create_for_student(student)
-                count += 1
-                self.message_user(
-                    request, 
-                    f"✅ Password reset OTP sent to {student.email}",
-                    level='SUCCESS'
-                )
-            except Exception as e:
-                self.message_user(
-                    request, 
-                    f"❌ Failed to send OTP to {student.email}: {str(e)}",
-                    level='ERROR'
-                )
-        
-        if count > 0:
-            self.message_user(
-                request, 
-                f"✅ Successfully sent password reset OTPs to {count} student(s)",
-                level='SUCCESS'
-            )
+        """Send forgot password OTP to selected students (in a background job)"""
+        ids = list(queryset.values_list('pk', flat=True))
+        return start_background_job(self, request, 'send_password_reset_otps', ids)
     
     send_forgot_password_otp.short_description = "🔑 Send forgot password OTP"
     
     def set_default_passwords(self, request, queryset):
-        """Set default password for selected students who don't have passwords"""
-        from django.contrib.auth.hashers import make_password
-        
-        count = 0
-        for student in queryset:
-            if not student.password:
-                student.password = make_password('Changeme@123')
-                student.save()
-                count += 1
-        
-        if count > 0:
-            self.message_user(
-                request, 
-                f"✅ Set default password 'Changeme@123' for {count} student(s). They should change it on first login.",
-                level='SUCCESS'
-            )
+        """Set default password for selected students who don't have passwords (in a background job)"""
+        ids = list(queryset.filter(password='').values_list('pk', flat=True))
+        if ids:
+            return start_background_job(self, request, 'set_default_passwords', ids)
         else:
             self.message_user(
                 request, 
@@ -312,9 +395,65 @@ class StudentAdmin(ImportExportModelAdmin, UserAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('download-template/', self.admin_site.admin_view(self.download_template_view), name='student_download_template'),
+            path('import-csv/', self.admin_site.admin_view(self.import_csv_view), name='student_import_csv'),
         ]
         return custom_urls + urls
 
+    def import_csv_view(self, request):
+        """
+        Import a large student CSV as a checkpointed background job. Uploading the same file
+        again (same SHA-256 and options) resumes its unfinished job from the last committed
+        chunk instead of starting over.
+        """
+        import hashlib
+        from django.shortcuts import redirect
+        from .student_import import CHUNK_SIZE
+        if not self.has_add_permission(request):
+            from django.core.exceptions import PermissionDenied
+            raise PermissionDenied
+
+        form = StudentCSVImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['csv_file']
+            update_existing = form.cleaned_data['update_existing']
+            digest = hashlib.sha256()
+            for chunk in upload.chunks():
+                digest.update(chunk)
+            file_hash = digest.hexdigest()
+
+            # Uploads are stored by content, so a re-upload finds the file its job was reading.
+            # default_storage rather than a local directory: the job may run on another node
+            from django.core.files.storage import default_storage
+            stored = f"{jobs.get_jobs_config()['UPLOAD_PREFIX']}{file_hash}.csv"
+            if not default_storage.exists(stored):
+                stored = default_storage.save(stored, upload)
+
+            job = jobs.unfinished_job('import_students', file_hash, update_existing=update_existing)
+            if job is None:
+                job = jobs.enqueue(
+                    'import_students', created_by=request.user, total=upload.size, file_hash=file_hash,
+                    upload=stored, update_existing=update_existing,
+                )
+                self.message_user(request, f"⏳ Importing {upload.name}: queued. The job keeps running if you leave this page.", level='INFO')
+            else:
+                if job.status == 'failed':
+                    BackgroundJob.objects.filter(pk=job.pk, status='failed').update(
+                        status='queued', worker='', error='', finished_at=None, attempts=0
+                    )
+                next_row = (job.checkpoint or {}).get('next_row')
+                resume = f"from row {next_row}" if next_row else "from the start"
+                self.message_user(request, f"🔄 {upload.name} was already being imported: resuming job #{job.pk} {resume}.", level='INFO')
+            return redirect('admin:booking_backgroundjob_progress', job.pk)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Import students from a large CSV',
+            'form': form,
+            'chunk_size': CHUNK_SIZE,
+            'opts': self.model._meta,
+        }
+        return render(request, 'admin/booking/student/import_csv.html', context)
+
     def download_template_view(self, request):
         """Download CSV template for students"""
         from django.conf import settings
@@ -342,8 +481,7 @@ class StudentAdmin(ImportExportModelAdmin, UserAdmin):
     def save_model(self, request, obj, form, change):
         """Ensure password is set when creating new students"""
         if not change and not obj.password:  # New student without password
-            from django.contrib.auth.hashers import make_password
-            obj.password = make_password('Changeme@123')
+            obj.set_default_password()
         super().save_model(request, obj, form, change)
 
     def save_related(self, request, form, formsets, change):
@@ -351,8 +489,7 @@ class StudentAdmin(ImportExportModelAdmin, UserAdmin):
         super().save_related(request, form, formsets, change)
         # Double-check password is set
         if not change and not form.instance.password:
-            from django.contrib.auth.hashers import make_password
-            form.instance.password = make_password('Changeme@123')
+            form.instance.set_default_password()
             form.instance.save()
 
 
@@ -379,6 +516,41 @@ class BookingAdmin(admin.ModelAdmin):
     search_fields = ['student__first_name', 'student__last_name', 'student__roll_no', 'bus__bus_no']
     readonly_fields = ['return_trip_available']
     date_hierarchy = 'trip_date'
+    # student_name, bus_info and __str__ (selected_stop) read these on every row
+    list_select_related = ('student', 'bus', 'selected_stop')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    @staticmethod
+    def completed_outbound(queryset, now=None):
+        """Active outbound bookings whose 24-hour return restriction has passed"""
+        return queryset.filter(
+            is_outbound_trip=True,
+            status__in=['pending', 'confirmed'],
+            return_trip_available_after__lte=now or timezone.now(),
+        )
+    
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        # Auto-cancel the completed outbound bookings on this page in one UPDATE before it is
+        # rendered, rather than saving them one by one from swift_button. Bookings on other
+        # pages are left to the auto-cancel action, so a page view never scans the table.
+        cl = getattr(response, 'context_data', {}).get('cl')
+        if cl is not None:
+            now = timezone.now()
+            completed = [
+                booking for booking in cl.result_list
+                if booking.is_outbound_trip and booking.status in ('pending', 'confirmed')
+                and booking.return_trip_available_after and booking.return_trip_available_after <= now
+            ]
+            if completed:
+                self.completed_outbound(Booking.objects.filter(pk__in=[b.pk for b in completed]), now).update(
+                    status='cancelled'
+                )
+                versions.bump_bookings((b.trip_date, b.bus_id) for b in completed)
+                for booking in completed:
+                    booking.status = 'cancelled'
+        return response
     
     def student_name(self, obj):
         return f"{obj.student.first_name} {obj.student.last_name}"
@@ -393,14 +565,16 @@ class BookingAdmin(admin.ModelAdmin):
     trip_type.short_description = 'Trip Type'
     
     def return_trip_available(self, obj):
+        # Only reads fields already on the row; no related lookups
         if obj.is_outbound_trip and obj.return_trip_available_after:
-            if timezone.now() >= obj.return_trip_available_after:
+            now = timezone.now()
+            if now >= obj.return_trip_available_after:
                 if obj.status == 'cancelled':
                     return "✅ Available (Outbound Cancelled)"
                 else:
                     return "✅ Available"
             else:
-                time_remaining = obj.return_trip_available_after - timezone.now()
+                time_remaining = obj.return_trip_available_after - now
                 hours = int(time_remaining.total_seconds() // 3600)
                 minutes = int((time_remaining.total_seconds() % 3600) // 60)
                 return f"⏳ {hours}h {minutes}m remaining"
@@ -417,10 +591,7 @@ class BookingAdmin(admin.ModelAdmin):
         
         now = timezone.now()
         if now >= obj.return_trip_available_after:
-            # Auto-cancel outbound booking when 24 hours complete
-            if obj.status != 'cancelled':
-                obj.status = 'cancelled'
-                obj.save()
+            # Already cancelled in bulk by changelist_view
             return "✅ Available (Outbound Cancelled)"
         else:
             html = f"""
@@ -437,19 +608,10 @@ class BookingAdmin(admin.ModelAdmin):
     
     def auto_cancel_completed_outbound(self, request, queryset):
         """Admin action to auto-cancel outbound bookings where 24-hour period is complete"""
-        count = 0
-        now = timezone.now()
-        
-        for booking in queryset:
-            if (booking.is_outbound_trip and 
-                booking.status in ['pending', 'confirmed'] and
-                booking.return_trip_available_after and
-                now >= booking.return_trip_available_after):
-                
-                # Cancel the outbound booking
-                booking.status = 'cancelled'
-                booking.save()
-                count += 1
+        # Cancel the outbound bookings in a single UPDATE
+        completed = self.completed_outbound(queryset)
+        versions.bump_for_queryset(completed)
+        count = completed.update(status='cancelled')
         
         if count > 0:
             self.message_user(
@@ -471,151 +633,169 @@ class BookingAdmin(admin.ModelAdmin):
         custom_urls = [
             path('pickup-list/', self.admin_site.admin_view(self.pickup_list_view), name='booking_pickup_list'),
             path('dropoff-list/', self.admin_site.admin_view(self.dropoff_list_view), name='booking_dropoff_list'),
+            path('pickup-list/bus/<int:bus_id>/', self.admin_site.admin_view(self.pickup_group_view), name='booking_pickup_group'),
+            path('dropoff-list/bus/<int:bus_id>/', self.admin_site.admin_view(self.dropoff_group_view), name='booking_dropoff_group'),
+            path('pickup-list/bus/<int:bus_id>/driver-sheet/', self.admin_site.admin_view(self.pickup_driver_sheet_view), name='booking_pickup_driver_sheet'),
+            path('dropoff-list/bus/<int:bus_id>/driver-sheet/', self.admin_site.admin_view(self.dropoff_driver_sheet_view), name='booking_dropoff_driver_sheet'),
             path('export-pickup/', self.admin_site.admin_view(self.export_pickup_view), name='booking_export_pickup'),
             path('export-dropoff/', self.admin_site.admin_view(self.export_dropoff_view), name='booking_export_dropoff'),
             path('<int:booking_id>/swift-override/', self.admin_site.admin_view(self.swift_override_view), name='booking_swift_override'),
         ]
         return custom_urls + urls
 
-    def pickup_list_view(self, request):
-        """Admin view for pickup list with date filtering"""
+    # Rows per page when a bus group is expanded on the pickup / drop-off pages
+    trip_group_page_size = 50
+
+    def _trip_list_date(self, request):
         selected_date = request.GET.get('date', timezone.now().date().strftime('%Y-%m-%d'))
         
         try:
             target_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
         except ValueError:
             target_date = timezone.now().date()
-        
-        # Get all outbound bookings (FROM REC) for the selected date
-        pickups = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=True,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
+        return selected_date, target_date
+
+    def _trip_groups(self, queryset):
+        """Buses with their stops and per-group counts, all from one grouped aggregate"""
+        from django.db.models import Count, Q
+        rows = queryset.values(
+            'bus_id', 'bus__bus_no', 'bus__route_name',
+            'selected_stop_id', 'selected_stop__stop_name', 'selected_stop__location',
+        ).annotate(
+            total=Count('id'),
+            confirmed=Count('id', filter=Q(status='confirmed')),
+        ).order_by('bus__bus_no', 'selected_stop__stop_name')
+
+        buses = {}
+        for row in rows:
+            bus = buses.setdefault(row['bus_id'], {
+                'id': row['bus_id'],
+                'bus_no': row['bus__bus_no'],
+                'route_name': row['bus__route_name'],
+                'total': 0,
+                'confirmed': 0,
+                'stops': [],
+            })
+            bus['stops'].append({
+                'param': row['selected_stop_id'] or 'none',
+                'name': row['selected_stop__stop_name'] or 'No stop selected',
+                'location': row['selected_stop__location'] or '',
+                'total': row['total'],
+            })
+            bus['total'] += row['total']
+            bus['confirmed'] += row['confirmed']
+        for bus in buses.values():
+            bus['pending'] = bus['total'] - bus['confirmed']
+        return list(buses.values())
+
+    def _trip_list_page(self, request, outbound):
+        selected_date, target_date = self._trip_list_date(request)
+        groups = self._trip_groups(Manifest(target_date, outbound=outbound).queryset())
+        if outbound:
+            # Get all outbound bookings (FROM REC) for the selected date
+            title = f'Pickup List for {target_date.strftime("%B %d, %Y")}'
+            template = 'admin/booking/pickup_list.html'
+            count_key = 'pickup_count'
+            group_url_name = 'admin:booking_pickup_group'
+            export_url_name = 'admin:booking_export_pickup'
+            driver_sheet_url_name = 'admin:booking_pickup_driver_sheet'
+        else:
+            # Get all return bookings (TO REC) for the selected date
+            title = f'Drop-off List for {target_date.strftime("%B %d, %Y")}'
+            template = 'admin/booking/dropoff_list.html'
+            count_key = 'dropoff_count'
+            group_url_name = 'admin:booking_dropoff_group'
+            export_url_name = 'admin:booking_export_dropoff'
+            driver_sheet_url_name = 'admin:booking_dropoff_driver_sheet'
         
         context = {
-            'title': f'Pickup List for {target_date.strftime("%B %d, %Y")}',
-            'pickups': pickups,
+            'title': title,
+            'groups': groups,
             'selected_date': selected_date,
-            'pickup_count': pickups.count(),
+            count_key: sum(bus['total'] for bus in groups),
+            'group_url_name': group_url_name,
+            'export_url_name': export_url_name,
+            'driver_sheet_url_name': driver_sheet_url_name,
             'opts': self.model._meta,
         }
         
-        return render(request, 'admin/booking/pickup_list.html', context)
+        return render(request, template, context)
+
+    def pickup_list_view(self, request):
+        """Admin view for pickup list with date filtering, grouped by bus and stop"""
+        return self._trip_list_page(request, outbound=True)
 
     def dropoff_list_view(self, request):
-        """Admin view for drop-off list with date filtering"""
-        selected_date = request.GET.get('date', timezone.now().date().strftime('%Y-%m-%d'))
-        
+        """Admin view for drop-off list with date filtering, grouped by bus and stop"""
+        return self._trip_list_page(request, outbound=False)
+
+    def _trip_group_rows(self, request, bus_id, outbound):
+        """One page of a bus group's bookings, loaded when the group is expanded"""
+        from django.core.paginator import Paginator
+        selected_date, target_date = self._trip_list_date(request)
+        stop = request.GET.get('stop', '')
         try:
-            target_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
+            filters = parse_filters({'stop': stop})
         except ValueError:
-            target_date = timezone.now().date()
-        
-        # Get all return bookings (TO REC) for the selected date
-        dropoffs = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=False,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
-        
+            filters = {}
+        manifest = Manifest(target_date, outbound=outbound, bus_id=bus_id, **filters)
+        page = Paginator(manifest.projection(), self.trip_group_page_size).get_page(request.GET.get('page'))
         context = {
-            'title': f'Drop-off List for {target_date.strftime("%B %d, %Y")}',
-            'dropoffs': dropoffs,
+            'page': page,
+            'bookings': list(manifest.records(page.object_list)),
             'selected_date': selected_date,
-            'dropoff_count': dropoffs.count(),
-            'opts': self.model._meta,
+            'stop': stop,
+            'outbound': outbound,
+            'group_url': request.path,
         }
-        
-        return render(request, 'admin/booking/dropoff_list.html', context)
+        return render(request, 'admin/booking/trip_group_rows.html', context)
 
-    def export_pickup_view(self, request):
-        """Export pickup list to CSV"""
-        selected_date = request.GET.get('date', timezone.now().date().strftime('%Y-%m-%d'))
-        
+    def pickup_group_view(self, request, bus_id):
+        return self._trip_group_rows(request, bus_id, outbound=True)
+
+    def dropoff_group_view(self, request, bus_id):
+        return self._trip_group_rows(request, bus_id, outbound=False)
+
+    def _manifest_filters(self, request):
+        from django.contrib import messages
         try:
-            target_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
-        except ValueError:
-            target_date = timezone.now().date()
-        
-        # Get all outbound bookings (FROM REC) for the selected date
-        pickups = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=True,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
-        
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="pickup_list_{target_date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Student Name', 'Roll No', 'Department', 'Phone', 
-            'Pickup Location', 'Destination', 'Departure Time', 
-            'Bus Number', 'Route Name', 'Status', 'Booking Date'
-        ])
-        
-        for pickup in pickups:
-            writer.writerow([
-                f"{pickup.student.first_name} {pickup.student.last_name}",
-                pickup.student.roll_no,
-                pickup.student.dept,
-                pickup.student.phone_number,
-                pickup.from_location,
-                pickup.to_location,
-                pickup.departure_time.strftime('%H:%M'),
-                pickup.bus.bus_no,
-                pickup.bus.route_name,
-                pickup.status,
-                pickup.booking_date.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        return response
+            return parse_filters(request.GET)
+        except ValueError as e:
+            messages.warning(request, f'{e}; exporting the unfiltered list.')
+            return {}
+
+    def _manifest_format(self, request):
+        file_format = request.GET.get('file_format', 'csv')
+        return file_format if file_format in FORMATS else 'csv'
+
+    def _driver_sheet(self, request, bus_id, outbound):
+        """Printable per-bus sheet ordered by stop; pre-built by generate_manifests, else built on demand"""
+        selected_date, target_date = self._trip_list_date(request)
+        manifest = Manifest(target_date, outbound=outbound, bus_id=bus_id)
+        try:
+            path, _ = manifest.driver_sheet_artifact()
+        except Bus.DoesNotExist:
+            raise Http404('Bus not found')
+        return artifact_response(path, f'driver_sheet_{manifest.artifact_stem()}_{target_date}.html',
+                                 'text/html; charset=utf-8', attachment=False)
+
+    def pickup_driver_sheet_view(self, request, bus_id):
+        return self._driver_sheet(request, bus_id, outbound=True)
+
+    def dropoff_driver_sheet_view(self, request, bus_id):
+        return self._driver_sheet(request, bus_id, outbound=False)
+
+    def export_pickup_view(self, request):
+        """Export pickup list as CSV (streamed), JSONL or XLSX"""
+        selected_date, target_date = self._trip_list_date(request)
+        manifest = Manifest(target_date, outbound=True, **self._manifest_filters(request))
+        return manifest.cached_response(self._manifest_format(request))
 
     def export_dropoff_view(self, request):
-        """Export drop-off list to CSV"""
-        selected_date = request.GET.get('date', timezone.now().date().strftime('%Y-%m-%d'))
-        
-        try:
-            target_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
-        except ValueError:
-            target_date = timezone.now().date()
-        
-        # Get all return bookings (TO REC) for the selected date
-        dropoffs = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=False,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
-        
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="dropoff_list_{target_date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Student Name', 'Roll No', 'Department', 'Phone', 
-            'Pickup Location', 'Drop-off Location', 'Departure Time', 
-            'Bus Number', 'Route Name', 'Status', 'Booking Date'
-        ])
-        
-        for dropoff in dropoffs:
-            writer.writerow([
-                f"{dropoff.student.first_name} {dropoff.student.last_name}",
-                dropoff.student.roll_no,
-                dropoff.student.dept,
-                dropoff.student.phone_number,
-                dropoff.from_location,
-                dropoff.to_location,
-                dropoff.departure_time.strftime('%H:%M'),
-                dropoff.bus.bus_no,
-                dropoff.bus.route_name,
-                dropoff.status,
-                dropoff.booking_date.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        return response
+        """Export drop-off list as CSV (streamed), JSONL or XLSX"""
+        selected_date, target_date = self._trip_list_date(request)
+        manifest = Manifest(target_date, outbound=False, **self._manifest_filters(request))
+        return manifest.cached_response(self._manifest_format(request))
 
     def swift_override_view(self, request, booking_id):
         """Swift override view to immediately remove 24-hour constraint"""
@@ -668,6 +848,9 @@ class BookingOTPAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     list_filter = ('verified', 'created_at', 'expires_at')
     search_fields = ('booking__student__email', 'booking__student__first_name', 'otp_code')
     ordering = ('-created_at',)
+    list_select_related = ('booking__student', 'booking__bus', 'booking__selected_stop')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ('otp_code', 'created_at', 'expires_at')
     actions = ['resend_expired_otps', go_action]
     
@@ -696,21 +879,11 @@ class BookingOTPAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     time_remaining.short_description = 'Time Remaining'
     
     def resend_expired_otps(self, request, queryset):
-        """Admin action to resend OTPs for expired entries"""
-        expired_otps = queryset.filter(expires_at__lt=timezone.now())
-        count = 0
-        
-        for otp in expired_otps:
-            try:
-                otp.regenerate_otp()
-                count += 1
-            except Exception as e:
-                self.message_user(request, f"Failed to resend OTP for booking {otp.booking.id}: {str(e)}", level='ERROR')
-        
-        if count > 0:
-            self.message_user(request, f"Successfully resent {count} OTP(s)")
-        else:
-            self.message_user(request, "No expired OTPs found in the selection")
+        """Admin action to resend OTPs for expired entries (in a background job)"""
+        ids = list(queryset.filter(expires_at__lt=timezone.now()).values_list('pk', flat=True))
+        if ids:
+            return start_background_job(self, request, 'resend_booking_otps', ids)
+        self.message_user(request, "No expired OTPs found in the selection")
     
     resend_expired_otps.short_description = "Resend OTP for expired entries"
     
@@ -728,8 +901,8 @@ class BookingOTPAdmin(ImportExportModelAdmin, admin.ModelAdmin):
         
         otp = queryset.first()
         try:
-            new_otp = otp.regenerate_otp()
-            self.message_user(request, f"OTP resent successfully. New OTP: {new_otp}")
+            new_otp = otp_service.issue_booking_otp(otp.booking, minutes=15, resend=True)
+            self.message_user(request, f"OTP resent successfully. New OTP: {new_otp.code}")
         except Exception as e:
             self.message_user(request, f"Failed to resend OTP: {str(e)}", level='ERROR')
     
@@ -748,6 +921,7 @@ class BusAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     actions = ['set_today_departure', 'set_tomorrow_departure', 'set_next_week_departure', go_action]
     readonly_fields = ('available_seats', 'is_full')
     inlines = [StopInline]
+    change_list_template = 'admin/booking/bus/change_list.html'
     
     fieldsets = (
         ('Basic Information', {
@@ -764,16 +938,80 @@ class BusAdmin(ImportExportModelAdmin, admin.ModelAdmin):
         }),
     )
     
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('import-timetable/', self.admin_site.admin_view(self.import_timetable_view), name='bus_import_timetable'),
+        ]
+        return custom_urls + urls
+
+    def import_timetable_view(self, request):
+        """Upload a timetable (buses + ordered stops), preview the diff, then apply it"""
+        import io
+        from django.shortcuts import redirect
+        from .timetable import import_timetable
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            from django.core.exceptions import PermissionDenied
+            raise PermissionDenied
+
+        form = TimetableImportForm(request.POST or None, request.FILES or None)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Import bus timetable',
+            'opts': self.model._meta,
+        }
+        if request.method == 'POST' and form.is_valid():
+            csv_text = form.cleaned_data['csv_text']
+            confirmed = '_confirm' in request.POST
+            result = import_timetable(io.StringIO(csv_text, newline=''), dry_run=not confirmed)
+            if result.errors:
+                context['errors'] = result.errors
+            elif confirmed:
+                summary = result.diff.summary()
+                self.message_user(
+                    request,
+                    f"✅ Timetable imported: {summary['buses_created']} bus(es) created, "
+                    f"{summary['buses_updated']} updated; {summary['stops_created']} stop(s) created, "
+                    f"{summary['stops_updated']} moved or reactivated, {summary['stops_deactivated']} deactivated"
+                )
+                return redirect('admin:booking_bus_changelist')
+            else:
+                context['diff'] = result.diff
+                form = TimetableImportForm(initial={'csv_text': csv_text})
+        context['form'] = form
+        return render(request, 'admin/booking/bus/import_timetable.html', context)
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        # Work out route demand once for the whole page instead of per bus
+        cl = getattr(response, 'context_data', {}).get('cl')
+        if cl is not None:
+            buses = list(cl.result_list)
+            try:
+                demand = Bus.route_demand(bus.route_name for bus in buses)
+            except Exception:
+                demand = {}
+            for bus in buses:
+                bus._route_demand = demand.get(bus.route_name)
+        return response
+
+    def _confirmed_for_route(self, obj):
+        if hasattr(obj, '_route_demand'):
+            if obj._route_demand is None:
+                raise ValueError('Route demand unavailable')
+            return obj._route_demand[1]
+        return obj.confirmed_bookings_for_route_on_date()
+
     def route_confirmed_today(self, obj):
         try:
-            return obj.confirmed_bookings_for_route_on_date()
+            return self._confirmed_for_route(obj)
         except Exception:
             return '-'
     route_confirmed_today.short_description = 'Route confirmed (today)'
 
     def required_buses_today(self, obj):
         try:
-            return obj.required_buses_for_route_on_date()
+            return obj.required_buses_for_route_on_date(self._confirmed_for_route(obj))
         except Exception:
             return '-'
     required_buses_today.short_description = 'Required buses (today)'
@@ -805,16 +1043,16 @@ class BusAdmin(ImportExportModelAdmin, admin.ModelAdmin):
 
 @admin.register(Stop)
 class StopAdmin(ImportExportModelAdmin, admin.ModelAdmin):
-    list_display = ('bus', 'stop_name', 'location', 'is_pickup', 'is_dropoff', 'is_active', 'created_at')
+    list_display = ('bus', 'sequence', 'stop_name', 'location', 'is_pickup', 'is_dropoff', 'is_active', 'created_at')
     list_filter = ('is_active', 'is_pickup', 'is_dropoff', 'bus__route_name', 'created_at')
     search_fields = ('bus__bus_no', 'stop_name', 'location')
-    ordering = ('bus__bus_no', 'stop_name', 'location')
+    ordering = ('bus__bus_no', 'sequence', 'stop_name', 'location')
     list_editable = ('is_active', 'is_pickup', 'is_dropoff')
     actions = [go_action]
     
     fieldsets = (
         ('Stop Information', {
-            'fields': ('bus', 'stop_name', 'location')
+            'fields': ('bus', 'sequence', 'stop_name', 'location')
         }),
         ('Stop Type', {
             'fields': ('is_pickup', 'is_dropoff')
@@ -831,6 +1069,9 @@ class PasswordResetOTPAdmin(admin.ModelAdmin):
     list_filter = ('verified', 'used', 'created_at', 'expires_at')
     search_fields = ('student__email', 'student__first_name', 'student__last_name', 'otp_code')
     ordering = ('-created_at',)
+    list_select_related = ('student',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ('otp_code', 'created_at', 'expires_at')
     actions = ['resend_expired_otps', go_action]
     
@@ -859,21 +1100,11 @@ class PasswordResetOTPAdmin(admin.ModelAdmin):
     time_remaining.short_description = 'Time Remaining'
     
     def resend_expired_otps(self, request, queryset):
-        """Admin action to resend OTPs for expired entries"""
-        expired_otps = queryset.filter(expires_at__lt=timezone.now(), used=False)
-        count = 0
-        
-        for otp in expired_otps:
-            try:
-                otp.generate_otp()
-                count += 1
-            except Exception as e:
-                self.message_user(request, f"Failed to resend OTP for {otp.student.email}: {str(e)}", level='ERROR')
-        
-        if count > 0:
-            self.message_user(request, f"Successfully resent {count} OTP(s)")
-        else:
-            self.message_user(request, "No expired OTPs found in the selection")
+        """Admin action to resend OTPs for expired entries (in a background job)"""
+        ids = list(queryset.filter(expires_at__lt=timezone.now(), used=False).values_list('pk', flat=True))
+        if ids:
+            return start_background_job(self, request, 'resend_password_reset_otps', ids)
+        self.message_user(request, "No expired OTPs found in the selection")
     
     resend_expired_otps.short_description = "Resend OTP for expired entries"
 
@@ -918,6 +1149,7 @@ def _group_booking_app_list(request):
     2. Users and groups: Students, SiteConfiguration
     3. Bookings: BookingOTP, Booking
     4. Bus Details: Buses, Stops
+    5. Background Jobs: BackgroundJob
     Any other apps remain as-is below these groups.
     """
     try:
@@ -972,6 +1204,13 @@ def _group_booking_app_list(request):
             'has_module_perms': True,
             'models': pick(['Bus', 'Stop']),
         },
+        {
+            'name': 'Background Jobs',
+            'app_label': 'background_jobs',
+            'app_url': '',
+            'has_module_perms': True,
+            'models': pick(['BackgroundJob']),
+        },
     ]
 
     # Filter out auth and booking apps from others since we're handling them separately
@@ -987,4 +1226,81 @@ def custom_get_app_list(request):
         return _original_get_app_list(request)
 
 
-admin.site.get_app_list = custom_get_app_list
\ No newline at end of file
+admin.site.get_app_list = custom_get_app_list
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task_name', 'status', 'progress', 'created_by', 'created_at', 'finished_at', 'worker')
+    list_filter = ('status', 'task', 'created_at')
+    search_fields = ('task', 'message', 'created_by__email')
+    ordering = ('-created_at',)
+    list_select_related = ('created_by',)
+    readonly_fields = [field.name for field in BackgroundJob._meta.fields]
+    actions = ['retry_failed_jobs']
+
+    def has_add_permission(self, request):
+        # Jobs are created by admin actions
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def task_name(self, obj):
+        return jobs.task_label(obj.task)
+    task_name.short_description = 'Task'
+    task_name.admin_order_field = 'task'
+
+    def progress(self, obj):
+        from django.urls import reverse
+        url = reverse('admin:booking_backgroundjob_progress', args=[obj.pk])
+        label = f"{obj.done}/{obj.total}" if obj.total else obj.get_status_display()
+        return mark_safe(f'<a href="{url}">{label} ({obj.percent}%)</a>')
+    progress.short_description = 'Progress'
+
+    def retry_failed_jobs(self, request, queryset):
+        """Put failed jobs back on the queue; finished items are skipped on the next run"""
+        count = queryset.filter(status='failed').update(status='queued', worker='', error='', finished_at=None, attempts=0)
+        self.message_user(request, f"🔄 {count} failed job(s) queued again")
+    retry_failed_jobs.short_description = "🔄 Retry failed jobs"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:job_id>/progress/', self.admin_site.admin_view(self.progress_view), name='booking_backgroundjob_progress'),
+            path('<int:job_id>/status/', self.admin_site.admin_view(self.status_view), name='booking_backgroundjob_status'),
+        ]
+        return custom_urls + urls
+
+    def _job_status(self, job):
+        return {
+            'id': job.pk,
+            'task': jobs.task_label(job.task),
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'done': job.done,
+            'total': job.total,
+            'percent': job.percent,
+            'message': job.message,
+            'result': job.result,
+            'finished': job.is_finished,
+        }
+
+    def progress_view(self, request, job_id):
+        """Progress page that polls status_view until the job finishes"""
+        from django.shortcuts import get_object_or_404
+        job = get_object_or_404(BackgroundJob, pk=job_id)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'{jobs.task_label(job.task)} (job #{job.pk})',
+            'job': job,
+            'job_status': self._job_status(job),
+            'poll_seconds': jobs.get_jobs_config()['POLL_SECONDS'],
+            'opts': self.model._meta,
+        }
+        return render(request, 'admin/booking/job_progress.html', context)
+
+    def status_view(self, request, job_id):
+        from django.http import JsonResponse
+        from django.shortcuts import get_object_or_404
+        job = get_object_or_404(BackgroundJob, pk=job_id)
+        return JsonResponse(self._job_status(job))
@@ -3,4 +3,22 @@ from django.apps import AppConfig
 
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'booking'
\ No newline at end of file
+    name = 'booking'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+        from .models import Booking, Stop
+        from .versions import (
+            RELATED_FIELDS, booking_changed, related_deleted, related_pre_delete, related_pre_save, related_saved,
+        )
+
+        # Keep cached booking-derived data (trip-date index, manifests) in step with writes
+        post_save.connect(booking_changed, sender=Booking, dispatch_uid='booking_versions_save')
+        post_delete.connect(booking_changed, sender=Booking, dispatch_uid='booking_versions_delete')
+        for name in RELATED_FIELDS:
+            model = self.get_model(name)
+            pre_save.connect(related_pre_save, sender=model, dispatch_uid=f'booking_versions_{name}_pre_save')
+            post_save.connect(related_saved, sender=model, dispatch_uid=f'booking_versions_{name}_save')
+        # Students and buses cascade to their bookings, whose own post_delete bumps the versions
+        pre_delete.connect(related_pre_delete, sender=Stop, dispatch_uid='booking_versions_stop_pre_delete')
+        post_delete.connect(related_deleted, sender=Stop, dispatch_uid='booking_versions_stop_delete')
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.crypto import constant_time_compare
+from rest_framework import authentication, exceptions
+
+from .models import Student
+from . import versions
+
+
+TOKEN_SALT = 'booking.authentication.token'
+TOKEN_KEYWORD = 'Bearer'
+
+
+def _user_cache_key(user_id):
+    return f'booking:auth-user:{user_id}'
+
+
+def issue_token(user):
+    """Return a signed, expiring bearer token for the given student.
+
+    The token carries the user id, the session auth hash and the user's token
+    generation, so changing the password or logging out (revoke_tokens)
+    invalidates every token issued before.
+    """
+    payload = {
+        'uid': user.pk,
+        'sah': user.get_session_auth_hash(),
+        'gen': user.token_generation,
+    }
+    return signing.dumps(payload, salt=TOKEN_SALT, compress=True)
+
+
+def revoke_tokens(user):
+    """Invalidate every token issued to the user so far (logout ends all API sessions)"""
+    Student.objects.filter(pk=user.pk).update(token_generation=F('token_generation') + 1)
+    forget_cached_user(user.pk)
+
+
+def forget_cached_user(user_id):
+    """Drop the cached user so the next token check reloads it from the DB"""
+    cache.delete(_user_cache_key(user_id))
+
+
+def get_cached_user(user_id):
+    """
+    Load a student by primary key, caching it briefly between API calls. Only with a shared
+    cache: a process-local copy would keep accepting revoked tokens in the other workers.
+    """
+    if not versions.cache_is_shared():
+        return Student.objects.filter(pk=user_id).first()
+    key = _user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        try:
+            user = Student.objects.get(pk=user_id)
+        except Student.DoesNotExist:
+            return None
+        cache.set(key, user, getattr(settings, 'AUTH_TOKEN_USER_CACHE_SECONDS', 60))
+    return user
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """Authenticate `Authorization: Bearer <token>` headers issued by login_view.
+
+    Verifying a token is an HMAC check plus at most one (cached) user lookup;
+    the password hasher only runs in login_view, behind its rate limiter.
+    """
+
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() != TOKEN_KEYWORD.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        return self.authenticate_credentials(token)
+
+    def authenticate_credentials(self, token):
+        max_age = getattr(settings, 'AUTH_TOKEN_MAX_AGE', 60 * 60 * 12)
+        try:
+            payload = signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        user = get_cached_user(payload.get('uid'))
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        if not constant_time_compare(payload.get('sah', ''), user.get_session_auth_hash()):
+            raise exceptions.AuthenticationFailed('Token is no longer valid.')
+        if payload.get('gen') != user.token_generation:
+            raise exceptions.AuthenticationFailed('Token has been revoked.')
+        return (user, token)
+
+    def authenticate_header(self, request):
+        return f'{TOKEN_KEYWORD} realm="api"'
@@ -0,0 +1,269 @@
+"""
+Database-backed background jobs for admin actions that are too slow for a request.
+
+An admin action calls enqueue() and redirects to the job's progress page;
+`manage.py run_jobs` workers pick jobs up and run the registered task.
+
+Several workers (on one or many nodes) can share the table: a job is claimed
+with a conditional UPDATE (status='queued' -> 'running'), so only one worker
+ever wins it. Running jobs send heartbeats; a job whose worker stops
+heartbeating is requeued (or failed after MAX_ATTEMPTS), and progress writes
+from the old worker are rejected because they are filtered on its worker id.
+
+Tasks that work through a file save a checkpoint in the same transaction as
+each committed chunk; a requeued, retried or re-run job resumes from it.
+A job can also be run inline by a management command (start_inline /
+claim_job + run_job), sharing the table and checkpoints with the workers.
+"""
+
+import inspect
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKGROUND_JOBS = {
+    'POLL_SECONDS': 2,
+    'STALE_SECONDS': 300,
+    'MAX_ATTEMPTS': 3,
+    'UPLOAD_PREFIX': 'job_uploads/',  # default_storage prefix for files uploaded for background imports
+}
+
+# Progress is written at most this often, plus at the end of the job
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+TASKS = {}
+
+
+def get_jobs_config():
+    config = dict(DEFAULT_BACKGROUND_JOBS)
+    config.update(getattr(settings, 'BACKGROUND_JOBS', {}))
+    return config
+
+
+def task(name, label=None):
+    """Register a function as a job task; it is called as func(ctx, **payload)"""
+    def decorator(func):
+        TASKS[name] = (func, label or name.replace('_', ' ').capitalize())
+        return func
+    return decorator
+
+
+def get_task(name):
+    # Importing the task module fills the registry
+    from . import tasks  # noqa: F401
+    return TASKS[name]
+
+
+def task_kwargs(func, payload, job_id=None):
+    """
+    The payload keys func accepts. Jobs queued by an older release may carry arguments a
+    task has since dropped; they are ignored rather than failing the job on a TypeError.
+    """
+    params = inspect.signature(func).parameters
+    if any(p.kind == inspect.Parameter.VAR_KEYWORD for p in params.values()):
+        return dict(payload)
+    unknown = sorted(set(payload) - set(params))
+    if unknown:
+        logger.info('Background job %s: ignoring payload key(s) %s', job_id, ', '.join(unknown))
+    return {key: value for key, value in payload.items() if key in params}
+
+
+def task_label(name):
+    try:
+        return get_task(name)[1]
+    except KeyError:
+        return name
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(task_name, created_by=None, total=0, file_hash='', **payload):
+    from .models import BackgroundJob
+    get_task(task_name)  # fail loudly on typos at enqueue time, not in the worker
+    return BackgroundJob.objects.create(
+        task=task_name,
+        payload=payload,
+        total=total,
+        file_hash=file_hash,
+        created_by=created_by if created_by and created_by.is_authenticated else None,
+    )
+
+
+def start_inline(task_name, worker_id, file_hash='', **payload):
+    """Create a job already held by worker_id, for a command that runs it itself with run_job()"""
+    from .models import BackgroundJob
+    get_task(task_name)
+    now = timezone.now()
+    return BackgroundJob.objects.create(
+        task=task_name, payload=payload, file_hash=file_hash, status='running',
+        worker=worker_id, started_at=now, heartbeat_at=now, attempts=1,
+    )
+
+
+def unfinished_job(task_name, file_hash, **payload):
+    """The latest queued, running or failed job for this file and payload, if any"""
+    from .models import BackgroundJob
+    candidates = BackgroundJob.objects.filter(
+        task=task_name, file_hash=file_hash, status__in=['queued', 'running', 'failed']
+    ).order_by('-created_at', '-pk')
+    for job in candidates:
+        if all(job.payload.get(key) == value for key, value in payload.items()):
+            return job
+    return None
+
+
+def claim_job(job, worker_id, force=False, config=None):
+    """
+    Take a specific job for worker_id: queued and failed jobs always, running ones only once
+    their heartbeat is stale (or with force). Returns the refreshed job, or None if it is held.
+    """
+    from .models import BackgroundJob
+    config = config or get_jobs_config()
+    claimable = Q(status__in=['queued', 'failed'])
+    if force:
+        claimable |= Q(status='running')
+    else:
+        cutoff = timezone.now() - timedelta(seconds=config['STALE_SECONDS'])
+        claimable |= Q(status='running', heartbeat_at__lt=cutoff)
+    now = timezone.now()
+    claimed = BackgroundJob.objects.filter(claimable, pk=job.pk).update(
+        status='running', worker=worker_id, started_at=now, heartbeat_at=now,
+        finished_at=None, error='', attempts=F('attempts') + 1,
+    )
+    return BackgroundJob.objects.get(pk=job.pk) if claimed else None
+
+
+class JobLost(Exception):
+    """The job was requeued or taken over by another worker while running"""
+
+
+class JobContext:
+    """Handle given to a task for reporting progress"""
+
+    def __init__(self, job, worker_id, log=None):
+        self.job = job
+        self.worker_id = worker_id
+        self._last_write = 0.0
+        self._log = log
+
+    def log(self, event):
+        """Pass a task-specific event (e.g. a per-row import outcome) to whoever runs the job inline"""
+        if self._log is not None:
+            self._log(event)
+
+    def save_checkpoint(self, checkpoint, done=None, message=None):
+        """
+        Record the resume point. Call it inside the transaction that commits the work it
+        covers, so the two land together; raises JobLost (rolling that work back) if the job
+        has been taken over.
+        """
+        self.job.checkpoint = checkpoint
+        if done is not None:
+            self.job.done = done
+        if message is not None:
+            self.job.message = message[:255]
+        self._write(checkpoint=checkpoint, done=self.job.done, total=self.job.total, message=self.job.message)
+
+    def _write(self, **fields):
+        from .models import BackgroundJob
+        fields['heartbeat_at'] = timezone.now()
+        updated = BackgroundJob.objects.filter(
+            pk=self.job.pk, status='running', worker=self.worker_id
+        ).update(**fields)
+        if not updated:
+            raise JobLost(f'Job {self.job.pk} is no longer held by {self.worker_id}')
+        self._last_write = time.monotonic()
+
+    def progress(self, done=None, total=None, message=None, force=False):
+        if done is not None:
+            self.job.done = done
+        if total is not None:
+            self.job.total = total
+        if message is not None:
+            self.job.message = message[:255]
+        if force or time.monotonic() - self._last_write >= PROGRESS_INTERVAL_SECONDS:
+            self._write(done=self.job.done, total=self.job.total, message=self.job.message)
+
+    def iterate(self, items, chunk_size=None, save_each=False):
+        """
+        Yield items (or lists of chunk_size items), skipping those finished by an earlier attempt.
+        Progress is normally saved at most once per PROGRESS_INTERVAL_SECONDS; pass save_each for
+        work with side effects (emails), so a requeued job resumes right after the last item sent.
+        """
+        items = list(items)
+        if self.job.total != len(items):
+            self.progress(total=len(items), force=True)
+        step = chunk_size or 1
+        for index in range(self.job.done, len(items), step):
+            yield items[index:index + step] if chunk_size else items[index]
+            self.progress(done=min(index + step, len(items)), force=save_each)
+        self.progress(force=True)
+
+
+def requeue_stale_jobs(config=None):
+    """Requeue running jobs whose worker stopped heartbeating; fail those out of attempts"""
+    from .models import BackgroundJob
+    config = config or get_jobs_config()
+    cutoff = timezone.now() - timedelta(seconds=config['STALE_SECONDS'])
+    stale = BackgroundJob.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=config['MAX_ATTEMPTS']).update(
+        status='failed', worker='', finished_at=timezone.now(),
+        error='Worker stopped responding too many times',
+    )
+    requeued = stale.filter(attempts__lt=config['MAX_ATTEMPTS']).update(status='queued', worker='')
+    if failed or requeued:
+        logger.warning('Background jobs: %s stale job(s) requeued, %s failed', requeued, failed)
+    return requeued, failed
+
+
+def claim_next_job(worker_id):
+    """Atomically take the oldest queued job for this worker, or return None"""
+    from .models import BackgroundJob
+    candidates = BackgroundJob.objects.filter(status='queued').order_by('created_at', 'pk').values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        now = timezone.now()
+        claimed = BackgroundJob.objects.filter(pk=pk, status='queued').update(
+            status='running', worker=worker_id, started_at=now, heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return BackgroundJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job, worker_id, log=None):
+    """Execute a claimed job and record the outcome"""
+    from .models import BackgroundJob
+    ctx = JobContext(job, worker_id, log=log)
+    try:
+        func, _ = get_task(job.task)
+        result = func(ctx, **task_kwargs(func, job.payload, job.pk)) or {}
+    except JobLost:
+        logger.warning('Background job %s was taken over while running on %s', job.pk, worker_id)
+        return None
+    except Exception as e:
+        logger.exception('Background job %s (%s) failed', job.pk, job.task)
+        BackgroundJob.objects.filter(pk=job.pk, worker=worker_id, status='running').update(
+            status='failed', error=''.join(traceback.format_exception(e))[-5000:],
+            message=str(e)[:255], finished_at=timezone.now(), done=ctx.job.done,
+        )
+        return 'failed'
+    BackgroundJob.objects.filter(pk=job.pk, worker=worker_id, status='running').update(
+        status='succeeded', result=result, done=ctx.job.done, total=ctx.job.total,
+        message=ctx.job.message, finished_at=timezone.now(),
+    )
+    return 'succeeded'
@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from booking import history
+from booking.models import Booking
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings for a trip date range to a gzip-compressed CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='First trip date (YYYY-MM-DD)')
+        parser.add_argument('end', help='Last trip date (YYYY-MM-DD)')
+        parser.add_argument(
+            '--format',
+            dest='file_format',
+            choices=history.FORMATS,
+            default='csv',
+            help='Row encoding inside the .gz file (default: csv)',
+        )
+        parser.add_argument(
+            '--output',
+            '-o',
+            help='File to write (default: bookings_<start>_<end>.<format>.gz; "-" for stdout)',
+        )
+        parser.add_argument(
+            '--status',
+            action='append',
+            dest='statuses',
+            choices=[choice for choice, _ in Booking.STATUS_CHOICES],
+            help='Only bookings with this status (repeatable)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=history.CHUNK_SIZE,
+            help='Rows fetched per cursor round trip',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start_date, end_date = history.parse_range(options['start'], options['end'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive')
+
+        file_format = options['file_format']
+        output = options['output'] or history.history_filename(start_date, end_date, file_format)
+        chunks = history.iter_history(
+            start_date, end_date, file_format,
+            statuses=options['statuses'], chunk_size=options['chunk_size']
+        )
+
+        started = time.monotonic()
+        written = 0
+        if output == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        # Written next to the output and renamed into place, so a failed export leaves no truncated .gz
+        fd, tmp_name = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(output)), prefix=f'.{os.path.basename(output)}.', suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_name, output)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Exported bookings {start_date} to {end_date} to {output} '
+            f'({written / (1024 * 1024):.1f} MB compressed, {time.monotonic() - started:.1f}s)'
+        ))
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from booking.manifests import FORMATS, pregenerate, prune_artifacts
+
+
+class Command(BaseCommand):
+    help = (
+        'Pre-generate per-bus pickup / drop-off manifests and driver sheets for a trip date '
+        '(default: tomorrow). Re-running it only rebuilds buses whose bookings changed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Trip date as YYYY-MM-DD (default: tomorrow)',
+        )
+        parser.add_argument(
+            '--bus',
+            type=int,
+            action='append',
+            dest='bus_ids',
+            help='Only this bus id (repeatable; default: open buses and buses with bookings)',
+        )
+        parser.add_argument(
+            '--formats',
+            default='csv',
+            help=f'Comma-separated manifest formats to build: {", ".join(FORMATS)} (default: csv)',
+        )
+        parser.add_argument(
+            '--no-driver-sheets',
+            action='store_true',
+            help='Skip the printable driver sheets',
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=7,
+            help='Delete generated files for trip dates older than this many days (negative = keep all)',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            try:
+                trip_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Invalid --date. Use YYYY-MM-DD')
+        else:
+            trip_date = today + timedelta(days=1)
+
+        formats = tuple(f.strip() for f in options['formats'].split(',') if f.strip())
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            raise CommandError(f'Unknown format(s): {", ".join(sorted(unknown))}')
+
+        self.stdout.write(f'Generating manifests for {trip_date}...')
+        results = pregenerate(
+            trip_date,
+            bus_ids=options['bus_ids'],
+            formats=formats,
+            driver_sheets=not options['no_driver_sheets'],
+        )
+        generated = 0
+        for label, created in results:
+            if created:
+                generated += 1
+                self.stdout.write(self.style.SUCCESS(f'✓ {label}'))
+
+        pruned = 0
+        if options['keep_days'] >= 0:
+            pruned = prune_artifacts(today - timedelta(days=options['keep_days']))
+
+        # Summary
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write('MANIFEST SUMMARY')
+        self.stdout.write('='*50)
+        self.stdout.write(f'Trip date: {trip_date}')
+        self.stdout.write(self.style.SUCCESS(f'Generated: {generated}'))
+        self.stdout.write(f'Already up to date: {len(results) - generated}')
+        if pruned:
+            self.stdout.write(f'Old trip dates removed: {pruned}')
@@ -1,9 +1,10 @@
 from django.core.management.base import BaseCommand, CommandError
-from django.contrib.auth.hashers import make_password
-from booking.models import Student
+from booking import jobs
+from booking.student_import import CHUNK_SIZE, ImportStats, StudentImporter, file_sha256, import_rows
+from booking.student_validation import REQUIRED_COLUMNS
 import csv
 import os
-from pathlib import Path
+import time
 
 
 class Command(BaseCommand):
@@ -21,11 +22,28 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be imported without actually importing',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows written per transaction (default: {CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Start from the first row even if an earlier run of this file stopped part-way',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Take over a run of this file that still looks alive (its heartbeat is not yet stale)',
+        )
 
     def handle(self, *args, **options):
         csv_file = options['csv_file']
         update_existing = options['update']
         dry_run = options['dry_run']
+        chunk_size = options['chunk_size']
 
         # Check if file exists
         if not os.path.exists(csv_file):
@@ -35,150 +53,114 @@ class Command(BaseCommand):
         if not csv_file.lower().endswith('.csv'):
             raise CommandError('File must be a CSV file')
 
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size must be positive')
+
+        started = time.monotonic()
+        if dry_run:
+            stats = self.dry_run_import(csv_file, update_existing, chunk_size)
+        else:
+            stats = self.checkpointed_import(csv_file, update_existing, chunk_size, options)
+
+        # Summary
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write('IMPORT SUMMARY')
+        self.stdout.write('='*50)
+
+        if dry_run:
+            self.stdout.write(f'DRY RUN - No changes made')
+
+        self.stdout.write(f'Successfully processed: {stats.created}')
+        if update_existing:
+            self.stdout.write(f'Updated existing students: {stats.updated}')
+        self.stdout.write(f'Errors: {stats.errors}')
+        self.stdout.write(f'Total rows processed: {stats.total}')
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'Time: {elapsed:.1f}s ({stats.total / elapsed if elapsed else 0:.0f} rows/s)')
+
+        if stats.errors > 0:
+            self.stdout.write(
+                self.style.WARNING('\nSome rows had errors. Check the output above for details.')
+            )
+
+    def dry_run_import(self, csv_file, update_existing, chunk_size):
         try:
-            with open(csv_file, 'r', encoding='utf-8') as file:
+            with open(csv_file, 'r', encoding='utf-8', newline='') as file:
                 reader = csv.DictReader(file)
-                
-                # Validate required columns
-                required_columns = ['first_name', 'last_name', 'email', 'roll_no', 'dept', 'year', 'gender']
-                missing_columns = [col for col in required_columns if col not in reader.fieldnames]
-                
-                if missing_columns:
-                    raise CommandError(f'Missing required columns: {", ".join(missing_columns)}')
-
-                success_count = 0
-                error_count = 0
-                update_count = 0
-
-                for row_num, row in enumerate(reader, start=2):  # Start at 2 because row 1 is header
-                    try:
-                        # Clean and validate data
-                        email = row['email'].strip().lower()
-                        first_name = row['first_name'].strip()
-                        last_name = row['last_name'].strip()
-                        roll_no = row['roll_no'].strip()
-                        dept = row['dept'].strip()
-                        year = row['year'].strip()
-                        gender = row['gender'].strip().upper()
-                        phone_number = row.get('phone_number', '').strip()
-
-                        # Validate required fields
-                        if not all([email, first_name, last_name, roll_no, dept, year, gender]):
-                            self.stdout.write(
-                                self.style.ERROR(f'Row {row_num}: Missing required fields')
-                            )
-                            error_count += 1
-                            continue
-
-                        # Validate email format
-                        if '@' not in email:
-                            self.stdout.write(
-                                self.style.ERROR(f'Row {row_num}: Invalid email format: {email}')
-                            )
-                            error_count += 1
-                            continue
-
-                        # Validate year
-                        if year not in ['1', '2', '3', '4']:
-                            self.stdout.write(
-                                self.style.ERROR(f'Row {row_num}: Invalid year: {year}. Must be 1, 2, 3, or 4')
-                            )
-                            error_count += 1
-                            continue
-
-                        # Validate gender
-                        if gender not in ['M', 'F', 'O']:
-                            self.stdout.write(
-                                self.style.ERROR(f'Row {row_num}: Invalid gender: {gender}. Must be M, F, or O')
-                            )
-                            error_count += 1
-                            continue
-
-                        # Check if student already exists
-                        existing_student = None
-                        try:
-                            existing_student = Student.objects.get(email=email)
-                        except Student.DoesNotExist:
-                            pass
-
-                        if existing_student:
-                            if update_existing:
-                                # Update existing student
-                                if not dry_run:
-                                    existing_student.first_name = first_name
-                                    existing_student.last_name = last_name
-                                    existing_student.roll_no = roll_no
-                                    existing_student.dept = dept
-                                    existing_student.year = year
-                                    existing_student.gender = gender
-                                    if phone_number:
-                                        existing_student.phone_number = phone_number
-                                    existing_student.save()
-                                
-                                self.stdout.write(
-                                    self.style.SUCCESS(f'Row {row_num}: Updated student {email}')
-                                )
-                                update_count += 1
-                            else:
-                                self.stdout.write(
-                                    self.style.WARNING(f'Row {row_num}: Student {email} already exists (use --update to update)')
-                                )
-                                error_count += 1
-                        else:
-                            # Create new student
-                            if not dry_run:
-                                Student.objects.create(
-                                    email=email,
-                                    first_name=first_name,
-                                    last_name=last_name,
-                                    roll_no=roll_no,
-                                    dept=dept,
-                                    year=year,
-                                    gender=gender,
-                                    phone_number=phone_number,
-                                    password=make_password('Changeme@123')
-                                )
-                            
-                            self.stdout.write(
-                                self.style.SUCCESS(f'Row {row_num}: Created student {email}')
-                            )
-                            success_count += 1
-
-                    except Exception as e:
-                        self.stdout.write(
-                            self.style.ERROR(f'Row {row_num}: Error processing row: {str(e)}')
-                        )
-                        error_count += 1
-
-                # Summary
-                self.stdout.write('\n' + '='*50)
-                self.stdout.write('IMPORT SUMMARY')
-                self.stdout.write('='*50)
-                
-                if dry_run:
-                    self.stdout.write(f'DRY RUN - No changes made')
-                
-                self.stdout.write(f'Successfully processed: {success_count}')
-                if update_existing:
-                    self.stdout.write(f'Updated existing students: {update_count}')
-                self.stdout.write(f'Errors: {error_count}')
-                self.stdout.write(f'Total rows processed: {success_count + update_count + error_count}')
-
-                if error_count > 0:
-                    self.stdout.write(
-                        self.style.WARNING('\nSome rows had errors. Check the output above for details.')
-                    )
-
+                self.check_columns(reader.fieldnames)
+                importer = StudentImporter(update_existing=update_existing, dry_run=True)
+                stats = ImportStats()
+                for outcome in import_rows(reader, importer, chunk_size):
+                    self.report(outcome)
+                    stats.add(outcome)
+                return stats
+        except CommandError:
+            raise
         except UnicodeDecodeError:
             raise CommandError('File encoding error. Please save the CSV file as UTF-8.')
         except Exception as e:
             raise CommandError(f'Error reading CSV file: {str(e)}')
 
-    def create_parser(self, prog_name, subcommand, **kwargs):
-        parser = super().create_parser(prog_name, subcommand, **kwargs)
-        parser.add_argument(
-            '--help',
-            action='help',
-            help='Show this help message and exit.',
+    def checkpointed_import(self, csv_file, update_existing, chunk_size, options):
+        """
+        Run the import as a background job row held by this process, checkpointed after every
+        chunk; an interrupted run of the same file (same SHA-256) resumes where it stopped.
+        """
+        from booking.models import BackgroundJob
+        path = os.path.abspath(csv_file)
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                self.check_columns(next(csv.reader(file), None))
+        except UnicodeDecodeError:
+            raise CommandError('File encoding error. Please save the CSV file as UTF-8.')
+        file_hash = file_sha256(path)
+        worker_id = jobs.default_worker_id()
+
+        job = None if options['restart'] else jobs.unfinished_job(
+            'import_students', file_hash, update_existing=update_existing
         )
-        return parser
+        if job is not None:
+            claimed = jobs.claim_job(job, worker_id, force=options['force'])
+            if claimed is None:
+                raise CommandError(
+                    f'Job #{job.pk} is already importing this file on {job.worker}. '
+                    f'Wait for it, or pass --force if that process is gone.'
+                )
+            job = claimed
+            if job.checkpoint:
+                self.stdout.write(self.style.WARNING(
+                    f"Resuming job #{job.pk} at row {job.checkpoint['next_row']} "
+                    f"({job.checkpoint['stats']['created']} created, {job.checkpoint['stats']['updated']} updated so far)"
+                ))
+        else:
+            job = jobs.start_inline(
+                'import_students', worker_id, file_hash=file_hash, path=path,
+                update_existing=update_existing, chunk_size=chunk_size,
+            )
+        self.stdout.write(f'Import job #{job.pk} (checkpointed every {job.payload["chunk_size"]} rows)')
+
+        outcome = jobs.run_job(job, worker_id, log=self.report)
+        job = BackgroundJob.objects.get(pk=job.pk)
+        if outcome == 'failed':
+            raise CommandError(
+                f'Import stopped: {job.message}. Run the same command again to resume from row '
+                f'{job.checkpoint.get("next_row", 2)}.'
+            )
+        if outcome is None:
+            raise CommandError(f'Job #{job.pk} was taken over by {job.worker}')
+        return ImportStats(created=job.result['created'], updated=job.result['updated'], errors=job.result['errors'])
+
+    def check_columns(self, fieldnames):
+        # Validate required columns
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in (fieldnames or [])]
+        if missing_columns:
+            raise CommandError(f'Missing required columns: {", ".join(missing_columns)}')
+
+    def report(self, outcome):
+        message = f'Row {outcome.row_num}: {outcome.message}'
+        if outcome.status in ('created', 'updated'):
+            self.stdout.write(self.style.SUCCESS(message))
+        elif outcome.status == 'exists':
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.ERROR(message))
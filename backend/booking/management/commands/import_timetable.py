@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from booking.timetable import import_timetable
+import os
+
+
+class Command(BaseCommand):
+    help = (
+        'Import buses and their ordered stops from one CSV file (one row per bus, stops separated '
+        'by ";"). Buses are upserted by bus_no; stops no longer listed are deactivated.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', type=str, help='Path to the timetable CSV file')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show the changes the file would make without writing them',
+        )
+
+    def handle(self, *args, **options):
+        csv_file = options['csv_file']
+        dry_run = options['dry_run']
+
+        if not os.path.exists(csv_file):
+            raise CommandError(f'CSV file not found: {csv_file}')
+
+        try:
+            with open(csv_file, 'r', encoding='utf-8', newline='') as file:
+                result = import_timetable(file, dry_run=dry_run)
+        except UnicodeDecodeError:
+            raise CommandError('File encoding error. Please save the CSV file as UTF-8.')
+
+        if result.errors:
+            for error in result.errors:
+                self.stdout.write(self.style.ERROR(error))
+            raise CommandError(f'{len(result.errors)} row(s) have errors; nothing was imported')
+
+        diff = result.diff
+        for line in diff.lines():
+            style = {'+': self.style.SUCCESS, '-': self.style.ERROR}.get(line[0], self.style.WARNING)
+            self.stdout.write(style(line))
+
+        # Summary
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write('TIMETABLE SUMMARY')
+        self.stdout.write('='*50)
+
+        if dry_run:
+            self.stdout.write('DRY RUN - No changes made')
+
+        summary = diff.summary()
+        self.stdout.write(f"Buses created: {summary['buses_created']}")
+        self.stdout.write(f"Buses updated: {summary['buses_updated']}")
+        self.stdout.write(f"Buses unchanged: {summary['buses_unchanged']}")
+        self.stdout.write(f"Stops created: {summary['stops_created']}")
+        self.stdout.write(f"Stops moved or reactivated: {summary['stops_updated']}")
+        self.stdout.write(f"Stops deactivated: {summary['stops_deactivated']}")
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from booking.retention import get_retention_config, retention_policies, purge_queryset
+
+
+class Command(BaseCommand):
+    help = 'Delete expired OTPs, abandoned pending bookings, stale rate-limit counters and old data versions in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rows that would be deleted',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Rows deleted per transaction (default: DATA_RETENTION["BATCH_SIZE"])',
+        )
+        parser.add_argument(
+            '--otp-days',
+            type=int,
+            help='Keep OTPs for this many days after they expire',
+        )
+        parser.add_argument(
+            '--pending-hours',
+            type=int,
+            help='Delete pending bookings older than this many hours',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to sleep between batches to ease load on a live database',
+        )
+
+    def handle(self, *args, **options):
+        config = get_retention_config()
+        if options['batch_size']:
+            config['BATCH_SIZE'] = options['batch_size']
+        if options['otp_days'] is not None:
+            config['OTP_DAYS'] = options['otp_days']
+        if options['pending_hours'] is not None:
+            config['PENDING_BOOKING_HOURS'] = options['pending_hours']
+        if config['BATCH_SIZE'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        dry_run = options['dry_run']
+        results = []
+        for name, queryset in retention_policies(config=config):
+            result = purge_queryset(name, queryset, config['BATCH_SIZE'], dry_run=dry_run, pause=options['pause'])
+            results.append(result)
+            if dry_run:
+                self.stdout.write(f'{name}: {result.matched} row(s) would be deleted')
+            else:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'{name}: deleted {result.deleted} row(s) in {result.batches} batch(es) ({result.seconds:.1f}s)'
+                    )
+                )
+
+        # Summary
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write('PURGE SUMMARY')
+        self.stdout.write('='*50)
+
+        if dry_run:
+            self.stdout.write('DRY RUN - No changes made')
+
+        self.stdout.write(f'OTP retention: {config["OTP_DAYS"]} day(s) after expiry')
+        self.stdout.write(f'Pending booking retention: {config["PENDING_BOOKING_HOURS"]} hour(s)')
+        self.stdout.write(f'Data version retention: {config["VERSION_DAYS"]} day(s) after the trip date')
+        self.stdout.write(f'Batch size: {config["BATCH_SIZE"]}')
+        if dry_run:
+            self.stdout.write(f'Total rows to delete: {sum(r.matched for r in results)}')
+        else:
+            self.stdout.write(f'Total rows deleted: {sum(r.deleted for r in results)}')
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from booking.jobs import get_jobs_config, default_worker_id, requeue_stale_jobs, claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (admin actions); safe to run on several nodes at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run until the queue is empty, then exit (for cron)',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            default=0,
+            help='Exit after this many jobs (0 = no limit)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            help='Seconds to wait between polls when idle (default: BACKGROUND_JOBS["POLL_SECONDS"])',
+        )
+        parser.add_argument(
+            '--worker-id',
+            help='Name recorded on claimed jobs (default: hostname:pid)',
+        )
+
+    def handle(self, *args, **options):
+        config = get_jobs_config()
+        sleep = options['sleep'] if options['sleep'] is not None else config['POLL_SECONDS']
+        worker_id = options['worker_id'] or default_worker_id()
+        processed = 0
+
+        self.stdout.write(f'Worker {worker_id} started')
+        try:
+            while True:
+                close_old_connections()
+                requeue_stale_jobs(config)
+                job = claim_next_job(worker_id)
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(sleep)
+                    continue
+
+                self.stdout.write(f'Running job #{job.pk} ({job.task})...')
+                outcome = run_job(job, worker_id)
+                if outcome == 'succeeded':
+                    self.stdout.write(self.style.SUCCESS(f'✓ Job #{job.pk} finished'))
+                elif outcome == 'failed':
+                    self.stdout.write(self.style.ERROR(f'✗ Job #{job.pk} failed'))
+                else:
+                    self.stdout.write(self.style.WARNING(f'Job #{job.pk} was taken over by another worker'))
+
+                processed += 1
+                if options['max_jobs'] and processed >= options['max_jobs']:
+                    break
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrupted'))
+
+        self.stdout.write(f'Worker {worker_id} processed {processed} job(s)')
@@ -0,0 +1,478 @@
+"""
+Pickup / drop-off manifests (the per-date lists drivers work from).
+
+Every manifest path -- the admin API lists and exports, the admin pickup /
+drop-off pages and their CSV downloads -- goes through Manifest: one filtered
+queryset, one flat .values_list() projection read with a chunked iterator,
+and one row mapping. The writers (CSV, JSONL, XLSX) only differ in how they
+encode those rows, so the query never has to be tuned in more than one place.
+
+Downloads are cached on disk as artifacts named after the booking data
+version of the date (or bus) they cover (see booking/versions.py): a repeat
+download is a file read -- or a sendfile header for the web server -- and a
+file is only regenerated after a booking on that date changes (or a student,
+bus or stop printed on it is edited). A CSV / JSONL
+miss is streamed to the client while the file is written. The
+generate_manifests command pre-builds the next day's per-bus files and
+printable driver sheets; buses whose version has not moved are skipped, so
+re-running it after late changes only rebuilds the affected buses.
+"""
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+from .models import Booking, Bus
+from . import versions
+
+
+# Rows fetched from the database per round trip, and rows written per streamed chunk
+CHUNK_SIZE = 2000
+
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+FORMATS = ('csv', 'jsonl', 'xlsx')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+DEFAULT_MANIFEST_CACHE = {
+    'ROOT': None,  # defaults to BASE_DIR / 'manifest_cache'
+    # '' serves files from Django; 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache / lighttpd)
+    # hands them to the web server instead
+    'SENDFILE_HEADER': '',
+    'SENDFILE_URL_PREFIX': '/protected/manifests/',  # internal nginx location mapped to ROOT
+}
+
+# The single projection every manifest row is built from
+MANIFEST_FIELDS = (
+    'id', 'student__first_name', 'student__last_name', 'student__roll_no', 'student__dept',
+    'student__phone_number', 'from_location', 'to_location', 'departure_time',
+    'bus_id', 'bus__bus_no', 'bus__route_name', 'selected_stop__stop_name',
+    'status', 'booking_date',
+)
+
+
+def get_manifest_cache_config():
+    config = dict(DEFAULT_MANIFEST_CACHE)
+    config.update(getattr(settings, 'MANIFEST_CACHE', {}))
+    if not config['ROOT']:
+        config['ROOT'] = Path(settings.BASE_DIR) / 'manifest_cache'
+    config['ROOT'] = Path(config['ROOT'])
+    return config
+
+
+def _columns(outbound):
+    """(record key, header) pairs for the tabular formats, in file order"""
+    return [
+        ('student_name', 'Student Name'),
+        ('student_roll_no', 'Roll No'),
+        ('student_dept', 'Department'),
+        ('student_phone', 'Phone'),
+        ('pickup_location', 'Pickup Location'),
+        ('destination', 'Destination') if outbound else ('dropoff_location', 'Drop-off Location'),
+        ('departure_time', 'Departure Time'),
+        ('bus_number', 'Bus Number'),
+        ('route_name', 'Route Name'),
+        ('status', 'Status'),
+        ('booking_date', 'Booking Date'),
+    ]
+
+
+def parse_filters(params):
+    """
+    Read the optional bus / stop / status filters from a GET querydict.
+    Raises ValueError with a user-facing message on malformed values.
+    """
+    filters = {}
+    bus = params.get('bus', '')
+    if bus:
+        if not bus.isdigit():
+            raise ValueError('Invalid bus parameter')
+        filters['bus_id'] = int(bus)
+    stop = params.get('stop', '')
+    if stop:
+        if stop != 'none' and not stop.isdigit():
+            raise ValueError("Invalid stop parameter. Use a stop id or 'none'")
+        filters['stop'] = stop if stop == 'none' else int(stop)
+    status = params.get('status', '')
+    if status:
+        statuses = tuple(s.strip() for s in status.split(',') if s.strip())
+        valid = {choice for choice, _ in Booking.STATUS_CHOICES}
+        if not statuses or not set(statuses) <= valid:
+            raise ValueError(f"Invalid status parameter. Use any of: {', '.join(sorted(valid))}")
+        filters['statuses'] = statuses
+    return filters
+
+
+class Manifest:
+    """Bookings for one date and direction, optionally narrowed to a bus, a stop and statuses"""
+
+    def __init__(self, trip_date, outbound=True, bus_id=None, stop=None, statuses=ACTIVE_STATUSES):
+        self.trip_date = trip_date
+        self.outbound = outbound
+        self.bus_id = bus_id
+        # None: any stop, 'none': bookings without a stop, otherwise a stop id
+        self.stop = stop
+        self.statuses = tuple(statuses)
+
+    @property
+    def kind(self):
+        return 'pickup' if self.outbound else 'dropoff'
+
+    @property
+    def columns(self):
+        return _columns(self.outbound)
+
+    def queryset(self):
+        """The filtered bookings, in manifest order (also used for grouped aggregates)"""
+        queryset = Booking.objects.filter(
+            trip_date=self.trip_date,
+            is_outbound_trip=self.outbound,
+            status__in=self.statuses
+        )
+        if self.bus_id is not None:
+            queryset = queryset.filter(bus_id=self.bus_id)
+        if self.stop == 'none':
+            queryset = queryset.filter(selected_stop__isnull=True)
+        elif self.stop is not None:
+            queryset = queryset.filter(selected_stop_id=self.stop)
+        return queryset.order_by('departure_time', 'pk')
+
+    def projection(self):
+        return self.queryset().values_list(*MANIFEST_FIELDS)
+
+    def record(self, row):
+        """Map one projection row to the dict shape the API has always returned"""
+        (pk, first_name, last_name, roll_no, dept, phone, from_location, to_location,
+         departure_time, bus_id, bus_no, route_name, stop_name, booking_status, booking_date) = row
+        return {
+            'id': pk,
+            'student_name': f"{first_name} {last_name}",
+            'student_roll_no': roll_no,
+            'student_dept': dept,
+            'student_phone': phone,
+            'pickup_location': from_location,
+            'destination' if self.outbound else 'dropoff_location': to_location,
+            'departure_time': departure_time.strftime('%H:%M'),
+            'bus_id': bus_id,
+            'bus_number': bus_no,
+            'route_name': route_name,
+            'stop_name': stop_name,
+            'status': booking_status,
+            'booking_date': booking_date.strftime('%Y-%m-%d %H:%M'),
+        }
+
+    def records(self, rows=None, chunk_size=CHUNK_SIZE):
+        """
+        Yield row dicts without instantiating Booking / Student / Bus objects.
+        Pass rows (e.g. one page of projection()) to map a slice instead of the whole manifest.
+        """
+        if rows is None:
+            rows = self.projection().iterator(chunk_size=chunk_size)
+        for row in rows:
+            yield self.record(row)
+
+    def rows(self):
+        """Records as lists in column order, for the tabular formats"""
+        keys = [key for key, _ in self.columns]
+        for record in self.records():
+            yield [record[key] for key in keys]
+
+    def iter_csv(self, chunk_size=CHUNK_SIZE):
+        """Encode the manifest as CSV text, yielding one string per chunk_size rows"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([header for _, header in self.columns])
+        # Send the header straight away so the download starts before the first query returns
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        pending = 0
+        for row in self.rows():
+            writer.writerow(row)
+            pending += 1
+            if pending >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue()
+
+    def iter_jsonl(self, chunk_size=CHUNK_SIZE):
+        """One JSON object per line, yielded in chunk_size-line strings"""
+        lines = []
+        for record in self.records():
+            lines.append(json.dumps(record))
+            if len(lines) >= chunk_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    def write_xlsx(self, fileobj):
+        """
+        Write the manifest as a single-sheet workbook. XLSX is a zip archive and cannot
+        be streamed, but openpyxl's write-only mode keeps memory flat while it is built.
+        """
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title=f'{self.kind.title()} {self.trip_date}')
+        sheet.append([header for _, header in self.columns])
+        for row in self.rows():
+            sheet.append(row)
+        workbook.save(fileobj)
+
+    def version(self):
+        """The booking data version this manifest is built from: per bus when filtered to one"""
+        if self.bus_id is not None:
+            return versions.get_version('bus', self.trip_date, self.bus_id)
+        return versions.get_version('date', self.trip_date)
+
+    def artifact_stem(self):
+        """Artifact name without version / extension; unique per filter combination"""
+        parts = [self.kind]
+        if self.bus_id is not None:
+            parts.append(f'bus{self.bus_id}')
+        if self.stop is not None:
+            parts.append(f'stop{self.stop}')
+        if set(self.statuses) != set(ACTIVE_STATUSES):
+            parts.append('+'.join(sorted(self.statuses)))
+        return '-'.join(parts)
+
+    def write(self, fileobj, file_format):
+        """Write the whole manifest in file_format to a binary file object"""
+        if file_format == 'xlsx':
+            self.write_xlsx(fileobj)
+            return
+        chunks = self.iter_csv() if file_format == 'csv' else self.iter_jsonl()
+        for chunk in chunks:
+            fileobj.write(chunk.encode('utf-8'))
+
+    def artifact(self, file_format='csv'):
+        """
+        (path, created) of the cached file for the current data version, generating it first
+        if needed. Older versions of the same artifact are removed once the new one is in place.
+        """
+        return store_artifact(
+            self.trip_date, self.artifact_stem(), self.version(), file_format,
+            lambda fileobj: self.write(fileobj, file_format)
+        )
+
+    def cached_response(self, file_format='csv', filename=None):
+        """
+        Like response(), but served from the on-disk artifact for the current data version.
+        On a miss, CSV and JSONL are streamed to the client while the artifact is written
+        alongside, so the first download starts as quickly as an uncached one.
+        """
+        if file_format not in FORMATS:
+            raise ValueError(f"Invalid format. Use any of: {', '.join(FORMATS)}")
+        filename = filename or self.filename(file_format)
+        if file_format == 'xlsx':
+            path, _ = self.artifact(file_format)
+            return artifact_response(path, filename, CONTENT_TYPES[file_format])
+        path = artifact_path(self.trip_date, self.artifact_stem(), self.version(), file_format)
+        if path.exists():
+            return artifact_response(path, filename, CONTENT_TYPES[file_format])
+        chunks = self.iter_csv() if file_format == 'csv' else self.iter_jsonl()
+        return _streaming_response(tee_artifact(path, chunks), file_format, filename)
+
+    def filename(self, file_format='csv'):
+        return f'{self.kind}_list_{self.trip_date}.{file_format}'
+
+    def stop_ordered_projection(self):
+        """Rows in the order a driver meets them: by stop (route sequence), then by student name"""
+        from django.db.models import F
+        return self.projection().order_by(
+            F('selected_stop__sequence').asc(nulls_last=True),
+            F('selected_stop__stop_name').asc(nulls_last=True),
+            'student__first_name', 'student__last_name', 'pk'
+        )
+
+    def write_driver_sheet(self, fileobj):
+        """Render the printable per-bus sheet (HTML with print styles) to a binary file object"""
+        from django.template.loader import render_to_string
+        from django.utils import timezone
+        if self.bus_id is None:
+            raise ValueError('Driver sheets are generated per bus')
+        bus = Bus.objects.get(pk=self.bus_id)
+        stops = []
+        for record in self.records(self.stop_ordered_projection().iterator(chunk_size=CHUNK_SIZE)):
+            name = record['stop_name'] or 'No stop selected'
+            if not stops or stops[-1]['name'] != name:
+                stops.append({'name': name, 'bookings': []})
+            stops[-1]['bookings'].append(record)
+        html = render_to_string('admin/booking/driver_sheet.html', {
+            'bus': bus,
+            'trip_date': self.trip_date,
+            'outbound': self.outbound,
+            'stops': stops,
+            'total': sum(len(stop['bookings']) for stop in stops),
+            'generated_at': timezone.localtime(),
+        })
+        fileobj.write(html.encode('utf-8'))
+
+    def driver_sheet_artifact(self):
+        """(path, created) of the bus's driver sheet for the current data version"""
+        return store_artifact(
+            self.trip_date, f'driver-sheet-{self.artifact_stem()}', self.version(), 'html',
+            self.write_driver_sheet
+        )
+
+    def response(self, file_format='csv', filename=None):
+        """A download of the manifest in file_format (one of FORMATS)"""
+        if file_format not in FORMATS:
+            raise ValueError(f"Invalid format. Use any of: {', '.join(FORMATS)}")
+        filename = filename or self.filename(file_format)
+        if file_format == 'xlsx':
+            # Built in a temporary file so large workbooks never sit in memory; FileResponse closes it
+            fileobj = tempfile.TemporaryFile()
+            self.write_xlsx(fileobj)
+            fileobj.seek(0)
+            return FileResponse(fileobj, as_attachment=True, filename=filename,
+                                content_type=CONTENT_TYPES['xlsx'])
+        content = self.iter_csv() if file_format == 'csv' else self.iter_jsonl()
+        return _streaming_response(content, file_format, filename)
+
+
+def _streaming_response(content, file_format, filename):
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def artifact_path(trip_date, stem, version, extension):
+    """ROOT/<trip_date>/<stem>.<version>.<extension>"""
+    return get_manifest_cache_config()['ROOT'] / str(trip_date) / f'{stem}.{version}.{extension}'
+
+
+def _open_temporary(path):
+    """A temporary file next to path, to be renamed into place once complete"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stem = path.name.rsplit('.', 2)[0]
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{stem}.', suffix='.tmp')
+    return os.fdopen(fd, 'wb'), tmp_name
+
+
+def _publish(tmp_name, path):
+    """Rename a finished temporary file into place and drop the superseded versions"""
+    os.replace(tmp_name, path)
+    stem, _, extension = path.name.rsplit('.', 2)
+    for stale in path.parent.glob(f'{stem}.*.{extension}'):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+
+
+def store_artifact(trip_date, stem, version, extension, write):
+    """
+    Return ROOT/<trip_date>/<stem>.<version>.<extension>, calling write(fileobj) to create it
+    when it does not exist yet. Files are written under a temporary name and renamed into
+    place, so concurrent requests never see (or serve) a half-written artifact.
+    """
+    path = artifact_path(trip_date, stem, version, extension)
+    if path.exists():
+        return path, False
+    fileobj, tmp_name = _open_temporary(path)
+    try:
+        with fileobj:
+            write(fileobj)
+        _publish(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return path, True
+
+
+def tee_artifact(path, chunks):
+    """
+    Yield the encoded chunks while writing them to a temporary file, which becomes the
+    artifact at path once the last chunk is sent. A download that fails or is abandoned
+    part way leaves nothing behind.
+    """
+    fileobj, tmp_name = _open_temporary(path)
+    try:
+        with fileobj:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                fileobj.write(data)
+                yield data
+        _publish(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def artifact_response(path, filename, content_type, attachment=True):
+    """Serve a stored artifact, through the web server when SENDFILE_HEADER is configured"""
+    config = get_manifest_cache_config()
+    header = config['SENDFILE_HEADER']
+    if header:
+        response = HttpResponse(content_type=content_type)
+        if header.lower() == 'x-accel-redirect':
+            relative = Path(path).relative_to(config['ROOT']).as_posix()
+            response[header] = config['SENDFILE_URL_PREFIX'].rstrip('/') + '/' + relative
+        else:
+            response[header] = str(path)
+        disposition = 'attachment' if attachment else 'inline'
+        response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+        return response
+    return FileResponse(open(path, 'rb'), as_attachment=attachment, filename=filename, content_type=content_type)
+
+
+def pregenerate(trip_date, bus_ids=None, formats=('csv',), driver_sheets=True):
+    """
+    Build the per-bus manifests (both directions, each format) and driver sheets for a date,
+    plus the whole-day files. Returns a list of (label, created): artifacts that are already
+    current for their bus's data version are left alone and reported with created=False.
+    """
+    if bus_ids is None:
+        # Open buses get a (possibly empty) sheet too, so a bus emptied by late cancellations is refreshed
+        from django.db.models import Q
+        booked = Booking.objects.filter(trip_date=trip_date).values('bus_id')
+        bus_ids = Bus.objects.filter(
+            Q(is_booking_open=True) | Q(pk__in=booked)
+        ).order_by('bus_no').values_list('pk', flat=True)
+    results = []
+    for outbound in (True, False):
+        day = Manifest(trip_date, outbound=outbound)
+        for file_format in formats:
+            _, created = day.artifact(file_format)
+            results.append((day.filename(file_format), created))
+        for bus_id in bus_ids:
+            manifest = Manifest(trip_date, outbound=outbound, bus_id=bus_id)
+            for file_format in formats:
+                _, created = manifest.artifact(file_format)
+                results.append((f'{manifest.artifact_stem()}.{file_format}', created))
+            if driver_sheets:
+                _, created = manifest.driver_sheet_artifact()
+                results.append((f'driver-sheet-{manifest.artifact_stem()}.html', created))
+    return results
+
+
+def prune_artifacts(before):
+    """Delete the artifact directories of trip dates before `before`; returns how many were removed"""
+    root = get_manifest_cache_config()['ROOT']
+    if not root.exists():
+        return 0
+    removed = 0
+    for directory in root.iterdir():
+        try:
+            trip_date = date.fromisoformat(directory.name)
+        except ValueError:
+            continue
+        if directory.is_dir() and trip_date < before:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
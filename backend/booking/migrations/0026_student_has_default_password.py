@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:55
+
+from django.contrib.auth.hashers import check_password
+from django.db import migrations, models
+
+
+def flag_default_passwords(apps, schema_editor):
+    """One-off backfill: this is the last time each student's hash is checked against the default"""
+    Student = apps.get_model('booking', 'Student')
+    flagged = [
+        pk for pk, password in Student.objects.values_list('pk', 'password').iterator()
+        if password and check_password('Changeme@123', password)
+    ]
+    for start in range(0, len(flagged), 500):
+        Student.objects.filter(pk__in=flagged[start:start + 500]).update(has_default_password=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0025_retention_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='has_default_password',
+            field=models.BooleanField(default=False, help_text='Still using the default imported password; kept in sync by set_password()'),
+        ),
+        migrations.RunPython(flag_default_passwords, migrations.RunPython.noop),
+    ]
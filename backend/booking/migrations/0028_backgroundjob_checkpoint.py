@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0027_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='checkpoint',
+            field=models.JSONField(blank=True, default=dict, help_text='Resume point, committed in the same transaction as the work it covers'),
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the input file, so a re-run of the same file finds this job', max_length=64),
+        ),
+    ]
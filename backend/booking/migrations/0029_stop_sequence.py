@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0028_backgroundjob_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='stop',
+            options={'ordering': ['sequence', 'stop_name', 'location'], 'verbose_name': 'Stop', 'verbose_name_plural': 'Stops'},
+        ),
+        migrations.AddField(
+            model_name='stop',
+            name='sequence',
+            field=models.PositiveIntegerField(default=0, help_text='Position on the route (1 = first stop; 0 = not set)'),
+        ),
+    ]
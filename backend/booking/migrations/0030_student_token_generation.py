@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0029_stop_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='token_generation',
+            field=models.PositiveIntegerField(default=0, help_text='Signed into every API token; bumped on logout to revoke the tokens issued before it'),
+        ),
+    ]
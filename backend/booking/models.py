@@ -1,9 +1,19 @@
+import time
+import uuid
+
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.db import models
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 
+from . import versions
+
+
+# Password given to imported / admin-created students until they set their own
+DEFAULT_STUDENT_PASSWORD = 'Changeme@123'
+
 
 class StudentManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -48,6 +58,14 @@ class Student(AbstractBaseUser):
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
+    has_default_password = models.BooleanField(
+        default=False,
+        help_text="Still using the default imported password; kept in sync by set_password()"
+    )
+    token_generation = models.PositiveIntegerField(
+        default=0,
+        help_text="Signed into every API token; bumped on logout to revoke the tokens issued before it"
+    )
     
     objects = StudentManager()
     
@@ -71,16 +89,19 @@ class Student(AbstractBaseUser):
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
     
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self.has_default_password = raw_password == DEFAULT_STUDENT_PASSWORD
+    
+    def set_default_password(self, encoded_password=None):
+        """Give the student the default password; pass a pre-hashed value to skip hashing"""
+        from django.contrib.auth.hashers import make_password
+        self.password = encoded_password or make_password(DEFAULT_STUDENT_PASSWORD)
+        self.has_default_password = True
+    
     def has_active_booking(self):
-        from django.utils import timezone
-        from datetime import datetime, time
-        now = timezone.localtime(timezone.now())
         # Only consider bookings as active if their trip_date and departure_time are in the future
-        for booking in self.booking_set.filter(status__in=['pending', 'confirmed']):
-            trip_datetime = timezone.make_aware(datetime.combine(booking.trip_date, booking.departure_time))
-            if trip_datetime > now:
-                return True
-        return False
+        return self.booking_set.filter(Booking.active_q()).exists()
     
     def has_outbound_booking(self):
         """Check if student has an active outbound booking (FROM REC)"""
@@ -198,32 +219,55 @@ class Bus(models.Model):
     #     return "REC" in self.to_location.upper()
     
     # Demand analytics
+    @staticmethod
+    def route_demand(route_names, today=None):
+        """Map route_name -> (target trip date, confirmed bookings on that date).
+
+        The target date is the next upcoming trip date (>= today) that has bookings
+        for the route, falling back to the most recent one. Two grouped queries
+        cover any number of routes, so list pages don't repeat the work per bus.
+        """
+        from django.db.models import Min, Max, Count, Q
+        today = today or timezone.now().date()
+        route_names = set(route_names)
+        if not route_names:
+            return {}
+        target_dates = {}
+        for row in (Booking.objects.filter(bus__route_name__in=route_names)
+                    .values('bus__route_name')
+                    .annotate(next_date=Min('trip_date', filter=Q(trip_date__gte=today)), last_date=Max('trip_date'))):
+            target_dates[row['bus__route_name']] = row['next_date'] or row['last_date']
+
+        counts = {}
+        if target_dates:
+            for row in (Booking.objects.filter(
+                            bus__route_name__in=target_dates.keys(),
+                            trip_date__in=set(target_dates.values()),
+                            status='confirmed')
+                        .values('bus__route_name', 'trip_date')
+                        .annotate(total=Count('id'))):
+                if target_dates[row['bus__route_name']] == row['trip_date']:
+                    counts[row['bus__route_name']] = row['total']
+
+        return {
+            route: (target_dates.get(route), counts.get(route, 0))
+            for route in route_names
+        }
+
     def _target_trip_date_for_route(self):
         """Return the next upcoming trip date (>= today) that has bookings for this route.
         If none upcoming, fall back to the most recent trip date that has bookings.
         """
-        from django.db.models import Min, Max
-        today = timezone.now().date()
-        upcoming = Booking.objects.filter(bus__route_name=self.route_name, trip_date__gte=today).aggregate(next_date=Min('trip_date'))['next_date']
-        if upcoming:
-            return upcoming
-        last = Booking.objects.filter(bus__route_name=self.route_name).aggregate(last_date=Max('trip_date'))['last_date']
-        return last
+        return Bus.route_demand([self.route_name])[self.route_name][0]
 
     def confirmed_bookings_for_route_on_date(self):
         """Count confirmed bookings for this route on the target trip date (auto-selected)."""
-        target_date = self._target_trip_date_for_route()
-        if not target_date:
-            return 0
-        return Booking.objects.filter(
-            bus__route_name=self.route_name,
-            trip_date=target_date,
-            status='confirmed'
-        ).count()
+        return Bus.route_demand([self.route_name])[self.route_name][1]
     
-    def required_buses_for_route_on_date(self):
+    def required_buses_for_route_on_date(self, total=None):
         import math
-        total = self.confirmed_bookings_for_route_on_date()
+        if total is None:
+            total = self.confirmed_bookings_for_route_on_date()
         if self.capacity <= 0:
             return 0
         return max(1, math.ceil(total / self.capacity))
@@ -236,11 +280,12 @@ class Stop(models.Model):
     is_pickup = models.BooleanField(default=True, help_text="Is this a pickup point?")
     is_dropoff = models.BooleanField(default=True, help_text="Is this a drop-off point?")
     is_active = models.BooleanField(default=True)
+    sequence = models.PositiveIntegerField(default=0, help_text="Position on the route (1 = first stop; 0 = not set)")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         unique_together = ['bus', 'stop_name', 'location']
-        ordering = ['stop_name', 'location']
+        ordering = ['sequence', 'stop_name', 'location']
         verbose_name = 'Stop'
         verbose_name_plural = 'Stops'
     
@@ -284,11 +329,31 @@ class Booking(models.Model):
     class Meta:
         verbose_name = 'Booking'
         verbose_name_plural = 'Bookings'
+        indexes = [
+            # purge_stale_data looks up abandoned pending bookings by age
+            models.Index(fields=['status', 'booking_date'], name='booking_status_booked_idx'),
+        ]
     
     def __str__(self):
         stop_str = f" → {self.selected_stop.location}" if self.selected_stop else ""
         return f"{self.student.full_name} - {self.bus.bus_no}{stop_str}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember where the booking was loaded from so cache versions for both places get bumped
+        instance._loaded_trip = (instance.__dict__.get('trip_date'), instance.__dict__.get('bus_id'))
+        return instance
+    
+    @staticmethod
+    def active_q(now=None):
+        """Q for pending/confirmed bookings whose trip (local date + departure time) is still ahead"""
+        now = timezone.localtime(now or timezone.now())
+        return models.Q(status__in=['pending', 'confirmed']) & (
+            models.Q(trip_date__gt=now.date()) |
+            models.Q(trip_date=now.date(), departure_time__gt=now.time())
+        )
+    
     def save(self, *args, **kwargs):
         is_new = self.pk is None
         super().save(*args, **kwargs)
@@ -330,8 +395,8 @@ class Booking(models.Model):
 class BookingOTP(models.Model):
     booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='otp')
     otp_code = models.CharField(max_length=6)
-    created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
     verified = models.BooleanField(default=False)
 
     class Meta:
@@ -369,41 +434,15 @@ class BookingOTP(models.Model):
     
     def send_otp_email(self):
         """Send OTP email to the student"""
-        subject = f'New OTP for Booking - {self.booking.bus.route_name}'
-        message = f"""
-        Dear {self.booking.student.full_name},
-        
-        A new OTP has been generated for your booking.
-        
-        Booking Details:
-        - Bus Number: {self.booking.bus.bus_no}
-        - Route: {self.booking.bus.route_name}
-        - Trip Date: {self.booking.trip_date.strftime('%Y-%m-%d')}
-        - Departure Time: {self.booking.departure_time}
-        
-        Your new OTP: {self.otp_code}
-        Expires at: {self.expires_at.strftime('%Y-%m-%d %H:%M')}
-        
-        Please use this OTP to verify your booking.
-        
-        Thank you!
-        College Transport Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [self.booking.student.email],
-            fail_silently=False,
-        )
+        from .otp import send_new_booking_otp_email
+        send_new_booking_otp_email(self.booking, self.otp_code, self.expires_at)
 
 
 class PasswordResetOTP(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='password_reset_otps')
     otp_code = models.CharField(max_length=6)
-    created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
     verified = models.BooleanField(default=False)
     used = models.BooleanField(default=False, help_text="Whether this OTP has been used to reset password")
 
@@ -468,28 +507,8 @@ class PasswordResetOTP(models.Model):
     
     def send_otp_email(self):
         """Send password reset OTP email to the student"""
-        subject = 'Password Reset OTP - Bus Booking System'
-        message = f"""
-        Dear {self.student.full_name},
-        
-        You have requested to reset your password for the Bus Booking System.
-        
-        Your OTP: {self.otp_code}
-        Expires at: {self.expires_at.strftime('%Y-%m-%d %H:%M')}
-        
-        If you did not request this password reset, please ignore this email.
-        
-        Thank you!
-        College Transport Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [self.student.email],
-            fail_silently=False,
-        )
+        from .otp import send_password_reset_otp_email
+        send_password_reset_otp_email(self.student, self.otp_code, self.expires_at)
     
     @classmethod
     def create_for_student(cls, student):
@@ -506,10 +525,20 @@ class PasswordResetOTP(models.Model):
         return otp
 
 
+# Per-process copy of the SiteConfiguration singleton: {'version', 'obj', 'checked_at'}
+_site_config_local = {}
+
+
 class SiteConfiguration(models.Model):
     allowed_years = models.JSONField(default=list, help_text="List of allowed student years for login, e.g. ['2', '3', '4']")
     booking_open = models.BooleanField(default=True, help_text="If disabled, students cannot create new bookings")
 
+    CACHE_VERSION_KEY = 'booking:site-config:version'
+    CACHE_OBJECT_KEY = 'booking:site-config:{version}'
+    # How long a worker trusts its local copy before re-reading the shared version key,
+    # or the row itself when the cache is private to the process
+    LOCAL_TTL_SECONDS = 1.0
+
     class Meta:
         verbose_name = 'Site Configuration'
         verbose_name_plural = 'Site Configuration'
@@ -517,7 +546,159 @@ class SiteConfiguration(models.Model):
     def __str__(self):
         return "Site Configuration"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.invalidate_cache()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.invalidate_cache()
+        return result
+
+    @property
+    def allowed_year_set(self):
+        """allowed_years as a frozenset of strings, computed once per cached copy"""
+        if getattr(self, '_allowed_year_set', None) is None:
+            self._allowed_year_set = frozenset(str(y) for y in (self.allowed_years or []))
+        return self._allowed_year_set
+
+    @classmethod
+    def invalidate_cache(cls):
+        """Publish a new version so every worker reloads within LOCAL_TTL_SECONDS"""
+        _site_config_local.clear()
+        try:
+            cache.set(cls.CACHE_VERSION_KEY, uuid.uuid4().hex, None)
+        except Exception:
+            pass
+
+    @classmethod
+    def _current_version(cls):
+        version = cache.get(cls.CACHE_VERSION_KEY)
+        if version is None:
+            # Version lost (cache flush/eviction): start a fresh one so no stale copy is reused
+            cache.add(cls.CACHE_VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(cls.CACHE_VERSION_KEY)
+        return version
+
     @classmethod
     def get_solo(cls):
-        obj, created = cls.objects.get_or_create(pk=1)
-        return obj
\ No newline at end of file
+        """Return the singleton from the process-local copy, the shared cache, or the DB"""
+        now = time.monotonic()
+        local = _site_config_local
+        if local and now - local['checked_at'] < cls.LOCAL_TTL_SECONDS:
+            return local['obj']
+
+        if not versions.cache_is_shared():
+            # Another worker's save() cannot reach this process's cache, so the local
+            # copy is only trusted for LOCAL_TTL_SECONDS before the row is read again
+            obj, created = cls.objects.get_or_create(pk=1)
+            obj.allowed_year_set  # precompute once for every request served from the local copy
+            _site_config_local.update(version=None, obj=obj, checked_at=now)
+            return obj
+
+        try:
+            version = cls._current_version()
+        except Exception:
+            obj, created = cls.objects.get_or_create(pk=1)
+            return obj
+
+        if local and local['version'] == version:
+            local['checked_at'] = now
+            return local['obj']
+
+        object_key = cls.CACHE_OBJECT_KEY.format(version=version)
+        obj = cache.get(object_key)
+        if obj is None:
+            obj, created = cls.objects.get_or_create(pk=1)
+            obj.allowed_year_set  # precompute before the copy is shared
+            cache.set(object_key, obj, 60 * 60 * 24)
+
+        _site_config_local.update(version=version, obj=obj, checked_at=now)
+        return obj
+
+
+class RateLimitCounter(models.Model):
+    """DB fallback for rate-limit counters when the shared cache is unavailable"""
+    key = models.CharField(max_length=200, unique=True)
+    count = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Rate Limit Counter'
+        verbose_name_plural = 'Rate Limit Counters'
+
+    def __str__(self):
+        return f"{self.key}: {self.count}"
+
+
+class DataVersion(models.Model):
+    """Cache version keys (booking/versions.py) when the cache is not shared between processes"""
+    key = models.CharField(max_length=200, unique=True)
+    version = models.CharField(max_length=32)
+
+    class Meta:
+        verbose_name = 'Data Version'
+        verbose_name_plural = 'Data Versions'
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
+
+
+class BackgroundJob(models.Model):
+    """Long-running admin work, queued here and executed by `manage.py run_jobs` workers"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    total = models.PositiveIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    file_hash = models.CharField(
+        max_length=64, blank=True, db_index=True,
+        help_text="SHA-256 of the input file, so a re-run of the same file finds this job"
+    )
+    checkpoint = models.JSONField(
+        default=dict, blank=True,
+        help_text="Resume point, committed in the same transaction as the work it covers"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, help_text="Worker currently holding the job")
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='background_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Background Job'
+        verbose_name_plural = 'Background Jobs'
+        ordering = ['-created_at']
+        indexes = [
+            # Workers poll for the oldest queued job and for stale running ones
+            models.Index(fields=['status', 'created_at'], name='booking_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    @property
+    def percent(self):
+        if self.is_finished and self.status == 'succeeded':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.done * 100 / self.total))
@@ -0,0 +1,250 @@
+"""
+One-time passcode storage for booking confirmation and password resets.
+
+OTPs are short-lived secrets: written once, read once and then useless.
+CacheOTPStore keeps them in the shared cache with a native TTL, so a booking
+no longer costs an OTP INSERT plus an UPDATE. DatabaseOTPStore keeps the old
+BookingOTP / PasswordResetOTP rows for deployments that want an audit trail.
+Pick one with the OTP_STORE_BACKEND setting ('cache' or 'database'); left
+empty, the cache is used only when every process shares it (Redis) and the
+database otherwise, since an OTP issued by one gunicorn worker must verify
+in another.
+"""
+
+import secrets
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from . import versions
+
+
+BOOKING = 'booking'
+PASSWORD_RESET = 'password_reset'
+
+# Keep expired OTPs around a little longer so users get "expired" instead of "not found"
+EXPIRED_GRACE_SECONDS = 60 * 60
+
+
+def generate_code():
+    return str(100000 + secrets.randbelow(900000))
+
+
+@dataclass
+class OTPRecord:
+    id: str
+    code: str
+    expires_at: datetime
+    verified: bool = False
+    used: bool = False
+
+    def is_expired(self):
+        return timezone.now() > self.expires_at
+
+    def verify(self, provided_code):
+        """Check a submitted code; returns (is_valid, message)"""
+        if self.is_expired():
+            return False, "OTP has expired"
+        if self.used:
+            return False, "OTP has already been used"
+        if self.code != provided_code:
+            return False, "Invalid OTP"
+        return True, "OTP verified successfully"
+
+
+class BaseOTPStore:
+    def issue(self, purpose, subject_id, minutes):
+        """Create a fresh OTP for the subject, replacing any previous one"""
+        raise NotImplementedError
+
+    def get(self, purpose, subject_id):
+        """Return the current OTPRecord for the subject, or None"""
+        raise NotImplementedError
+
+    def mark_verified(self, purpose, subject_id, record):
+        raise NotImplementedError
+
+    def consume(self, purpose, subject_id, record):
+        """Mark the OTP as spent so it cannot be used again"""
+        raise NotImplementedError
+
+
+class CacheOTPStore(BaseOTPStore):
+    """OTPs in the shared cache, one key per (purpose, subject), expiring on their own"""
+
+    def _key(self, purpose, subject_id):
+        return f'booking:otp:{purpose}:{subject_id}'
+
+    def _save(self, purpose, subject_id, record):
+        ttl = (record.expires_at - timezone.now()).total_seconds() + EXPIRED_GRACE_SECONDS
+        cache.set(self._key(purpose, subject_id), asdict(record), max(1, int(ttl)))
+
+    def issue(self, purpose, subject_id, minutes):
+        record = OTPRecord(
+            id=uuid.uuid4().hex,
+            code=generate_code(),
+            expires_at=timezone.now() + timedelta(minutes=minutes),
+        )
+        self._save(purpose, subject_id, record)
+        return record
+
+    def get(self, purpose, subject_id):
+        data = cache.get(self._key(purpose, subject_id))
+        return OTPRecord(**data) if data else None
+
+    def mark_verified(self, purpose, subject_id, record):
+        record.verified = True
+        self._save(purpose, subject_id, record)
+
+    def consume(self, purpose, subject_id, record):
+        record.used = True
+        cache.delete(self._key(purpose, subject_id))
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    """OTPs as BookingOTP / PasswordResetOTP rows, kept for auditing"""
+
+    def _record(self, row):
+        return OTPRecord(
+            id=str(row.pk),
+            code=row.otp_code,
+            expires_at=row.expires_at,
+            verified=row.verified,
+            used=getattr(row, 'used', False),
+        )
+
+    def issue(self, purpose, subject_id, minutes):
+        from .models import BookingOTP, PasswordResetOTP
+
+        code = generate_code()
+        expires_at = timezone.now() + timedelta(minutes=minutes)
+        if purpose == BOOKING:
+            row, created = BookingOTP.objects.update_or_create(
+                booking_id=subject_id,
+                defaults={'otp_code': code, 'expires_at': expires_at, 'verified': False},
+            )
+        else:
+            # Invalidate any existing unused OTPs for this student
+            PasswordResetOTP.objects.filter(student_id=subject_id, used=False).update(used=True)
+            row = PasswordResetOTP.objects.create(student_id=subject_id, otp_code=code, expires_at=expires_at)
+        return self._record(row)
+
+    def get(self, purpose, subject_id):
+        from .models import BookingOTP, PasswordResetOTP
+
+        if purpose == BOOKING:
+            row = BookingOTP.objects.filter(booking_id=subject_id).first()
+        else:
+            row = PasswordResetOTP.objects.filter(
+                student_id=subject_id, used=False
+            ).order_by('-created_at').first()
+        return self._record(row) if row else None
+
+    def _model(self, purpose):
+        from .models import BookingOTP, PasswordResetOTP
+        return BookingOTP if purpose == BOOKING else PasswordResetOTP
+
+    def mark_verified(self, purpose, subject_id, record):
+        record.verified = True
+        self._model(purpose).objects.filter(pk=record.id).update(verified=True)
+
+    def consume(self, purpose, subject_id, record):
+        record.used = True
+        if purpose == BOOKING:
+            # Booking OTPs have no "used" flag; a verified OTP is a spent one
+            record.verified = True
+            self._model(purpose).objects.filter(pk=record.id).update(verified=True)
+        else:
+            self._model(purpose).objects.filter(pk=record.id).update(used=True)
+
+
+OTP_STORE_BACKENDS = {
+    'cache': CacheOTPStore,
+    'database': DatabaseOTPStore,
+}
+
+
+def get_otp_store():
+    backend = getattr(settings, 'OTP_STORE_BACKEND', '') or ('cache' if versions.cache_is_shared() else 'database')
+    if backend == 'cache' and not versions.cache_is_shared():
+        raise ImproperlyConfigured(
+            "OTP_STORE_BACKEND = 'cache' needs a cache shared by every process (set REDIS_URL); "
+            "a process-local cache would lose OTPs between workers. Use 'database' instead."
+        )
+    return OTP_STORE_BACKENDS[backend]()
+
+
+# Emails
+
+def send_booking_otp_email(email, record):
+    """First OTP for a freshly created pending booking"""
+    minutes = max(1, round((record.expires_at - timezone.now()).total_seconds() / 60))
+    subject = 'Your Bus Booking OTP'
+    message = f"Your OTP for confirming your bus booking is: {record.code}\nThis OTP is valid for {minutes} minutes."
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [email], fail_silently=False)
+
+
+def send_new_booking_otp_email(booking, code, expires_at):
+    """Replacement OTP for a booking whose previous OTP expired"""
+    subject = f'New OTP for Booking - {booking.bus.route_name}'
+    message = f"""
+        Dear {booking.student.full_name},
+
+        A new OTP has been generated for your booking.
+
+        Booking Details:
+        - Bus Number: {booking.bus.bus_no}
+        - Route: {booking.bus.route_name}
+        - Trip Date: {booking.trip_date.strftime('%Y-%m-%d')}
+        - Departure Time: {booking.departure_time}
+
+        Your new OTP: {code}
+        Expires at: {expires_at.strftime('%Y-%m-%d %H:%M')}
+
+        Please use this OTP to verify your booking.
+
+        Thank you!
+        College Transport Team
+        """
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [booking.student.email], fail_silently=False)
+
+
+def send_password_reset_otp_email(student, code, expires_at):
+    subject = 'Password Reset OTP - Bus Booking System'
+    message = f"""
+        Dear {student.full_name},
+
+        You have requested to reset your password for the Bus Booking System.
+
+        Your OTP: {code}
+        Expires at: {expires_at.strftime('%Y-%m-%d %H:%M')}
+
+        If you did not request this password reset, please ignore this email.
+
+        Thank you!
+        College Transport Team
+        """
+    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [student.email], fail_silently=False)
+
+
+# High-level helpers used by the views and admin actions
+
+def issue_booking_otp(booking, minutes=10, resend=False, store=None):
+    record = (store or get_otp_store()).issue(BOOKING, booking.pk, minutes)
+    if resend:
+        send_new_booking_otp_email(booking, record.code, record.expires_at)
+    else:
+        send_booking_otp_email(booking.student.email, record)
+    return record
+
+
+def issue_password_reset_otp(student, minutes=15, store=None):
+    record = (store or get_otp_store()).issue(PASSWORD_RESET, student.pk, minutes)
+    send_password_reset_otp_email(student, record.code, record.expires_at)
+    return record
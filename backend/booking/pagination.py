@@ -0,0 +1,108 @@
+"""
+Admin paginator for large tables (bookings, OTPs).
+
+Two things make big changelists slow: the exact COUNT(*) run before every
+page, and OFFSET scans on deep pages. EstimatedCountPaginator answers the
+count for unfiltered lists from the planner's statistics (PostgreSQL
+pg_class.reltuples, SQLite sqlite_stat1) once the table is large. Deep pages
+still use OFFSET, but only over the ordering columns, which an index on them
+can answer without visiting the table: that finds the previous page's last
+key, and the page's full rows are then read with a filter seeking past it
+instead of being fetched and discarded. This is not a keyset (cursor)
+paginator: the boundary costs an OFFSET scan of the index, which is what
+lets the admin keep numbered page links.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections, DatabaseError
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+
+def estimate_table_rows(model, using='default'):
+    """Row estimate from the database's statistics, or None if there is none"""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                # -1 means the table has never been analyzed
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                # Every row for the table (per index, or idx NULL) starts with its row count
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                return int(row[0].split()[0]) if row else None
+    except (DatabaseError, ValueError):
+        return None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    # Unfiltered tables with at least this many estimated rows skip COUNT(*)
+    estimate_threshold = 50000
+    # Pages starting beyond this offset find their boundary key first, then seek past it
+    seek_offset_threshold = 1000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where and not queryset.query.distinct:
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
+
+    def _seek_fields(self):
+        """Ordering as (field name, descending) pairs if it can drive a seek past a key, else None"""
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or queryset.query.distinct:
+            return None
+        opts = queryset.model._meta
+        fields = []
+        for item in queryset.query.order_by:
+            if not isinstance(item, str) or '__' in item or item.lstrip('-') == '?':
+                return None
+            name = item.lstrip('-')
+            if name == 'pk':
+                field = opts.pk
+            else:
+                try:
+                    field = opts.get_field(name)
+                except Exception:
+                    return None
+            # NULLs don't compare, so nullable columns can't be sought past
+            if field.null or not field.concrete:
+                return None
+            fields.append((field.attname, item.startswith('-')))
+        # The ordering must end on the primary key to be total
+        if not fields or fields[-1][0] != opts.pk.attname:
+            return None
+        return fields
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        fields = self._seek_fields() if bottom > self.seek_offset_threshold else None
+        if not fields:
+            return super().page(number)
+
+        queryset = self.object_list
+        names = [name for name, _ in fields]
+        # OFFSET over the narrow ordering columns only (index-only where an index covers
+        # them); whole rows are read just for the page itself
+        boundary = list(queryset.values_list(*names)[bottom - 1:bottom])
+        if not boundary:
+            return self._get_page([], number, self)
+
+        seek = Q()
+        equal = {}
+        for (name, descending), value in zip(fields, boundary[0]):
+            seek |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal[name] = value
+        return self._get_page(queryset.filter(seek)[:self.per_page], number, self)
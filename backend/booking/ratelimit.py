@@ -0,0 +1,236 @@
+import hashlib
+import logging
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOGIN_RATE_LIMIT = {
+    'WINDOW_SECONDS': 300,
+    'EMAIL_LIMIT': 10,
+    'IP_LIMIT': 50,
+    'TRUST_X_FORWARDED_FOR': False,
+    # Proxies in front of Django that append to X-Forwarded-For (Railway's edge: 1)
+    'TRUSTED_PROXY_COUNT': 1,
+}
+
+STATS_KEYS = ('attempts', 'blocked', 'blocked_email', 'blocked_ip', 'db_fallback')
+
+# Stats restart this long after their first hit (expired counters are removed by purge_stale_data)
+STATS_SECONDS = 7 * 24 * 3600
+
+
+def get_login_rate_limit_config():
+    config = dict(DEFAULT_LOGIN_RATE_LIMIT)
+    config.update(getattr(settings, 'LOGIN_RATE_LIMIT', {}))
+    return config
+
+
+def get_client_ip(request, trust_forwarded=False, proxy_count=1):
+    """
+    Return the client IP, optionally taken from X-Forwarded-For. Clients can send any
+    X-Forwarded-For they like, so only the hop appended by the nearest of our proxy_count
+    proxies (proxy_count-th from the right) can be trusted; the leftmost never can.
+    """
+    if trust_forwarded:
+        hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+        if hops:
+            return hops[-min(proxy_count, len(hops))]
+    return request.META.get('REMOTE_ADDR', '') or 'unknown'
+
+
+class CounterStore:
+    """Fixed-bucket counters in the shared cache, falling back to the DB.
+
+    The cache is tried first; if it raises (e.g. Redis is unreachable) the
+    RateLimitCounter table is used instead so limiting keeps working. Without a
+    shared cache (LocMemCache) the table is used directly: per-process counters
+    would multiply every limit by the number of workers.
+    """
+
+    def _record_fallback(self):
+        # Straight to the table: the cache just failed, and record_stat() would retry it
+        self._db_incr(_stat_key('db_fallback'), STATS_SECONDS)
+
+    def incr(self, key, ttl):
+        if not versions.cache_is_shared():
+            return self._db_incr(key, ttl)
+        try:
+            cache.add(key, 0, ttl)
+            return cache.incr(key)
+        except Exception:
+            self._record_fallback()
+            return self._db_incr(key, ttl)
+
+    def get_many(self, keys):
+        if not versions.cache_is_shared():
+            values = self._db_get_many(keys)
+        else:
+            try:
+                values = cache.get_many(keys)
+            except Exception:
+                self._record_fallback()
+                values = self._db_get_many(keys)
+        return [int(values.get(key) or 0) for key in keys]
+
+    def delete_many(self, keys):
+        if versions.cache_is_shared():
+            try:
+                cache.delete_many(keys)
+                return
+            except Exception:
+                self._record_fallback()
+        from .models import RateLimitCounter
+        RateLimitCounter.objects.filter(key__in=keys).delete()
+
+    def _db_incr(self, key, ttl):
+        from .models import RateLimitCounter
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+        updated = RateLimitCounter.objects.filter(key=key).update(count=F('count') + 1)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    RateLimitCounter.objects.create(key=key, count=1, expires_at=expires_at)
+            except IntegrityError:
+                RateLimitCounter.objects.filter(key=key).update(count=F('count') + 1)
+        return RateLimitCounter.objects.filter(key=key).values_list('count', flat=True).first() or 1
+
+    def _db_get_many(self, keys):
+        from .models import RateLimitCounter
+        return dict(
+            RateLimitCounter.objects.filter(key__in=keys, expires_at__gt=timezone.now())
+            .values_list('key', 'count')
+        )
+
+
+counter_store = CounterStore()
+
+
+def _stat_key(name):
+    return f'booking:login-rl:stats:{name}'
+
+
+def record_stat(name):
+    """Count an event in the same store as the limits, so every worker adds to one total"""
+    try:
+        counter_store.incr(_stat_key(name), STATS_SECONDS)
+    except Exception:
+        logger.exception('Could not record login rate-limit stat %s', name)
+
+
+def get_stats():
+    """Return the attack-watch counters (attempts, blocked requests, DB fallbacks)"""
+    keys = [_stat_key(name) for name in STATS_KEYS]
+    # Hits land in the table while the shared cache is down, so add both up
+    values = dict.fromkeys(keys, 0)
+    if versions.cache_is_shared():
+        try:
+            for key, value in cache.get_many(keys).items():
+                values[key] += int(value or 0)
+        except Exception:
+            pass
+    for key, value in counter_store._db_get_many(keys).items():
+        values[key] += value
+    return {name: values[_stat_key(name)] for name in STATS_KEYS}
+
+
+class SlidingWindowLimiter:
+    """Sliding-window counter: the previous bucket is weighted by its overlap"""
+
+    def __init__(self, scope, limit, window, store=counter_store):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.store = store
+
+    def _key(self, identifier, bucket):
+        # Hash the identifier so attacker-supplied emails are always valid cache keys
+        digest = hashlib.sha1(identifier.encode()).hexdigest()
+        return f'booking:login-rl:{self.scope}:{digest}:{bucket}'
+
+    def _buckets(self, now):
+        bucket = int(now // self.window)
+        elapsed = now - bucket * self.window
+        return bucket, elapsed
+
+    def check(self, identifier, now=None):
+        """Return (allowed, retry_after_seconds) without recording a hit"""
+        now = time.time() if now is None else now
+        bucket, elapsed = self._buckets(now)
+        current, previous = self.store.get_many([
+            self._key(identifier, bucket), self._key(identifier, bucket - 1)
+        ])
+        weight = 1 - elapsed / self.window
+        if current + previous * weight < self.limit:
+            return True, 0
+        if current >= self.limit or previous == 0:
+            retry_after = self.window - elapsed
+        else:
+            # Wait until the decaying previous bucket drops below the remaining budget
+            retry_after = self.window * (1 - (self.limit - current) / previous) - elapsed
+        return False, max(1, math.ceil(retry_after))
+
+    def hit(self, identifier, now=None):
+        now = time.time() if now is None else now
+        bucket, _ = self._buckets(now)
+        self.store.incr(self._key(identifier, bucket), self.window * 2)
+
+    def reset(self, identifier, now=None):
+        now = time.time() if now is None else now
+        bucket, _ = self._buckets(now)
+        self.store.delete_many([self._key(identifier, bucket), self._key(identifier, bucket - 1)])
+
+
+class LoginRateLimiter:
+    """Limit login attempts per email and per client IP before any hashing happens"""
+
+    def __init__(self):
+        config = get_login_rate_limit_config()
+        self.trust_forwarded = config['TRUST_X_FORWARDED_FOR']
+        self.proxy_count = config['TRUSTED_PROXY_COUNT']
+        self.email_limiter = SlidingWindowLimiter('email', config['EMAIL_LIMIT'], config['WINDOW_SECONDS'])
+        self.ip_limiter = SlidingWindowLimiter('ip', config['IP_LIMIT'], config['WINDOW_SECONDS'])
+
+    def _identifiers(self, request, email):
+        email = (email or '').strip().lower()
+        ip = get_client_ip(request, self.trust_forwarded, self.proxy_count)
+        return email, ip
+
+    def check_and_record(self, request, email):
+        """Record an attempt; return (allowed, retry_after_seconds)"""
+        email, ip = self._identifiers(request, email)
+        record_stat('attempts')
+
+        allowed, retry_after = self.ip_limiter.check(ip)
+        if not allowed:
+            record_stat('blocked')
+            record_stat('blocked_ip')
+            logger.warning('Login rate limit hit for IP %s', ip)
+            return False, retry_after
+        if email:
+            allowed, retry_after = self.email_limiter.check(email)
+            if not allowed:
+                record_stat('blocked')
+                record_stat('blocked_email')
+                logger.warning('Login rate limit hit for email %s from %s', email, ip)
+                return False, retry_after
+
+        self.ip_limiter.hit(ip)
+        if email:
+            self.email_limiter.hit(email)
+        return True, 0
+
+    def reset_email(self, email):
+        """Clear the per-email window after a successful login"""
+        email = (email or '').strip().lower()
+        if email:
+            self.email_limiter.reset(email)
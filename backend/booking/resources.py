@@ -1,6 +1,74 @@
 from import_export import resources, fields
+from import_export.instance_loaders import CachedInstanceLoader
 from import_export.widgets import ForeignKeyWidget, DateWidget, TimeWidget
-from .models import Student, Bus, Booking, BookingOTP
+from .models import Student, Bus, Booking, BookingOTP, Stop, DEFAULT_STUDENT_PASSWORD
+
+
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """
+    ForeignKeyWidget that resolves values from a dict filled by preload() -- one query for
+    every key an import references -- instead of one query per row. Until preload() is
+    called it behaves like ForeignKeyWidget.
+    """
+
+    def __init__(self, model, field='pk', **kwargs):
+        super().__init__(model, field, **kwargs)
+        self.cache = None
+
+    def preload(self, values):
+        values = {value for value in values if value not in (None, '')}
+        self.cache = self.model._default_manager.in_bulk(values, field_name=self.field)
+
+    def clean(self, value, row=None, **kwargs):
+        if self.cache is None:
+            return super().clean(value, row, **kwargs)
+        if value in (None, ''):
+            return None
+        try:
+            return self.cache[value]
+        except KeyError:
+            raise self.model.DoesNotExist(f'{self.model._meta.verbose_name} with {self.field} "{value}" does not exist')
+
+
+class StopWidget(CachedForeignKeyWidget):
+    """
+    Resolves a stop name within the row's bus (stop names repeat across buses), narrowed by
+    the row's selected_stop_location when the bus has more than one stop with that name.
+    """
+
+    def __init__(self, bus_column='bus_no', location_column='selected_stop_location', **kwargs):
+        super().__init__(Stop, 'stop_name', **kwargs)
+        self.bus_column = bus_column
+        self.location_column = location_column
+
+    def preload(self, bus_nos):
+        # All stops of the referenced buses; a route has tens of stops, so this stays small
+        self.cache = {}
+        bus_nos = {bus_no for bus_no in bus_nos if bus_no not in (None, '')}
+        for stop in Stop.objects.filter(bus__bus_no__in=bus_nos).select_related('bus'):
+            self.cache.setdefault((stop.bus.bus_no, stop.stop_name), []).append(stop)
+
+    def get_queryset(self, value, row, *args, **kwargs):
+        return Stop.objects.filter(bus__bus_no=(row or {}).get(self.bus_column))
+
+    def clean(self, value, row=None, **kwargs):
+        if value in (None, ''):
+            return None
+        row = row or {}
+        if self.cache is None:
+            candidates = list(self.get_queryset(value, row).filter(stop_name=value))
+        else:
+            candidates = self.cache.get((row.get(self.bus_column), value), [])
+        location = row.get(self.location_column)
+        if location and len(candidates) > 1:
+            candidates = [stop for stop in candidates if stop.location == location]
+        if not candidates:
+            raise Stop.DoesNotExist(f'Stop "{value}" does not exist on bus {row.get(self.bus_column)}')
+        if len(candidates) > 1:
+            raise Stop.MultipleObjectsReturned(
+                f'Bus {row.get(self.bus_column)} has several stops named "{value}"; set {self.location_column}'
+            )
+        return candidates[0]
 
 
 class StudentResource(resources.ModelResource):
@@ -14,20 +82,30 @@ class StudentResource(resources.ModelResource):
         export_order = fields
         skip_unchanged = True
         report_skipped = True
-        
-    def before_import_row(self, row, **kwargs):
-        """Set default password for all imported students"""
+        # Existing students are looked up with one query per import, not one per row,
+        # and rows are written with bulk_create / bulk_update in batches
+        instance_loader_class = CachedInstanceLoader
+        use_bulk = True
+        batch_size = 500
+    
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        """Hash the default password once per import; PBKDF2 per row dominated large imports"""
         from django.contrib.auth.hashers import make_password
-        # Set default password for all imported students
-        row['password'] = make_password('Changeme@123')
-        return row
+        self.default_password = make_password(DEFAULT_STUDENT_PASSWORD)
+        self.updated_ids = []
     
-    def after_import_instance(self, instance, new, **kwargs):
-        """Ensure password is set after import"""
-        if new and not instance.password:
-            from django.contrib.auth.hashers import make_password
-            instance.password = make_password('Changeme@123')
-            instance.save()
+    def before_save_instance(self, instance, using_transactions, dry_run):
+        """Give new students the shared default password (fields are populated by now)"""
+        if instance.pk is None and not instance.password:
+            instance.set_default_password(self.default_password)
+        elif instance.pk is not None:
+            self.updated_ids.append(instance.pk)
+
+    def after_import(self, dataset, result, using_transactions, dry_run, **kwargs):
+        # Bulk updates skip the signal that bumps manifest versions (booking/versions.py)
+        from . import versions
+        if not dry_run and self.updated_ids:
+            versions.bump_for_queryset(Booking.objects.filter(student_id__in=self.updated_ids))
 
 
 class BusResource(resources.ModelResource):
@@ -58,21 +136,23 @@ class BookingResource(resources.ModelResource):
     student = fields.Field(
         column_name='student_email',
         attribute='student',
-        widget=ForeignKeyWidget(Student, 'email')
+        widget=CachedForeignKeyWidget(Student, 'email')
     )
     bus = fields.Field(
         column_name='bus_no',
         attribute='bus',
-        widget=ForeignKeyWidget(Bus, 'bus_no')
+        widget=CachedForeignKeyWidget(Bus, 'bus_no')
     )
     selected_stop = fields.Field(
         column_name='selected_stop',
         attribute='selected_stop',
-        widget=ForeignKeyWidget('booking.Stop', 'stop_name')
+        widget=StopWidget()
     )
+    # Export-only: on import it just picks between same-named stops of a bus
     selected_stop_location = fields.Field(
         column_name='selected_stop_location',
-        attribute='selected_stop__location'
+        attribute='selected_stop__location',
+        readonly=True
     )
     trip_date = fields.Field(
         column_name='trip_date',
@@ -95,6 +175,33 @@ class BookingResource(resources.ModelResource):
         export_order = fields
         skip_unchanged = True
         report_skipped = True
+        # Existing bookings are loaded with one query per import and written in batches
+        instance_loader_class = CachedInstanceLoader
+        use_bulk = True
+        batch_size = 500
+
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        """Load every student, bus and stop the file references up front: one query each"""
+        def column(field_name):
+            name = self.fields[field_name].column_name
+            return dataset[name] if name in (dataset.headers or []) else []
+
+        self.fields['student'].widget.preload(column('student'))
+        self.fields['bus'].widget.preload(column('bus'))
+        self.fields['selected_stop'].widget.preload(column('bus'))
+        self.touched_trips = set()
+
+    def after_save_instance(self, instance, using_transactions, dry_run):
+        # Bulk writes skip the post_save signal that bumps cache versions (booking/versions.py)
+        self.touched_trips.add((instance.trip_date, instance.bus_id))
+        loaded = getattr(instance, '_loaded_trip', None)
+        if loaded and None not in loaded:
+            self.touched_trips.add(loaded)
+
+    def after_import(self, dataset, result, using_transactions, dry_run, **kwargs):
+        from . import versions
+        if not dry_run and self.touched_trips:
+            versions.bump_bookings(self.touched_trips)
 
 
 class BookingOTPResource(resources.ModelResource):
@@ -0,0 +1,97 @@
+"""
+Retention policy for short-lived rows (OTPs, abandoned pending bookings, rate-limit
+counters, cache versions of past trip dates).
+
+Rows are deleted in bounded batches, each in its own short transaction, so a
+purge never holds long locks and can run while the site is live.
+"""
+
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from . import versions
+from .models import Booking, BookingOTP, PasswordResetOTP, RateLimitCounter
+
+
+DEFAULT_DATA_RETENTION = {
+    'OTP_DAYS': 30,
+    'PENDING_BOOKING_HOURS': 48,
+    'VERSION_DAYS': 30,
+    'BATCH_SIZE': 5000,
+}
+
+
+def get_retention_config():
+    config = dict(DEFAULT_DATA_RETENTION)
+    config.update(getattr(settings, 'DATA_RETENTION', {}))
+    return config
+
+
+@dataclass
+class PurgeResult:
+    name: str
+    matched: int = 0
+    deleted: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+
+def retention_policies(now=None, config=None):
+    """Return (name, queryset) pairs of rows that are past retention"""
+    now = now or timezone.now()
+    config = config or get_retention_config()
+    otp_cutoff = now - timedelta(days=config['OTP_DAYS'])
+    pending_cutoff = now - timedelta(hours=config['PENDING_BOOKING_HOURS'])
+    version_cutoff = timezone.localdate(now) - timedelta(days=config['VERSION_DAYS'])
+    return [
+        ('Booking OTPs', BookingOTP.objects.filter(expires_at__lt=otp_cutoff)),
+        ('Password reset OTPs', PasswordResetOTP.objects.filter(expires_at__lt=otp_cutoff)),
+        ('Abandoned pending bookings', Booking.objects.filter(status='pending', booking_date__lt=pending_cutoff)),
+        ('Expired rate-limit counters', RateLimitCounter.objects.filter(expires_at__lt=now)),
+        # Last: purging the bookings above bumps (re-creates) the versions of their trip dates
+        ('Past trip data versions', versions.stale_db_versions(version_cutoff)),
+    ]
+
+
+def purge_queryset(name, queryset, batch_size, dry_run=False, pause=0.0):
+    """Delete the rows of `queryset` in batches of primary keys, one transaction per batch"""
+    result = PurgeResult(name)
+    started = time.monotonic()
+    if dry_run:
+        result.matched = queryset.count()
+        result.seconds = time.monotonic() - started
+        return result
+
+    model = queryset.model
+    if model is Booking:
+        # One version bump per batch instead of one per deleted row (post_delete)
+        post_delete.disconnect(sender=Booking, dispatch_uid='booking_versions_delete')
+    try:
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                # Re-apply the policy filter so rows changed since the SELECT are left alone
+                batch = queryset.filter(pk__in=pks)
+                if model is Booking:
+                    versions.bump_for_queryset(batch)
+                deleted, per_model = batch.delete()
+            result.matched += len(pks)
+            result.deleted += per_model.get(model._meta.label, 0)
+            result.batches += 1
+            if len(pks) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    finally:
+        if model is Booking:
+            post_delete.connect(versions.booking_changed, sender=Booking, dispatch_uid='booking_versions_delete')
+    result.seconds = time.monotonic() - started
+    return result
@@ -14,7 +14,7 @@ class StudentSerializer(serializers.ModelSerializer):
 class StopSerializer(serializers.ModelSerializer):
     class Meta:
         model = Stop
-        fields = ['id', 'stop_name', 'location', 'is_pickup', 'is_dropoff', 'is_active', 'display_name']
+        fields = ['id', 'stop_name', 'location', 'is_pickup', 'is_dropoff', 'is_active', 'sequence', 'display_name']
 
 
 class BusSerializer(serializers.ModelSerializer):
@@ -159,10 +159,8 @@ class LoginSerializer(serializers.Serializer):
                 if user.is_active:
                     # Check allowed years from SiteConfiguration
                     config = SiteConfiguration.get_solo()
-                    allowed_years = config.allowed_years if config else ['2', '3', '4']
-                    # Accept both string and int for year comparison
-                    allowed_years_str = set(str(y) for y in allowed_years)
-                    if str(user.year) not in allowed_years_str:
+                    # allowed_year_set holds strings, so both '3' and 3 in the config match
+                    if str(user.year) not in config.allowed_year_set:
                         raise serializers.ValidationError("Login is not allowed for your year.")
                     data['user'] = user
                     return data
@@ -0,0 +1,310 @@
+"""
+Set-based student CSV import (used by the import_students command).
+
+The CSV is streamed in chunks. Each chunk is validated
+(booking/student_validation.py) and then written: one query preloads the chunk's existing emails and one its roll
+numbers, then new students are inserted and changed ones updated in batches
+(bulk_create / bulk_update; one prepared executemany each on SQLite, whose
+driver has no multi-row path), inside a transaction per chunk. Unchanged rows
+are not written at all, and the default password is hashed once per import
+rather than once per row. If the database rejects a chunk, its rows are
+retried one by one in savepoints so only the offending rows are reported.
+"""
+
+import csv
+import hashlib
+import os
+from dataclasses import asdict, dataclass
+
+from django.db import connection, transaction
+
+from .models import Student, DEFAULT_STUDENT_PASSWORD
+from .jobs import JobLost
+from .student_validation import REQUIRED_COLUMNS, clean_rows
+
+
+# Rows written per transaction
+CHUNK_SIZE = 1000
+
+# Rows per INSERT / UPDATE statement on the bulk_create / bulk_update path
+WRITE_BATCH_SIZE = 500
+
+# Failed rows kept in a job's checkpoint / result
+MAX_REPORTED_FAILURES = 50
+
+UPDATE_FIELDS = ['first_name', 'last_name', 'roll_no', 'dept', 'year', 'gender', 'phone_number']
+
+
+@dataclass
+class Outcome:
+    row_num: int
+    # 'created', 'updated', 'exists' (skipped without --update) or 'error'
+    status: str
+    message: str
+
+
+@dataclass
+class ImportStats:
+    created: int = 0
+    updated: int = 0
+    errors: int = 0
+
+    def add(self, outcome):
+        if outcome.status == 'created':
+            self.created += 1
+        elif outcome.status == 'updated':
+            self.updated += 1
+        else:
+            self.errors += 1
+
+    @property
+    def total(self):
+        return self.created + self.updated + self.errors
+
+
+class StudentImporter:
+    """Writes cleaned rows chunk by chunk; keeps the file-wide duplicate checks between chunks"""
+
+    def __init__(self, update_existing=False, dry_run=False):
+        self.update_existing = update_existing
+        self.dry_run = dry_run
+        self.default_password = None
+        # email / roll_no -> first row that used it in this file
+        self.seen_emails = {}
+        self.seen_roll_nos = {}
+
+    def import_chunk(self, cleaned_rows):
+        """
+        Import one chunk of (row_num, cleaned, error) and return its Outcomes in row order.
+        Rows that already failed validation are reported as errors without touching the database.
+        """
+        valid = [data for _, data, error in cleaned_rows if error is None]
+        # Plain tuples, not model instances: (email, id, *UPDATE_FIELDS)
+        existing = {
+            row[0]: row for row in Student.objects.filter(
+                email__in=[data['email'] for data in valid]
+            ).values_list('email', 'id', *UPDATE_FIELDS)
+        }
+        roll_owners = dict(
+            Student.objects.filter(roll_no__in=[data['roll_no'] for data in valid]).values_list('roll_no', 'email')
+        )
+
+        outcomes = []
+        to_create = []
+        to_update = []
+        for row_num, data, error in cleaned_rows:
+            if error is not None:
+                outcomes.append(Outcome(row_num, 'error', error))
+                continue
+            email = data['email']
+            roll_no = data['roll_no']
+
+            first_row = self.seen_emails.setdefault(email, row_num)
+            if first_row != row_num:
+                outcomes.append(Outcome(row_num, 'error', f'Duplicate email {email} (first seen on row {first_row})'))
+                continue
+            first_row = self.seen_roll_nos.setdefault(roll_no, row_num)
+            if first_row != row_num:
+                outcomes.append(Outcome(row_num, 'error', f'Duplicate roll number {roll_no} (first seen on row {first_row})'))
+                continue
+            owner = roll_owners.get(roll_no)
+            if owner is not None and owner != email:
+                outcomes.append(Outcome(row_num, 'error', f'Roll number {roll_no} already belongs to {owner}'))
+                continue
+
+            current = existing.get(email)
+            if current is not None:
+                if not self.update_existing:
+                    outcomes.append(Outcome(row_num, 'exists', f'Student {email} already exists (use --update to update)'))
+                    continue
+                values = [data[name] for name in UPDATE_FIELDS]
+                # A blank phone number keeps the one on file
+                if not data['phone_number']:
+                    values[-1] = current[-1]
+                if tuple(values) != current[2:]:
+                    to_update.append(values + [current[1]])
+                    outcomes.append(Outcome(row_num, 'updated', f'Updated student {email}'))
+                else:
+                    outcomes.append(Outcome(row_num, 'updated', f'Student {email} unchanged'))
+            else:
+                to_create.append(data)
+                outcomes.append(Outcome(row_num, 'created', f'Created student {email}'))
+
+        if not self.dry_run and (to_create or to_update):
+            with transaction.atomic():
+                self._insert(to_create)
+                self._update(to_update)
+                if to_update:
+                    # Raw updates skip the signal that bumps manifest versions (booking/versions.py)
+                    from . import versions
+                    from .models import Booking
+                    versions.bump_for_queryset(Booking.objects.filter(student_id__in=[row[-1] for row in to_update]))
+        return outcomes
+
+    def _insert(self, rows):
+        from django.contrib.auth.hashers import make_password
+        if not rows:
+            return
+        if self.default_password is None:
+            self.default_password = make_password(DEFAULT_STUDENT_PASSWORD)
+        if connection.vendor == 'sqlite':
+            self._insert_prepared(rows)
+            return
+        Student.objects.bulk_create(
+            [Student(password=self.default_password, has_default_password=True, **data) for data in rows],
+            batch_size=WRITE_BATCH_SIZE,
+        )
+
+    def _insert_prepared(self, rows):
+        """
+        INSERT the new students with one prepared executemany. On SQLite bulk_create compiles
+        every value through the ORM, which was most of the import time; here only the CSV
+        columns vary per row and every other column is prepared once per chunk.
+        """
+        from django.utils import timezone
+        constants = {'password': self.default_password, 'has_default_password': True, 'date_joined': timezone.now()}
+        fields = [f for f in Student._meta.concrete_fields if not f.primary_key]
+        prepared = {}
+        for f in fields:
+            if f.attname not in rows[0]:
+                value = constants[f.attname] if f.attname in constants else f.get_default()
+                prepared[f.attname] = f.get_db_prep_save(value, connection)
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(Student._meta.db_table),
+            ', '.join(connection.ops.quote_name(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        names = [f.attname for f in fields]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [[data.get(name, prepared.get(name)) for name in names] for data in rows])
+
+    def _update(self, rows):
+        """UPDATE changed students; rows are [*UPDATE_FIELDS values, id]"""
+        if not rows:
+            return
+        if connection.vendor == 'sqlite':
+            self._update_prepared(rows)
+            return
+        Student.objects.bulk_update(
+            [Student(pk=row[-1], **dict(zip(UPDATE_FIELDS, row))) for row in rows],
+            UPDATE_FIELDS, batch_size=WRITE_BATCH_SIZE,
+        )
+
+    def _update_prepared(self, rows):
+        """One prepared executemany; on SQLite bulk_update's CASE WHEN per field is the slow part"""
+        quote = connection.ops.quote_name
+        opts = Student._meta
+        sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+            quote(opts.db_table),
+            ', '.join(f'{quote(opts.get_field(name).column)} = %s' for name in UPDATE_FIELDS),
+            quote(opts.pk.column),
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+
+def iter_chunks(reader, chunk_size=CHUNK_SIZE, start=2):
+    """Group DictReader rows into lists of (row_num, row); row 1 is the header"""
+    chunk = []
+    for row_num, row in enumerate(reader, start=start):
+        chunk.append((row_num, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_rows(reader, importer, chunk_size=CHUNK_SIZE, start=2, position=None, on_chunk=None):
+    """
+    Run a DictReader through validation and the importer, yielding Outcomes in row order.
+
+    For checkpointing, position() is read as each chunk is cut (the file offset just past its
+    last row) and on_chunk(next_row, offset, outcomes) is called inside the chunk's transaction.
+    """
+    # Validation stays in this process: at a few microseconds per row it is cheaper than
+    # pickling the row to a worker process and back, so a process pool only slowed imports down
+    for chunk in iter_chunks(reader, chunk_size, start):
+        next_row, offset = chunk[-1][0] + 1, position() if position else None
+        cleaned = clean_rows(chunk)
+        try:
+            with transaction.atomic():
+                outcomes = importer.import_chunk(cleaned)
+                if on_chunk:
+                    on_chunk(next_row, offset, outcomes)
+        except JobLost:
+            raise
+        except Exception:
+            # The chunk's transaction was rolled back; find the rows the database rejects
+            with transaction.atomic():
+                outcomes = import_one_by_one(importer, cleaned)
+                if on_chunk:
+                    on_chunk(next_row, offset, outcomes)
+        yield from outcomes
+
+
+def import_one_by_one(importer, cleaned_rows):
+    """Import each row in its own savepoint, reporting database errors against that row only"""
+    outcomes = []
+    for cleaned in cleaned_rows:
+        try:
+            with transaction.atomic():
+                outcomes.extend(importer.import_chunk([cleaned]))
+        except Exception as e:
+            outcomes.append(Outcome(cleaned[0], 'error', f'Error processing row: {str(e)}'))
+    return outcomes
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def import_file(ctx, path, update_existing=False, chunk_size=CHUNK_SIZE):
+    """
+    Checkpointed import of a CSV file as a background job (task 'import_students').
+
+    After every committed chunk the job's checkpoint records the file offset and row number
+    just past it, plus the running totals; a re-run of the job seeks straight to that offset
+    instead of re-reading (and re-reporting) rows that are already in the database.
+    """
+    checkpoint = dict(ctx.job.checkpoint or {})
+    stats = ImportStats(**checkpoint.get('stats', {}))
+    failures = list(checkpoint.get('failures', []))
+    importer = StudentImporter(update_existing=update_existing)
+
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        size = os.fstat(file.fileno()).st_size
+        # readline() rather than iterating the file, which disables tell()
+        lines = iter(file.readline, '')
+        header = next(csv.reader(lines), None) or []
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in header]
+        if missing_columns:
+            raise ValueError(f'Missing required columns: {", ".join(missing_columns)}')
+        if checkpoint.get('offset'):
+            file.seek(checkpoint['offset'])
+        reader = csv.DictReader(lines, fieldnames=header)
+        ctx.progress(total=size, message=f"Resuming at row {checkpoint['next_row']}" if checkpoint else None, force=True)
+
+        def save(next_row, offset, outcomes):
+            for outcome in outcomes:
+                stats.add(outcome)
+                if outcome.status not in ('created', 'updated') and len(failures) < MAX_REPORTED_FAILURES:
+                    failures.append(f'Row {outcome.row_num}: {outcome.message}')
+            ctx.save_checkpoint(
+                {'offset': offset, 'next_row': next_row, 'stats': asdict(stats), 'failures': failures},
+                done=min(offset, size),
+                message=f'{stats.total} row(s) processed',
+            )
+
+        for outcome in import_rows(reader, importer, chunk_size, start=checkpoint.get('next_row', 2),
+                                   position=file.tell, on_chunk=save):
+            ctx.log(outcome)
+
+    result = asdict(stats)
+    if failures:
+        result['failures'] = failures
+    return result
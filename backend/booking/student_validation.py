@@ -0,0 +1,63 @@
+"""
+Row validation for student CSV imports.
+
+Free of Django imports and database access, so the importer and
+fix_csv_import.py share one set of rules and a dry run validates a file
+without touching the database.
+"""
+
+
+REQUIRED_COLUMNS = ['first_name', 'last_name', 'email', 'roll_no', 'dept', 'year', 'gender']
+
+
+class RowError(ValueError):
+    """A row that cannot be imported; the message is reported against its row number"""
+
+
+def clean_row(row):
+    """Normalize and validate one CSV row (no database access); raises RowError"""
+    email = (row.get('email') or '').strip().lower()
+    first_name = (row.get('first_name') or '').strip()
+    last_name = (row.get('last_name') or '').strip()
+    roll_no = (row.get('roll_no') or '').strip()
+    dept = (row.get('dept') or '').strip()
+    year = (row.get('year') or '').strip()
+    gender = (row.get('gender') or '').strip().upper()
+    phone_number = (row.get('phone_number') or '').strip()
+
+    # Validate required fields
+    if not all([email, first_name, last_name, roll_no, dept, year, gender]):
+        raise RowError('Missing required fields')
+    # Validate email format
+    if '@' not in email:
+        raise RowError(f'Invalid email format: {email}')
+    # Validate year
+    if year not in ['1', '2', '3', '4']:
+        raise RowError(f'Invalid year: {year}. Must be 1, 2, 3, or 4')
+    # Validate gender
+    if gender not in ['M', 'F', 'O']:
+        raise RowError(f'Invalid gender: {gender}. Must be M, F, or O')
+
+    return {
+        'email': email,
+        'first_name': first_name,
+        'last_name': last_name,
+        'roll_no': roll_no,
+        'dept': dept,
+        'year': year,
+        'gender': gender,
+        'phone_number': phone_number,
+    }
+
+
+def clean_rows(numbered_rows):
+    """Clean a list of (row_num, row); returns (row_num, cleaned, error) in the same order"""
+    results = []
+    for row_num, row in numbered_rows:
+        try:
+            results.append((row_num, clean_row(row), None))
+        except RowError as e:
+            results.append((row_num, None, str(e)))
+        except Exception as e:
+            results.append((row_num, None, f'Error processing row: {e}'))
+    return results
@@ -0,0 +1,152 @@
+"""Background job tasks behind the slow admin actions (see booking/jobs.py)"""
+
+from .jobs import task
+from . import otp as otp_service
+
+
+# Keep the stored failure list readable on huge selections
+MAX_REPORTED_FAILURES = 50
+
+# Tasks that issue OTPs from the run_jobs process; the web workers verify them, so the
+# store has to be one every process sees (otp.get_otp_store() refuses anything else)
+OTP_TASKS = {'send_password_reset_otps', 'resend_booking_otps', 'resend_password_reset_otps'}
+
+# Lifetime of the OTPs these tasks issue
+OTP_MINUTES = 15
+
+
+def _report(result, failures, already_sent=0):
+    if failures:
+        result['failures'] = failures[:MAX_REPORTED_FAILURES]
+        result['failed'] = len(failures)
+    if already_sent:
+        result['already_sent'] = already_sent
+    return result
+
+
+def _sent_by_this_job(ctx, store, purpose, subject_id, minutes):
+    """
+    Whether the subject's current OTP was issued after this job was queued, i.e. by an earlier
+    attempt that died between sending the email and saving its progress. Skipping those keeps
+    a requeued job from emailing the same student twice.
+    """
+    from datetime import timedelta
+    record = store.get(purpose, subject_id)
+    return record is not None and record.expires_at - timedelta(minutes=minutes) >= ctx.job.created_at
+
+
+@task('send_password_reset_otps', 'Send forgot password OTPs')
+def send_password_reset_otps(ctx, ids):
+    from .models import Student
+    store = otp_service.get_otp_store()
+    students = Student.objects.in_bulk(ids)
+    sent = 0
+    already_sent = 0
+    failures = []
+    for pk in ctx.iterate(ids, save_each=True):
+        student = students.get(pk)
+        if student is None:
+            continue
+        if _sent_by_this_job(ctx, store, otp_service.PASSWORD_RESET, student.pk, OTP_MINUTES):
+            already_sent += 1
+            continue
+        try:
+            otp_service.issue_password_reset_otp(student, minutes=OTP_MINUTES, store=store)
+            sent += 1
+        except Exception as e:
+            failures.append(f"{student.email}: {e}")
+        ctx.progress(message=f"Sent {sent} OTP(s)")
+    return _report({'sent': sent}, failures, already_sent)
+
+
+@task('set_default_passwords', 'Set default passwords')
+def set_default_passwords(ctx, ids):
+    from django.contrib.auth.hashers import make_password
+    from .models import Student, DEFAULT_STUDENT_PASSWORD
+    # Hash once; every selected student without a password gets the same encoded value
+    default_password = make_password(DEFAULT_STUDENT_PASSWORD)
+    updated = 0
+    for chunk in ctx.iterate(ids, chunk_size=500):
+        updated += Student.objects.filter(pk__in=chunk, password='').update(
+            password=default_password, has_default_password=True
+        )
+        ctx.progress(message=f"Updated {updated} student(s)")
+    return {'updated': updated}
+
+
+@task('resend_booking_otps', 'Resend booking OTPs')
+def resend_booking_otps(ctx, ids):
+    from django.utils import timezone
+    from .models import BookingOTP
+    store = otp_service.get_otp_store()
+    otps = BookingOTP.objects.select_related('booking__student', 'booking__bus').in_bulk(ids)
+    sent = 0
+    already_sent = 0
+    failures = []
+    for pk in ctx.iterate(ids, save_each=True):
+        otp = otps.get(pk)
+        # Only entries that are still expired; another job may already have refreshed them
+        if otp is None or otp.expires_at >= timezone.now():
+            continue
+        if _sent_by_this_job(ctx, store, otp_service.BOOKING, otp.booking_id, OTP_MINUTES):
+            already_sent += 1
+            continue
+        try:
+            otp_service.issue_booking_otp(otp.booking, minutes=OTP_MINUTES, resend=True, store=store)
+            sent += 1
+        except Exception as e:
+            failures.append(f"Booking {otp.booking_id}: {e}")
+        ctx.progress(message=f"Resent {sent} OTP(s)")
+    return _report({'sent': sent}, failures, already_sent)
+
+
+@task('resend_password_reset_otps', 'Resend password reset OTPs')
+def resend_password_reset_otps(ctx, ids):
+    from django.utils import timezone
+    from .models import PasswordResetOTP
+    store = otp_service.get_otp_store()
+    otps = PasswordResetOTP.objects.select_related('student').in_bulk(ids)
+    sent = 0
+    already_sent = 0
+    failures = []
+    for pk in ctx.iterate(ids, save_each=True):
+        otp = otps.get(pk)
+        if otp is None or otp.used or otp.expires_at >= timezone.now():
+            continue
+        if _sent_by_this_job(ctx, store, otp_service.PASSWORD_RESET, otp.student_id, OTP_MINUTES):
+            already_sent += 1
+            continue
+        try:
+            otp_service.issue_password_reset_otp(otp.student, minutes=OTP_MINUTES, store=store)
+            sent += 1
+        except Exception as e:
+            failures.append(f"{otp.student.email}: {e}")
+        ctx.progress(message=f"Resent {sent} OTP(s)")
+    return _report({'sent': sent}, failures, already_sent)
+
+
+@task('import_students', 'Import students from CSV')
+def import_students(ctx, path=None, update_existing=False, chunk_size=1000, upload=None):
+    """
+    Import a local CSV file (``path``, from the import_students command, which runs the job
+    itself) or an admin upload (``upload``, a default_storage name any worker node can read).
+    The upload is copied to a local temp file for the seekable checkpointed reader and
+    deleted from storage once the import finishes; a failed job keeps it for the retry.
+    """
+    import os
+    import shutil
+    import tempfile
+    from django.core.files.storage import default_storage
+    from .student_import import import_file
+    if upload is None:
+        return import_file(ctx, path, update_existing=update_existing, chunk_size=chunk_size)
+
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as local:
+        with default_storage.open(upload, 'rb') as stored:
+            shutil.copyfileobj(stored, local)
+    try:
+        result = import_file(ctx, local.name, update_existing=update_existing, chunk_size=chunk_size)
+    finally:
+        os.unlink(local.name)
+    default_storage.delete(upload)
+    return result
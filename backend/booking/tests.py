@@ -0,0 +1,1248 @@
+import os
+from datetime import date, time, timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Student, Bus, Booking, Stop, SiteConfiguration
+
+
+def make_students(count, start=0):
+    return Student.objects.bulk_create([
+        Student(
+            email=f'student{i}@example.com',
+            first_name='Student',
+            last_name=str(i),
+            phone_number='9999999999',
+            year='2',
+            roll_no=f'ROLL{i:05d}',
+            dept='CSE',
+            gender='M',
+        )
+        for i in range(start, start + count)
+    ])
+
+
+class AuthTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = make_students(1)[0]
+        self.student.set_password('Secret@123')
+        self.student.save()
+        self.url = reverse('current_user')
+
+    def get(self, token):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_token_authenticates_until_it_expires(self):
+        from unittest import mock
+        from .authentication import issue_token
+        token = issue_token(self.student)
+        self.assertEqual(self.get(token).json()['email'], self.student.email)
+        with self.settings(AUTH_TOKEN_MAX_AGE=60), \
+                mock.patch('django.core.signing.time.time', return_value=timezone.now().timestamp() + 61):
+            response = self.get(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['detail'], 'Token has expired.')
+
+    def test_tampered_token_is_rejected(self):
+        from django.core import signing
+        from .authentication import TOKEN_SALT, issue_token
+        token = issue_token(self.student)
+        self.assertEqual(self.get(token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')).status_code, 401)
+        # A payload for another user signed with a different key
+        forged = signing.dumps({'uid': self.student.pk, 'sah': '', 'gen': 0}, key='not-the-secret', salt=TOKEN_SALT)
+        self.assertEqual(self.get(forged).json()['detail'], 'Invalid token.')
+
+    def test_password_change_and_logout_revoke_earlier_tokens(self):
+        from .authentication import issue_token
+        token = issue_token(self.student)
+        self.student.set_password('Changed@123')
+        self.student.save()
+        self.assertEqual(self.get(token).json()['detail'], 'Token is no longer valid.')
+
+        token = issue_token(self.student)
+        response = self.client.post(reverse('logout'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(token).json()['detail'], 'Token has been revoked.')
+        self.student.refresh_from_db()
+        self.assertEqual(self.get(issue_token(self.student)).status_code, 200)
+
+    def test_basic_auth_is_not_accepted(self):
+        import base64
+        credentials = base64.b64encode(f'{self.student.email}:Secret@123'.encode()).decode()
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(response.status_code, 401)
+
+
+class LoginRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = make_students(1)[0]
+        self.student.set_password('Secret@123')
+        self.student.save()
+        SiteConfiguration.objects.create(allowed_years=['2'])
+
+    def login(self, password='wrong', **extra):
+        return self.client.post(reverse('login'), {'email': self.student.email, 'password': password}, **extra)
+
+    def test_login_body_that_is_not_an_object_is_rejected(self):
+        for body in ('[]', '"student0@example.com"', '{"email": ["x"], "password": "p"}'):
+            response = self.client.post(reverse('login'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_client_ip_is_the_hop_appended_by_the_trusted_proxy(self):
+        from .ratelimit import get_client_ip
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(get_client_ip(request), '10.0.0.1')
+        self.assertEqual(get_client_ip(request, trust_forwarded=True), '203.0.113.7')
+        self.assertEqual(get_client_ip(request, trust_forwarded=True, proxy_count=2), '6.6.6.6')
+
+    def test_spoofed_forwarded_for_does_not_escape_the_ip_limit(self):
+        limits = {'WINDOW_SECONDS': 300, 'EMAIL_LIMIT': 100, 'IP_LIMIT': 3, 'TRUST_X_FORWARDED_FOR': True}
+        with self.settings(LOGIN_RATE_LIMIT=limits):
+            for i in range(3):
+                self.assertEqual(self.login(HTTP_X_FORWARDED_FOR=f'10.9.9.{i}, 203.0.113.7').status_code, 400)
+            response = self.login(HTTP_X_FORWARDED_FOR='10.9.9.99, 203.0.113.7')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertIn('Too many login attempts', response.json()['errors']['non_field_errors'][0])
+
+    def test_email_limit_blocks_before_hashing_and_success_resets_it(self):
+        from unittest import mock
+        from .models import RateLimitCounter
+        with self.settings(LOGIN_RATE_LIMIT={'EMAIL_LIMIT': 2, 'IP_LIMIT': 100}):
+            self.login()
+            self.assertEqual(self.login('Secret@123').status_code, 200)
+            self.login()
+            self.login()
+            with mock.patch('django.contrib.auth.hashers.PBKDF2PasswordHasher.verify') as verify:
+                response = self.login('Secret@123')
+            self.assertEqual(response.status_code, 429)
+            verify.assert_not_called()
+        # Without a shared cache the counters live in the database, so every worker sees them
+        self.assertTrue(RateLimitCounter.objects.exists())
+
+    def test_stats_are_shared_by_every_worker(self):
+        from .ratelimit import get_stats
+        with self.settings(LOGIN_RATE_LIMIT={'EMAIL_LIMIT': 1, 'IP_LIMIT': 100}):
+            self.login()
+            self.login()
+        cache.clear()  # another worker's LocMemCache
+        stats = get_stats()
+        self.assertEqual((stats['attempts'], stats['blocked'], stats['blocked_email']), (2, 1, 1))
+
+    def test_cache_errors_fall_back_to_the_database(self):
+        from unittest import mock
+        from .models import RateLimitCounter
+        from .ratelimit import SlidingWindowLimiter, get_stats
+        limiter = SlidingWindowLimiter('ip', limit=2, window=60)
+        with mock.patch('booking.versions.cache_is_shared', return_value=True), \
+                mock.patch('booking.ratelimit.cache.incr', side_effect=ConnectionError), \
+                mock.patch('booking.ratelimit.cache.get_many', side_effect=ConnectionError):
+            limiter.hit('198.51.100.1', now=1000)
+            limiter.hit('198.51.100.1', now=1001)
+            self.assertEqual(limiter.check('198.51.100.1', now=1002), (False, 18))
+            self.assertEqual(get_stats()['db_fallback'], 3)
+        self.assertEqual(RateLimitCounter.objects.get(key__contains=':ip:').count, 2)
+
+
+class SiteConfigurationCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        SiteConfiguration.invalidate_cache()
+        SiteConfiguration.objects.create(pk=1, allowed_years=['2'])
+        self.addCleanup(SiteConfiguration.invalidate_cache)
+
+    def get_solo_at(self, now):
+        from unittest import mock
+        with mock.patch('booking.models.time.monotonic', return_value=now):
+            return SiteConfiguration.get_solo()
+
+    def test_save_in_this_process_is_seen_immediately(self):
+        self.assertEqual(self.get_solo_at(100).allowed_years, ['2'])
+        config = SiteConfiguration.objects.get(pk=1)
+        config.allowed_years = ['3']
+        config.save()
+        self.assertEqual(self.get_solo_at(100.1).allowed_years, ['3'])
+
+    def test_private_cache_rereads_the_row_after_the_local_ttl(self):
+        self.assertEqual(self.get_solo_at(100).allowed_years, ['2'])
+        # Another worker saved: its invalidation never reaches this process's LocMem cache
+        SiteConfiguration.objects.filter(pk=1).update(allowed_years=['4'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_solo_at(100.5).allowed_years, ['2'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_solo_at(101.5).allowed_years, ['4'])
+
+    def test_shared_cache_reloads_when_another_worker_bumps_the_version(self):
+        from unittest import mock
+        with mock.patch('booking.versions.cache_is_shared', return_value=True):
+            self.assertEqual(self.get_solo_at(100).allowed_years, ['2'])
+            SiteConfiguration.objects.filter(pk=1).update(allowed_years=['4'])
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get_solo_at(101.5).allowed_years, ['2'])
+            # What save() in another worker publishes to the shared cache
+            cache.set(SiteConfiguration.CACHE_VERSION_KEY, 'other-worker', None)
+            self.assertEqual(self.get_solo_at(101.7).allowed_years, ['2'])
+            self.assertEqual(self.get_solo_at(103).allowed_years, ['4'])
+
+
+class OTPStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.student = make_students(1)[0]
+
+    def test_default_store_is_the_database_unless_the_cache_is_shared(self):
+        from unittest import mock
+        from django.core.exceptions import ImproperlyConfigured
+        from . import otp
+        with self.settings(OTP_STORE_BACKEND=''):
+            self.assertIsInstance(otp.get_otp_store(), otp.DatabaseOTPStore)
+            with mock.patch('booking.versions.cache_is_shared', return_value=True):
+                self.assertIsInstance(otp.get_otp_store(), otp.CacheOTPStore)
+        with self.settings(OTP_STORE_BACKEND='cache'):
+            with self.assertRaises(ImproperlyConfigured):
+                otp.get_otp_store()
+
+    def test_issue_verify_consume_and_expiry(self):
+        from unittest import mock
+        from . import otp
+        for store in (otp.DatabaseOTPStore(), otp.CacheOTPStore()):
+            with self.subTest(store=type(store).__name__):
+                first = store.issue(otp.PASSWORD_RESET, self.student.pk, 15)
+                record = store.issue(otp.PASSWORD_RESET, self.student.pk, 15)
+                current = store.get(otp.PASSWORD_RESET, self.student.pk)
+                # Issuing again replaces the previous OTP
+                self.assertNotEqual(current.id, first.id)
+                self.assertEqual(current.code, record.code)
+                self.assertEqual(current.verify('000000' if record.code != '000000' else '111111'), (False, 'Invalid OTP'))
+                self.assertEqual(current.verify(record.code), (True, 'OTP verified successfully'))
+
+                store.mark_verified(otp.PASSWORD_RESET, self.student.pk, current)
+                self.assertTrue(store.get(otp.PASSWORD_RESET, self.student.pk).verified)
+                store.consume(otp.PASSWORD_RESET, self.student.pk, current)
+                self.assertIsNone(store.get(otp.PASSWORD_RESET, self.student.pk))
+
+                record = store.issue(otp.PASSWORD_RESET, self.student.pk, 15)
+                later = timezone.now() + timedelta(minutes=16)
+                with mock.patch('booking.otp.timezone.now', return_value=later):
+                    current = store.get(otp.PASSWORD_RESET, self.student.pk)
+                    self.assertEqual(current.verify(record.code), (False, 'OTP has expired'))
+
+
+class AdminChangelistTestCase(TestCase):
+    """Base for changelist query-budget tests: logs in a superuser with a clean cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = Student.objects.create_superuser(
+            email='admin@example.com', password='secret', first_name='Admin',
+            last_name='User', roll_no='ADMIN', year='4', gender='M',
+        )
+        self.client.force_login(self.admin_user)
+        self.bus = Bus.objects.create(
+            bus_no='TN01', route_name='Route A', departure_time=time(7, 30), capacity=50,
+        )
+
+    def changelist_queries(self, url_name):
+        # Measure cold: cached admin lookups would otherwise hide queries on the first page only
+        cache.clear()
+        url = reverse(url_name)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+
+class StudentAdminQueryCountTests(AdminChangelistTestCase):
+    # Session, user, counts, page rows and admin chrome; per-row queries would blow well past this
+    QUERY_BUDGET = 10
+
+    def add_students_with_bookings(self, count):
+        students = make_students(count, start=Student.objects.count())
+        tomorrow = date.today() + timedelta(days=1)
+        Booking.objects.bulk_create([
+            Booking(student=student, bus=self.bus, trip_date=tomorrow, status='confirmed')
+            for student in students[::2]
+        ])
+
+    def test_changelist_query_count_is_independent_of_row_count(self):
+        self.add_students_with_bookings(100)
+        response, queries_100 = self.changelist_queries('admin:booking_student_changelist')
+        self.assertContains(response, 'ROLL00001')
+
+        self.add_students_with_bookings(900)
+        _, queries_1000 = self.changelist_queries('admin:booking_student_changelist')
+
+        self.assertEqual(queries_100, queries_1000)
+        self.assertLessEqual(queries_1000, self.QUERY_BUDGET)
+
+    def test_annotation_matches_model_method(self):
+        past, future, cancelled = make_students(3)
+        Booking.objects.bulk_create([
+            Booking(student=past, bus=self.bus, trip_date=date.today() - timedelta(days=1), status='confirmed'),
+            Booking(student=future, bus=self.bus, trip_date=date.today() + timedelta(days=1), status='pending'),
+            Booking(student=cancelled, bus=self.bus, trip_date=date.today() + timedelta(days=1), status='cancelled'),
+        ])
+        from django.contrib.admin.sites import site
+        model_admin = site._registry[Student]
+        request = RequestFactory().get('/')
+        request.user = self.admin_user
+        annotated = {s.pk: model_admin.has_active_booking(s) for s in model_admin.get_queryset(request)}
+        for student in (past, future, cancelled):
+            self.assertEqual(annotated[student.pk], student.has_active_booking())
+        self.assertTrue(annotated[future.pk])
+        self.assertFalse(annotated[past.pk])
+
+
+class BookingAdminQueryCountTests(AdminChangelistTestCase):
+    # Session, user, counts, date hierarchy, page rows and admin chrome,
+    # plus the data-version read (a DataVersion row, as the test cache is not shared)
+    QUERY_BUDGET = 13
+
+    def add_bookings(self, count):
+        from .models import Stop
+        stop, _ = Stop.objects.get_or_create(bus=self.bus, stop_name='Gate', location='Main Gate')
+        tomorrow = date.today() + timedelta(days=1)
+        students = make_students(count, start=Student.objects.count())
+        Booking.objects.bulk_create([
+            Booking(student=student, bus=self.bus, selected_stop=stop, trip_date=tomorrow, status='confirmed')
+            for student in students
+        ])
+
+    def test_changelist_query_count_is_fixed_per_page(self):
+        from . import versions
+        # Version rows outlive the cache flush in changelist_queries; create it up front
+        versions.get_version()
+        self.add_bookings(10)
+        response, queries_10 = self.changelist_queries('admin:booking_booking_changelist')
+        self.assertContains(response, 'TN01 - Route A')
+
+        self.add_bookings(90)
+        _, queries_100 = self.changelist_queries('admin:booking_booking_changelist')
+
+        self.assertEqual(queries_10, queries_100)
+        self.assertLessEqual(queries_100, self.QUERY_BUDGET)
+
+    def test_changelist_cancels_completed_outbound_bookings(self):
+        student, = make_students(1, start=Student.objects.count())
+        booking = Booking.objects.create(
+            student=student, bus=self.bus, status='confirmed', is_outbound_trip=True,
+            return_trip_available_after=timezone.now() - timedelta(minutes=1),
+        )
+        # Only the bookings on the page being viewed are cancelled
+        self.client.get(reverse('admin:booking_booking_changelist'), {'is_outbound_trip__exact': '0'})
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'confirmed')
+        response, _ = self.changelist_queries('admin:booking_booking_changelist')
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+        # The rendered row shows the new status too
+        self.assertEqual(response.context_data['cl'].result_list[0].status, 'cancelled')
+
+
+class RouteDemandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bus_a = Bus.objects.create(bus_no='A1', route_name='Route A', departure_time=time(7, 30), capacity=2)
+        self.bus_b = Bus.objects.create(bus_no='A2', route_name='Route A', departure_time=time(8, 0), capacity=2)
+        self.bus_c = Bus.objects.create(bus_no='C1', route_name='Route C', departure_time=time(8, 0), capacity=2)
+
+    def test_route_demand_matches_per_bus_methods(self):
+        today = date.today()
+        students = make_students(6)
+        Booking.objects.bulk_create([
+            Booking(student=students[0], bus=self.bus_a, trip_date=today + timedelta(days=1), status='confirmed'),
+            Booking(student=students[1], bus=self.bus_b, trip_date=today + timedelta(days=1), status='confirmed'),
+            Booking(student=students[2], bus=self.bus_b, trip_date=today + timedelta(days=1), status='confirmed'),
+            Booking(student=students[3], bus=self.bus_a, trip_date=today + timedelta(days=3), status='confirmed'),
+            Booking(student=students[4], bus=self.bus_c, trip_date=today - timedelta(days=2), status='confirmed'),
+            Booking(student=students[5], bus=self.bus_c, trip_date=today - timedelta(days=5), status='confirmed'),
+        ])
+
+        with self.assertNumQueries(2):
+            demand = Bus.route_demand(['Route A', 'Route C', 'Route Z'])
+
+        self.assertEqual(demand['Route A'], (today + timedelta(days=1), 3))
+        self.assertEqual(demand['Route C'], (today - timedelta(days=2), 1))
+        self.assertEqual(demand['Route Z'], (None, 0))
+        self.assertEqual(self.bus_a.confirmed_bookings_for_route_on_date(), 3)
+        self.assertEqual(self.bus_a.required_buses_for_route_on_date(), 2)
+
+
+class TripDateFilterTests(AdminChangelistTestCase):
+    def lookups(self):
+        from django.contrib.admin.sites import site
+        from .admin import DateFilter
+        request = RequestFactory().get('/')
+        request.user = self.admin_user
+        date_filter = DateFilter(request, {}, Booking, site._registry[Booking])
+        return dict(date_filter.lookup_choices)
+
+    def test_index_is_cached_until_a_booking_is_written(self):
+        today = timezone.localdate()
+        student, other = make_students(2)
+        Booking.objects.create(student=student, bus=self.bus, trip_date=today)
+        self.lookups()
+        # Only the data version is read (from DataVersion, as the test cache is not shared)
+        with self.assertNumQueries(1):
+            choices = self.lookups()
+        self.assertIn(today.strftime('%Y-%m-%d'), choices)
+
+        old = today - timedelta(days=90)
+        Booking.objects.create(student=other, bus=self.bus, trip_date=old)
+        choices = self.lookups()
+        # Dates outside the window collapse into a month range
+        self.assertNotIn(old.strftime('%Y-%m-%d'), choices)
+        self.assertIn(old.strftime('%Y-%m'), choices)
+
+    def test_month_range_filters_changelist(self):
+        old = timezone.localdate() - timedelta(days=90)
+        student, = make_students(1)
+        Booking.objects.create(student=student, bus=self.bus, trip_date=old)
+        response = self.client.get(
+            reverse('admin:booking_booking_changelist'), {'trip_date': old.strftime('%Y-%m')}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context_data['cl'].result_count, 1)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        bus = Bus.objects.create(bus_no='TN01', route_name='Route A', departure_time=time(7, 30), capacity=50)
+        Booking.objects.bulk_create([
+            Booking(student=student, bus=bus, trip_date=date.today() + timedelta(days=i % 5))
+            for i, student in enumerate(make_students(60))
+        ])
+
+    def paginator(self, queryset, **thresholds):
+        from .pagination import EstimatedCountPaginator
+        paginator = EstimatedCountPaginator(queryset, 7)
+        for name, value in thresholds.items():
+            setattr(paginator, name, value)
+        return paginator
+
+    def test_seek_pages_match_offset_pages(self):
+        queryset = Booking.objects.order_by('-trip_date', '-pk')
+        offset = self.paginator(queryset)
+        seek = self.paginator(queryset, seek_offset_threshold=0)
+        for number in offset.page_range:
+            self.assertEqual(
+                [b.pk for b in seek.page(number)],
+                [b.pk for b in offset.page(number)],
+            )
+        # The OFFSET only runs over the ordering columns; whole rows are read for the page alone
+        with CaptureQueriesContext(connection) as ctx:
+            list(seek.page(5))
+        boundary, rows = [q['sql'] for q in ctx.captured_queries]
+        self.assertIn('OFFSET', boundary)
+        self.assertNotIn('student_id', boundary)
+        self.assertNotIn('OFFSET', rows)
+
+    def test_unfiltered_count_uses_table_statistics(self):
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = self.paginator(Booking.objects.order_by('-pk'), estimate_threshold=10)
+        with self.assertNumQueries(2):
+            self.assertEqual(paginator.count, 60)
+        # Filtered lists still get an exact count
+        filtered = self.paginator(Booking.objects.filter(trip_date=date.today()).order_by('-pk'), estimate_threshold=10)
+        self.assertEqual(filtered.count, 12)
+
+
+class BackgroundJobTests(AdminChangelistTestCase):
+    def test_admin_action_queues_job_and_worker_runs_it(self):
+        from django.core.management import call_command
+        from .models import BackgroundJob
+        students = make_students(3)
+        response = self.client.post(reverse('admin:booking_student_changelist'), {
+            'action': 'set_default_passwords',
+            '_selected_action': [s.pk for s in students],
+        })
+        job = BackgroundJob.objects.get()
+        self.assertRedirects(response, reverse('admin:booking_backgroundjob_progress', args=[job.pk]))
+        self.assertEqual((job.status, job.total), ('queued', 3))
+        self.assertContains(self.client.get(response.url), 'Set default passwords')
+
+        call_command('run_jobs', '--once', stdout=open(os.devnull, 'w'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done, job.result), ('succeeded', 3, {'updated': 3}))
+        self.assertEqual(Student.objects.filter(pk__in=[s.pk for s in students], has_default_password=True).count(), 3)
+        status = self.client.get(reverse('admin:booking_backgroundjob_status', args=[job.pk])).json()
+        self.assertTrue(status['finished'])
+        # The job list (and its retry action) is reachable from the admin index
+        self.assertContains(self.client.get(reverse('admin:index')), reverse('admin:booking_backgroundjob_changelist'))
+
+    def test_otp_jobs_write_otps_the_web_workers_can_read(self):
+        from django.core import mail
+        from django.core.management import call_command
+        from .models import BackgroundJob, PasswordResetOTP
+        students = make_students(2)
+        action = {'action': 'send_forgot_password_otp', '_selected_action': [s.pk for s in students]}
+
+        # A cache-backed store on a per-process cache would strand the OTPs in run_jobs
+        with self.settings(OTP_STORE_BACKEND='cache'):
+            response = self.client.post(reverse('admin:booking_student_changelist'), action, follow=True)
+        self.assertFalse(BackgroundJob.objects.exists())
+        self.assertContains(response, 'was not queued')
+
+        self.client.post(reverse('admin:booking_student_changelist'), action)
+        call_command('run_jobs', '--once', stdout=open(os.devnull, 'w'))
+        self.assertEqual(BackgroundJob.objects.get().result, {'sent': 2})
+        self.assertEqual(PasswordResetOTP.objects.filter(student__in=students, used=False).count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_requeued_otp_job_does_not_email_students_twice(self):
+        from django.core import mail
+        from django.core.management import call_command
+        from . import jobs, otp
+        students = make_students(3)
+        job = jobs.enqueue('send_password_reset_otps', total=3, ids=[s.pk for s in students])
+        # The first attempt emailed student 0 and died before its progress was saved
+        otp.issue_password_reset_otp(students[0])
+        mail.outbox.clear()
+
+        call_command('run_jobs', '--once', stdout=open(os.devnull, 'w'))
+        job.refresh_from_db()
+        self.assertEqual(job.result, {'sent': 2, 'already_sent': 1})
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [s.email for s in students[1:]])
+
+    def test_side_effect_tasks_save_progress_after_every_item(self):
+        from .jobs import JobContext, claim_next_job, enqueue
+        from .models import BackgroundJob
+        students = make_students(3)
+        enqueue('set_default_passwords', total=3, ids=[s.pk for s in students])
+        ctx = JobContext(claim_next_job('test-worker'), 'test-worker')
+        for done, _ in enumerate(ctx.iterate([s.pk for s in students], save_each=True)):
+            self.assertEqual(BackgroundJob.objects.get().done, done)
+
+    def test_admin_csv_upload_resumes_the_unfinished_job_for_the_same_file(self):
+        import tempfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.core.management import call_command
+        from .models import BackgroundJob
+        content = ImportStudentsCommandTests.HEADER + ''.join(
+            f'Student,{i},student{i}@example.com,9999999999,2,ROLL{i:05d},CSE,M\n' for i in range(3)
+        )
+        url = reverse('admin:student_import_csv')
+        self.assertContains(self.client.get(reverse('admin:booking_student_changelist')), url)
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            response = self.client.post(url, {'csv_file': SimpleUploadedFile('students.csv', content.encode())})
+            job = BackgroundJob.objects.get()
+            self.assertRedirects(response, reverse('admin:booking_backgroundjob_progress', args=[job.pk]))
+
+            # The worker died after the first chunk; the same upload picks that job up again
+            BackgroundJob.objects.filter(pk=job.pk).update(
+                status='failed', checkpoint={'offset': 1, 'next_row': 3}
+            )
+            self.client.post(url, {'csv_file': SimpleUploadedFile('copy.csv', content.encode())})
+            job.refresh_from_db()
+            self.assertEqual((BackgroundJob.objects.count(), job.status), (1, 'queued'))
+
+            # The payload names the file in shared storage, not a path on this node
+            stored = os.path.join(media_root, job.payload['upload'])
+            self.assertTrue(os.path.exists(stored))
+
+            BackgroundJob.objects.filter(pk=job.pk).update(checkpoint={})
+            call_command('run_jobs', '--once', stdout=open(os.devnull, 'w'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.result['created']), ('succeeded', 3))
+            self.assertFalse(os.path.exists(stored))
+
+        response = self.client.post(url, {'csv_file': SimpleUploadedFile('bad.csv', b'email\nx@example.com\n')})
+        self.assertContains(response, 'Missing required columns')
+
+    def test_payload_keys_from_older_releases_are_ignored(self):
+        from django.core.management import call_command
+        from .jobs import enqueue
+        job = enqueue('set_default_passwords', ids=[], workers=4)
+        call_command('run_jobs', '--once', stdout=open(os.devnull, 'w'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+
+    def test_job_is_claimed_by_one_worker_only(self):
+        from . import jobs
+        job = jobs.enqueue('set_default_passwords', ids=[])
+        self.assertEqual(jobs.claim_next_job('node-a:1').pk, job.pk)
+        self.assertIsNone(jobs.claim_next_job('node-b:1'))
+
+    def test_stale_job_is_requeued_and_old_worker_is_fenced_off(self):
+        from datetime import timedelta as td
+        from . import jobs
+        from .models import BackgroundJob
+        job = jobs.enqueue('set_default_passwords', ids=[])
+        claimed = jobs.claim_next_job('node-a:1')
+        BackgroundJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - td(hours=1))
+
+        self.assertEqual(jobs.requeue_stale_jobs(), (1, 0))
+        self.assertEqual(jobs.claim_next_job('node-b:1').pk, job.pk)
+        with self.assertRaises(jobs.JobLost):
+            jobs.JobContext(claimed, 'node-a:1').progress(done=1, force=True)
+
+
+class GoActionTests(AdminChangelistTestCase):
+    def test_summary_comes_from_one_aggregate_on_all_matching_selection(self):
+        from django.contrib.admin.sites import site
+        from django.contrib.messages.storage.fallback import FallbackStorage
+        from .admin import go_action
+        students = make_students(5)
+        Student.objects.filter(pk=students[0].pk).update(is_active=False)
+
+        model_admin = site._registry[Student]
+        request = RequestFactory().post('/')
+        request.user = self.admin_user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        with self.assertNumQueries(1):
+            go_action(model_admin, request, model_admin.get_queryset(request))
+
+        # 5 students plus the admin user
+        self.assertEqual(
+            [str(m) for m in request._messages],
+            ['Selected 6 students (5 active, 1 inactive)'],
+        )
+
+
+class TripListPageTests(AdminChangelistTestCase):
+    def test_pickup_page_groups_by_bus_and_loads_rows_per_group(self):
+        from .models import Stop
+        other_bus = Bus.objects.create(bus_no='TN02', route_name='Route B', departure_time=time(8, 0), capacity=50)
+        stop = Stop.objects.create(bus=self.bus, stop_name='Gate', location='Main Gate')
+        today = date.today()
+        students = make_students(60)
+        Booking.objects.bulk_create(
+            [Booking(student=s, bus=self.bus, selected_stop=stop, trip_date=today, status='confirmed') for s in students[:55]]
+            + [Booking(student=s, bus=other_bus, trip_date=today, status='pending') for s in students[55:]]
+        )
+        url = reverse('admin:booking_pickup_list')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'date': today.strftime('%Y-%m-%d')})
+        self.assertEqual(response.context['pickup_count'], 60)
+        self.assertEqual(
+            [(g['bus_no'], g['total'], g['confirmed'], g['pending']) for g in response.context['groups']],
+            [('TN01', 55, 55, 0), ('TN02', 5, 0, 5)],
+        )
+        # Group rows are not rendered into the page itself
+        self.assertNotContains(response, 'ROLL00000')
+        self.assertEqual(sum('"booking_booking"' in q['sql'] for q in ctx.captured_queries), 1)
+
+        group_url = reverse('admin:booking_pickup_group', args=[self.bus.pk])
+        response = self.client.get(group_url, {'date': today.strftime('%Y-%m-%d'), 'stop': stop.pk, 'page': 2})
+        self.assertEqual(len(response.context['bookings']), 5)
+        self.assertContains(response, 'Page 2 of 2')
+
+
+class ManifestExportTests(AdminChangelistTestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_root = tmp.name
+        settings_override = override_settings(MANIFEST_CACHE={'ROOT': tmp.name})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_edits_to_student_bus_and_stop_details_move_the_manifest_version(self):
+        from django.contrib.auth.models import update_last_login
+        from .manifests import Manifest
+        today = date.today()
+        student = make_students(1)[0]
+        stop = Stop.objects.create(bus=self.bus, stop_name='Gate', location='Gate', sequence=1)
+        Booking.objects.create(student=student, bus=self.bus, trip_date=today, selected_stop=stop, status='confirmed')
+        manifest = Manifest(today, bus_id=self.bus.pk)
+
+        version = manifest.version()
+        update_last_login(None, student)
+        student.year = '3'
+        student.save()
+        self.assertEqual(manifest.version(), version)
+
+        for change in (
+            lambda: setattr(student, 'phone_number', '8888888888') or student.save(),
+            lambda: setattr(self.bus, 'route_name', 'Route B') or self.bus.save(),
+            lambda: setattr(stop, 'stop_name', 'Main Gate') or stop.save(),
+            stop.delete,
+        ):
+            change()
+            self.assertNotEqual(manifest.version(), version)
+            version = manifest.version()
+
+    def test_exports_stream_the_same_csv_as_before(self):
+        import csv as csv_module
+        today = date.today()
+        students = make_students(3)
+        Booking.objects.bulk_create(
+            [Booking(student=s, bus=self.bus, trip_date=today, status='confirmed', from_location='REC', to_location='Town',
+                     departure_time=time(7, 30))
+             for s in students[:2]]
+            + [Booking(student=students[2], bus=self.bus, trip_date=today, is_outbound_trip=False, status='pending')]
+        )
+        for url_name, params, expected_rows in (
+            ('admin:booking_export_pickup', {'date': today.strftime('%Y-%m-%d')}, 2),
+            ('admin:booking_export_dropoff', {'date': today.strftime('%Y-%m-%d')}, 1),
+        ):
+            response = self.client.get(reverse(url_name), params)
+            self.assertTrue(response.streaming)
+            rows = list(csv_module.reader(b''.join(response.streaming_content).decode().splitlines()))
+            self.assertEqual(len(rows), expected_rows + 1)
+            self.assertEqual(rows[0][0], 'Student Name')
+
+        from .authentication import issue_token
+        response = self.client.get(
+            '/api/admin/export-pickup-list/', {'date': today.strftime('%Y-%m-%d')},
+            HTTP_AUTHORIZATION=f'Bearer {issue_token(self.admin_user)}',
+        )
+        rows = list(csv_module.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[1][:2], ['Student 0', 'ROLL00000'])
+        self.assertEqual(rows[1][4:10], ['REC', 'Town', '07:30', 'TN01', 'Route A', 'confirmed'])
+
+    def test_every_format_and_the_api_list_share_one_projection(self):
+        import io
+        import json
+        from openpyxl import load_workbook
+        from .authentication import issue_token
+        other_bus = Bus.objects.create(bus_no='TN02', route_name='Route B', departure_time=time(8, 0), capacity=50)
+        today = date.today()
+        students = make_students(4)
+        Booking.objects.bulk_create(
+            [Booking(student=s, bus=self.bus, trip_date=today, status='confirmed', departure_time=time(7, 30))
+             for s in students[:3]]
+            + [Booking(student=students[3], bus=other_bus, trip_date=today, status='pending', departure_time=time(8, 0))]
+        )
+        params = {'date': today.strftime('%Y-%m-%d'), 'bus': other_bus.pk}
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(self.admin_user)}'}
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/admin/pickup-list/', {'date': params['date']}, **auth)
+        self.assertEqual(response.json()['pickup_count'], 4)
+        self.assertEqual(sum('"booking_booking"' in q['sql'] for q in ctx.captured_queries), 1)
+
+        response = self.client.get('/api/admin/pickup-list/', params, **auth)
+        self.assertEqual([p['student_roll_no'] for p in response.json()['pickups']], ['ROLL00003'])
+        response = self.client.get('/api/admin/pickup-list/', dict(params, status='bogus'), **auth)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('admin:booking_export_pickup'), dict(params, file_format='jsonl'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['bus_number'] for line in lines], ['TN02'])
+
+        response = self.client.get(reverse('admin:booking_export_pickup'), {'date': params['date'], 'file_format': 'xlsx'})
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.values)
+        self.assertEqual(rows[0][:2], ('Student Name', 'Roll No'))
+        self.assertEqual(len(rows), 5)
+
+    def test_repeat_downloads_are_served_from_the_artifact_until_bookings_change(self):
+        from pathlib import Path
+        from django.http import FileResponse
+        from django.test import override_settings
+        today = date.today()
+        student, late_student = make_students(2)
+        Booking.objects.create(student=student, bus=self.bus, trip_date=today, status='confirmed',
+                               departure_time=time(7, 30))
+        url = reverse('admin:booking_export_pickup')
+        params = {'date': today.strftime('%Y-%m-%d')}
+
+        # A miss streams the rows as they are read and writes the artifact alongside
+        artifacts = Path(self.cache_root, str(today))
+        abandoned = self.client.get(url, params)
+        self.assertNotIsInstance(abandoned, FileResponse)
+        next(iter(abandoned.streaming_content))
+        abandoned.close()
+        self.assertEqual(list(artifacts.iterdir()), [])
+        response = self.client.get(url, params)
+        self.assertNotIsInstance(response, FileResponse)
+        first = b''.join(response.streaming_content)
+        self.assertEqual(len(list(artifacts.glob('pickup.*.csv'))), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            repeat = b''.join(self.client.get(url, params).streaming_content)
+        self.assertEqual(first, repeat)
+        self.assertFalse(any('"booking_booking"' in q['sql'] for q in ctx.captured_queries))
+
+        Booking.objects.create(student=late_student, bus=self.bus, trip_date=today, status='pending',
+                               departure_time=time(7, 30))
+        regenerated = b''.join(self.client.get(url, params).streaming_content)
+        self.assertEqual(len(regenerated.decode().splitlines()), 3)
+        # The superseded version is removed once the new one is written
+        self.assertEqual(len(list(Path(self.cache_root, str(today)).glob('pickup.*.csv'))), 1)
+
+        with override_settings(MANIFEST_CACHE={'ROOT': self.cache_root, 'SENDFILE_HEADER': 'X-Accel-Redirect'}):
+            response = self.client.get(url, params)
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response['X-Accel-Redirect'].startswith(f'/protected/manifests/{today}/pickup.'))
+
+    def test_nightly_pregeneration_rebuilds_only_changed_buses(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import Stop
+        other_bus = Bus.objects.create(bus_no='TN02', route_name='Route B', departure_time=time(8, 0), capacity=50)
+        gate = Stop.objects.create(bus=self.bus, stop_name='Gate', location='Main Gate')
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        students = make_students(3)
+        Booking.objects.create(student=students[0], bus=self.bus, trip_date=tomorrow, status='confirmed',
+                               departure_time=time(7, 30))
+        Booking.objects.create(student=students[1], bus=self.bus, selected_stop=gate, trip_date=tomorrow,
+                               status='confirmed', departure_time=time(7, 30))
+        Booking.objects.create(student=students[2], bus=other_bus, trip_date=tomorrow, status='confirmed',
+                               departure_time=time(8, 0))
+
+        def generated():
+            # Each run is its own process, starting with an empty process-local cache
+            cache.clear()
+            out = StringIO()
+            call_command('generate_manifests', stdout=out)
+            return sorted(line[2:] for line in out.getvalue().splitlines() if line.startswith('✓ '))
+
+        # Day files for both directions, then per bus and direction: a CSV and a driver sheet
+        self.assertEqual(len(generated()), 2 + 2 * 2 * 2)
+        self.assertEqual(generated(), [])
+
+        Booking.objects.filter(student=students[2]).get().delete()
+        self.assertEqual(generated(), sorted([
+            'pickup_list_%s.csv' % tomorrow, 'dropoff_list_%s.csv' % tomorrow,
+            f'pickup-bus{other_bus.pk}.csv', f'dropoff-bus{other_bus.pk}.csv',
+            f'driver-sheet-pickup-bus{other_bus.pk}.html', f'driver-sheet-dropoff-bus{other_bus.pk}.html',
+        ]))
+
+        # ...and so is every web worker: they serve the files the command wrote
+        cache.clear()
+        url = reverse('admin:booking_pickup_driver_sheet', args=[self.bus.pk])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'date': tomorrow.strftime('%Y-%m-%d')})
+        self.assertFalse(any('"booking_booking"' in q['sql'] for q in ctx.captured_queries))
+        html = b''.join(response.streaming_content).decode()
+        # Ordered by stop, bookings without one last
+        self.assertLess(html.index('Gate (1)'), html.index('No stop selected (1)'))
+
+
+class BookingHistoryExportTests(AdminChangelistTestCase):
+    def test_range_is_streamed_as_gzip_csv_and_jsonl(self):
+        import csv as csv_module
+        import gzip
+        import json
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from .authentication import issue_token
+        start = date(2025, 6, 1)
+        students = make_students(5)
+        Booking.objects.bulk_create([
+            Booking(student=s, bus=self.bus, trip_date=start + timedelta(days=i), departure_time=time(7, 30),
+                    status='cancelled' if i == 3 else 'confirmed')
+            for i, s in enumerate(students)
+        ])
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(self.admin_user)}'}
+        url = '/api/admin/export-booking-history/'
+
+        response = self.client.get(url, {'start': '2025-06-02', 'end': '2025-06-04'}, **auth)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('bookings_2025-06-02_2025-06-04.csv.gz', response['Content-Disposition'])
+        rows = list(csv_module.reader(gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()))
+        self.assertEqual(rows[0][:4], ['id', 'student_email', 'bus_no', 'trip_date'])
+        self.assertEqual([row[3] for row in rows[1:]], ['2025-06-02', '2025-06-03', '2025-06-04'])
+
+        response = self.client.get(url, {'start': '2025-06-01', 'end': '2025-06-30', 'file_format': 'jsonl',
+                                          'status': 'cancelled'}, **auth)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['student_email'] for line in lines], ['student3@example.com'])
+
+        response = self.client.get(url, {'start': '2025-06-05', 'end': '2025-06-01'}, **auth)
+        self.assertEqual(response.status_code, 400)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'history.csv.gz')
+            call_command('export_booking_history', '2025-06-01', '2025-06-30', '--output', output,
+                         '--chunk-size', '2', stdout=open(os.devnull, 'w'))
+            with gzip.open(output, 'rt') as f:
+                self.assertEqual(len(f.read().splitlines()), 6)
+
+            # A failure part-way through keeps the previous file and leaves no partial one behind
+            from unittest import mock
+
+            def rows_then_error(*args, **kwargs):
+                yield [1] * 12
+                raise ConnectionError
+
+            with mock.patch('booking.history.iter_rows', rows_then_error), self.assertRaises(ConnectionError):
+                call_command('export_booking_history', '2025-06-01', '2025-06-30', '--output', output,
+                             stdout=open(os.devnull, 'w'))
+            self.assertEqual(os.listdir(tmp), ['history.csv.gz'])
+            with gzip.open(output, 'rt') as f:
+                self.assertEqual(len(f.read().splitlines()), 6)
+
+
+class PurgeStaleDataTests(TestCase):
+    def setUp(self):
+        self.bus = Bus.objects.create(
+            bus_no='TN01', route_name='Route A', departure_time=time(7, 30), capacity=50,
+        )
+        self.old_trip = timezone.localdate() - timedelta(days=60)
+
+    def make_abandoned_bookings(self, count):
+        Booking.objects.bulk_create([
+            Booking(student=s, bus=self.bus, trip_date=self.old_trip, departure_time=time(7, 30), status='pending')
+            for s in make_students(count, start=Student.objects.count())
+        ])
+        Booking.objects.update(booking_date=timezone.now() - timedelta(days=3))
+
+    def test_batches_stop_at_the_first_short_or_empty_batch(self):
+        from .retention import purge_queryset
+        self.make_abandoned_bookings(4)
+        result = purge_queryset('Bookings', Booking.objects.all(), batch_size=2)
+        self.assertEqual((result.matched, result.deleted, result.batches), (4, 4, 2))
+
+        self.make_abandoned_bookings(5)
+        result = purge_queryset('Bookings', Booking.objects.all(), batch_size=2)
+        self.assertEqual((result.matched, result.deleted, result.batches), (5, 5, 3))
+
+    def test_booking_versions_are_bumped_once_per_batch(self):
+        from unittest import mock
+        from . import versions
+        from .retention import purge_queryset
+        self.make_abandoned_bookings(5)
+        before = versions.get_version('date', self.old_trip)
+        with mock.patch('booking.versions.bump_bookings', wraps=versions.bump_bookings) as bump:
+            purge_queryset('Bookings', Booking.objects.all(), batch_size=2)
+        self.assertEqual(bump.call_count, 3)
+        self.assertNotEqual(versions.get_version('date', self.old_trip), before)
+
+        # The per-row signal is connected again afterwards
+        self.make_abandoned_bookings(1)
+        with mock.patch('booking.versions.bump_bookings') as bump:
+            Booking.objects.get().delete()
+        bump.assert_called_once()
+
+    def test_dry_run_counts_then_purge_deletes_and_summarises(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from . import versions
+        from .models import DataVersion
+        self.make_abandoned_bookings(3)
+        Booking.objects.create(student=make_students(1, start=10)[0], bus=self.bus, trip_date=timezone.localdate(),
+                               departure_time=time(7, 30), status='pending')
+        versions.get_version('bus', self.old_trip, self.bus.pk)
+        versions.get_version('date', timezone.localdate())
+
+        out = StringIO()
+        call_command('purge_stale_data', '--dry-run', '--batch-size', '2', stdout=out)
+        self.assertIn('Abandoned pending bookings: 3 row(s) would be deleted', out.getvalue())
+        self.assertIn('Past trip data versions: 1 row(s) would be deleted', out.getvalue())
+        self.assertIn('DRY RUN - No changes made', out.getvalue())
+        self.assertIn('Total rows to delete: 4', out.getvalue())
+        self.assertEqual(Booking.objects.count(), 4)
+
+        out = StringIO()
+        call_command('purge_stale_data', '--batch-size', '2', stdout=out)
+        self.assertIn('Abandoned pending bookings: deleted 3 row(s) in 2 batch(es)', out.getvalue())
+        # Deleting the bookings bumps their date and bus versions, which go in the same run
+        self.assertIn('Past trip data versions: deleted 2 row(s)', out.getvalue())
+        self.assertIn('Total rows deleted: 5', out.getvalue())
+        self.assertEqual(Booking.objects.count(), 1)
+        # Versions of the recent trip date, and the global one, are kept
+        self.assertFalse(versions.stale_db_versions(timezone.localdate() - timedelta(days=30)).exists())
+        self.assertTrue(DataVersion.objects.filter(key__endswith=timezone.localdate().isoformat()).exists())
+
+
+class StudentResourceImportTests(TestCase):
+    def test_import_hashes_the_default_password_once_and_writes_in_bulk(self):
+        from unittest import mock
+        import tablib
+        from django.contrib.auth import hashers
+        from .models import DEFAULT_STUDENT_PASSWORD
+        from .resources import StudentResource
+        existing = Student.objects.create_user(
+            email='student0@example.com', password='Secret@123', first_name='Old', last_name='Name',
+            phone_number='9999999999', year='2', roll_no='ROLL00000', dept='CSE', gender='M'
+        )
+        headers = ['first_name', 'last_name', 'email', 'phone_number', 'year', 'roll_no', 'dept', 'gender']
+        dataset = tablib.Dataset(headers=headers)
+        for i in range(30):
+            dataset.append(['Student', str(i), f'student{i}@example.com', '9999999999', '2', f'ROLL{i:05d}', 'CSE', 'M'])
+
+        with mock.patch('django.contrib.auth.hashers.make_password', wraps=hashers.make_password) as make_password:
+            with CaptureQueriesContext(connection) as ctx:
+                result = StudentResource().import_data(dataset, raise_errors=True)
+        self.assertFalse(result.has_errors())
+        self.assertEqual(make_password.call_count, 1)
+        self.assertLess(len(ctx.captured_queries), 15)
+
+        self.assertEqual(Student.objects.count(), 30)
+        new_student = Student.objects.get(email='student7@example.com')
+        self.assertEqual(new_student.roll_no, 'ROLL00007')
+        self.assertTrue(new_student.has_default_password)
+        self.assertTrue(new_student.check_password(DEFAULT_STUDENT_PASSWORD))
+        # Updated rows keep their own password
+        existing.refresh_from_db()
+        self.assertEqual(existing.last_name, '0')
+        self.assertTrue(existing.check_password('Secret@123'))
+
+
+class BookingResourceImportTests(TestCase):
+    HEADERS = ['id', 'student_email', 'bus_no', 'trip_date', 'departure_time', 'from_location',
+               'to_location', 'selected_stop', 'selected_stop_location', 'status']
+
+    def setUp(self):
+        cache.clear()
+        self.students = make_students(20)
+        self.bus_a = Bus.objects.create(bus_no='TN01', route_name='Route A', departure_time=time(7, 30), capacity=50)
+        self.bus_b = Bus.objects.create(bus_no='TN02', route_name='Route B', departure_time=time(8, 0), capacity=50)
+        # Same stop name on both buses, and twice on TN02 at different locations
+        self.gate_a = Stop.objects.create(bus=self.bus_a, stop_name='Main Gate', location='Campus')
+        self.gate_b = Stop.objects.create(bus=self.bus_b, stop_name='Main Gate', location='Campus')
+        self.hall_north = Stop.objects.create(bus=self.bus_b, stop_name='Town Hall', location='North')
+        self.hall_south = Stop.objects.create(bus=self.bus_b, stop_name='Town Hall', location='South')
+
+    def dataset(self, rows):
+        import tablib
+        dataset = tablib.Dataset(headers=self.HEADERS)
+        for row in rows:
+            dataset.append(row)
+        return dataset
+
+    def test_references_are_resolved_once_per_import_and_bookings_written_in_bulk(self):
+        from . import versions
+        from .resources import BookingResource
+        trip = date.today() + timedelta(days=1)
+        before = versions.get_version('bus', trip, self.bus_b.pk)
+        rows = []
+        for i, student in enumerate(self.students):
+            bus_no, stop, location = [
+                ('TN01', 'Main Gate', ''), ('TN02', 'Main Gate', ''), ('TN02', 'Town Hall', 'South'),
+            ][i % 3]
+            rows.append(['', student.email, bus_no, trip.isoformat(), '08:00', 'Campus', 'City', stop, location, 'confirmed'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = BookingResource().import_data(self.dataset(rows), raise_errors=True)
+        self.assertFalse(result.has_errors())
+        # Students, buses and stops are one query each, plus one INSERT and one version
+        # upsert (DataVersion, as the test cache is not shared), whatever the row count
+        queries = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(queries), 5)
+        self.assertEqual(Booking.objects.count(), 20)
+        self.assertEqual(Booking.objects.get(student=self.students[1]).selected_stop, self.gate_b)
+        self.assertEqual(Booking.objects.get(student=self.students[2]).selected_stop, self.hall_south)
+        self.assertNotEqual(versions.get_version('bus', trip, self.bus_b.pk), before)
+        self.hall_south.refresh_from_db()
+        self.assertEqual(self.hall_south.location, 'South')
+
+    def test_unknown_and_ambiguous_stops_are_row_errors(self):
+        from .resources import BookingResource
+        trip = (date.today() + timedelta(days=1)).isoformat()
+        email = self.students[0].email
+        result = BookingResource().import_data(self.dataset([
+            ['', email, 'TN01', trip, '08:00', 'Campus', 'City', 'Town Hall', '', 'confirmed'],
+            ['', email, 'TN02', trip, '08:00', 'Campus', 'City', 'Town Hall', '', 'confirmed'],
+        ]), dry_run=True)
+        errors = [str(error.error) for row in result.rows for error in row.errors]
+        self.assertEqual(errors, [
+            'Stop "Town Hall" does not exist on bus TN01',
+            'Bus TN02 has several stops named "Town Hall"; set selected_stop_location',
+        ])
+
+
+class ImportStudentsCommandTests(TestCase):
+    HEADER = 'first_name,last_name,email,phone_number,year,roll_no,dept,gender\n'
+
+    def run_import(self, lines, *args):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.HEADER + ''.join(line + '\n' for line in lines))
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        call_command('import_students', f.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_rows_are_written_per_chunk_and_errors_keep_their_row_numbers(self):
+        from .models import DEFAULT_STUDENT_PASSWORD
+        lines = [f'Student,{i},student{i}@example.com,9999999999,2,ROLL{i:05d},CSE,M' for i in range(25)]
+        lines.insert(3, 'Bad,Year,bad@example.com,9999999999,7,BAD001,CSE,M')
+        lines.append('Dup,Email,STUDENT4@example.com,9999999999,2,OTHER01,CSE,M')
+        with CaptureQueriesContext(connection) as ctx:
+            output = self.run_import(lines, '--chunk-size', '10')
+        self.assertIn('Row 5: Invalid year: 7. Must be 1, 2, 3, or 4', output)
+        self.assertIn('Row 28: Duplicate email student4@example.com (first seen on row 7)', output)
+        self.assertIn('Successfully processed: 25', output)
+        # Per chunk of 10: two preload queries and one insert, whatever the row count
+        self.assertLessEqual(len(ctx.captured_queries), 3 * 10)
+        student = Student.objects.get(email='student7@example.com')
+        self.assertTrue(student.has_default_password)
+        self.assertTrue(student.check_password(DEFAULT_STUDENT_PASSWORD))
+
+        output = self.run_import([
+            'Renamed,Student,student1@example.com,,3,ROLL00001,ECE,F',
+            'Student,2,student2@example.com,9999999999,2,ROLL00002,CSE,M',
+            'Taken,Roll,new@example.com,9999999999,2,ROLL00003,CSE,M',
+        ], '--update')
+        self.assertIn('Row 2: Updated student student1@example.com', output)
+        self.assertIn('Row 3: Student student2@example.com unchanged', output)
+        self.assertIn('Row 4: Roll number ROLL00003 already belongs to student3@example.com', output)
+        student = Student.objects.get(email='student1@example.com')
+        self.assertEqual((student.first_name, student.year, student.dept, student.phone_number),
+                         ('Renamed', '3', 'ECE', '9999999999'))
+        self.assertIn('already exists (use --update to update)', self.run_import(lines[:1]))
+
+    def test_rows_the_database_rejects_are_reported_alone(self):
+        from unittest import mock
+        from django.db import IntegrityError
+        from .student_import import StudentImporter
+        insert = StudentImporter._insert
+
+        def rejecting_insert(importer, rows):
+            if any(row['email'] == 'student6@example.com' for row in rows):
+                raise IntegrityError('rejected by the database')
+            return insert(importer, rows)
+
+        lines = [f'Student,{i},student{i}@example.com,9999999999,2,ROLL{i:05d},CSE,M' for i in range(12)]
+        with mock.patch.object(StudentImporter, '_insert', rejecting_insert):
+            output = self.run_import(lines, '--chunk-size', '5')
+        self.assertIn('Row 8: Error processing row: rejected by the database', output)
+        self.assertIn('Row 7: Created student student5@example.com', output)
+        self.assertIn('Successfully processed: 11', output)
+        self.assertEqual(Student.objects.count(), 11)
+
+        # Other databases take the bulk_create / bulk_update path
+        lines = [f'Renamed,{i},student{i}@example.com,9999999999,3,ROLL{i:05d},ECE,F' for i in range(4, 9)]
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            output = self.run_import(lines, '--update')
+        self.assertIn('Row 4: Created student student6@example.com', output)
+        self.assertIn('Row 6: Updated student student8@example.com', output)
+        self.assertEqual(Student.objects.filter(first_name='Renamed', year='3', dept='ECE').count(), 5)
+        self.assertTrue(Student.objects.get(email='student6@example.com').has_default_password)
+
+    def test_interrupted_import_resumes_from_its_checkpoint(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .jobs import JobContext
+        from .models import BackgroundJob
+        lines = [f'Student,{i},student{i}@example.com,9999999999,2,ROLL{i:05d},CSE,M' for i in range(25)]
+        lines[12] = 'Bad,Year,bad@example.com,9999999999,7,BAD001,CSE,M'
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.HEADER + ''.join(line + '\n' for line in lines))
+        self.addCleanup(os.unlink, f.name)
+
+        # The process dies while committing the third chunk
+        save_checkpoint = JobContext.save_checkpoint
+        calls = []
+
+        def crash(ctx, *args, **kwargs):
+            calls.append(1)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return save_checkpoint(ctx, *args, **kwargs)
+
+        with mock.patch.object(JobContext, 'save_checkpoint', crash), self.assertRaises(KeyboardInterrupt):
+            call_command('import_students', f.name, '--chunk-size', '5', stdout=StringIO())
+        job = BackgroundJob.objects.get(task='import_students')
+        self.assertEqual(job.checkpoint['next_row'], 12)
+        self.assertEqual(Student.objects.count(), 10)
+
+        # Its heartbeat is still fresh, so it is only taken over with --force
+        with self.assertRaisesMessage(CommandError, 'already importing this file'):
+            call_command('import_students', f.name, '--chunk-size', '5', stdout=StringIO())
+
+        out = StringIO()
+        call_command('import_students', f.name, '--force', stdout=out)
+        output = out.getvalue()
+        self.assertIn(f'Resuming job #{job.pk} at row 12 (10 created, 0 updated so far)', output)
+        self.assertNotIn('Row 11:', output)
+        self.assertIn('Row 12: Created student student10@example.com', output)
+        self.assertIn('Row 14: Invalid year: 7', output)
+        self.assertIn('Successfully processed: 24', output)
+        self.assertIn('Errors: 1', output)
+        self.assertEqual(Student.objects.count(), 24)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.done, job.total), ('succeeded', 2, job.total, os.path.getsize(f.name)))
+        self.assertEqual(job.result['failures'], ['Row 14: Invalid year: 7. Must be 1, 2, 3, or 4'])
+
+    def test_dry_run_reports_rows_in_file_order_without_writing(self):
+        lines = []
+        for i in range(40):
+            year = '9' if i % 7 == 0 else '2'
+            lines.append(f'Student,{i},student{i}@example.com,9999999999,{year},ROLL{i:05d},CSE,M')
+        output = self.run_import(lines, '--dry-run', '--chunk-size', '5')
+        rows = [line for line in output.splitlines() if line.startswith('Row ')]
+        self.assertEqual([int(line.split()[1].rstrip(':')) for line in rows], list(range(2, 42)))
+        self.assertIn('Row 9: Invalid year: 9', output)
+        self.assertFalse(Student.objects.exists())
+
+
+class TimetableImportTests(AdminChangelistTestCase):
+    HEADER = 'bus_no,route_name,from_location,to_location,departure_time,capacity,stops\n'
+
+    def test_buses_are_upserted_and_stops_reconciled_in_order(self):
+        from io import StringIO
+        from .timetable import import_timetable
+        old = Stop.objects.create(bus=self.bus, stop_name='Old Stop', location='Old Stop', sequence=1)
+        kept = Stop.objects.create(bus=self.bus, stop_name='Ukkadam', location='Ukkadam', sequence=1)
+        content = self.HEADER + (
+            'TN01,Route A,Campus,City,07:45,50,Gandhipuram - Bus Stand; Ukkadam\n'
+            'TN02,Route B,Campus,Town,08:00,40,Town Hall; Main Gate - Campus\n'
+        )
+
+        result = import_timetable(StringIO(content), dry_run=True)
+        self.assertEqual(result.diff.lines(), [
+            '+ TN02: new bus',
+            '~ TN01: from_location (blank) → Campus, to_location (blank) → City, departure_time 07:30:00 → 07:45:00',
+            '+ TN01: stop #1 Gandhipuram - Bus Stand',
+            '+ TN02: stop #1 Town Hall',
+            '+ TN02: stop #2 Main Gate - Campus',
+            '~ TN01: stop Ukkadam moved #1 → #2',
+            '- TN01: stop Old Stop deactivated',
+        ])
+        self.assertFalse(Bus.objects.filter(bus_no='TN02').exists())
+
+        with self.assertNumQueries(10):
+            result = import_timetable(StringIO(content))
+        self.assertEqual(result.diff.summary()['stops_created'], 3)
+        self.assertEqual(
+            list(Stop.objects.filter(bus=self.bus, is_active=True).values_list('stop_name', 'location')),
+            [('Gandhipuram', 'Bus Stand'), ('Ukkadam', 'Ukkadam')],
+        )
+        old.refresh_from_db()
+        kept.refresh_from_db()
+        self.assertEqual((old.is_active, kept.sequence), (False, 2))
+        self.assertEqual(Bus.objects.get(bus_no='TN02').capacity, 40)
+        self.assertFalse(import_timetable(StringIO(content)).diff.has_changes)
+
+        # One bad row rejects the whole file
+        result = import_timetable(StringIO(self.HEADER + (
+            'TN01,Route A,Campus,City,07:45,50,Old Stop; Ukkadam\n'
+            'TN03,Route C,Campus,City,7 am,50,Ukkadam\n'
+        )))
+        self.assertEqual(result.errors, ['Row 3: Invalid departure_time: 7 am. Use HH:MM'])
+        old.refresh_from_db()
+        self.assertFalse(old.is_active)
+
+    def test_admin_previews_the_diff_before_applying_it(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        content = self.HEADER + 'TN05,Route E,Campus,City,09:00,30,Main Gate; Town Hall\n'
+        url = reverse('admin:bus_import_timetable')
+        self.assertContains(self.client.get(reverse('admin:booking_bus_changelist')), url)
+
+        response = self.client.post(url, {'csv_file': SimpleUploadedFile('timetable.csv', content.encode())})
+        self.assertContains(response, '+ TN05: stop #2 Town Hall')
+        self.assertFalse(Bus.objects.filter(bus_no='TN05').exists())
+
+        response = self.client.post(url, {'csv_text': response.context['form']['csv_text'].value(), '_confirm': '1'})
+        self.assertRedirects(response, reverse('admin:booking_bus_changelist'))
+        self.assertEqual(
+            list(Stop.objects.filter(bus__bus_no='TN05').values_list('sequence', 'stop_name')),
+            [(1, 'Main Gate'), (2, 'Town Hall')],
+        )
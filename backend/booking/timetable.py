@@ -0,0 +1,278 @@
+"""
+Combined bus timetable + stops import.
+
+One CSV row per bus: the BusResource columns plus a `stops` column listing the
+route's stops in order, separated by ";" -- each stop is "Stop name" or
+"Stop name - Location" (the same form as Stop.display_name):
+
+    bus_no,route_name,from_location,to_location,departure_time,capacity,stops
+    BUS001,Route A,Campus,City,08:00,50,Gandhipuram - Bus Stand; Ukkadam; Town Hall
+
+Buses are upserted by bus_no and each listed bus's stops are reconciled
+against the file as set-based diffs: stops are matched on (stop_name,
+location), new ones are created, moved ones get their new sequence, and
+stops no longer listed are deactivated rather than deleted, since bookings
+may still point at them. Buses missing from the file are left alone. The
+whole file is validated first and written in one transaction; with
+dry_run the diff is computed against the database and nothing is written.
+"""
+
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db import transaction
+
+from .models import Bus, Stop, Booking
+from . import versions
+
+
+REQUIRED_COLUMNS = ['bus_no', 'route_name', 'departure_time', 'capacity', 'stops']
+
+# Bus columns that may be left out (or blank) to keep the current value / model default
+OPTIONAL_COLUMNS = ['from_location', 'to_location', 'departure_date', 'is_booking_open']
+
+STOP_SEPARATOR = ';'
+LOCATION_SEPARATOR = ' - '
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+class TimetableError(ValueError):
+    """A row that cannot be imported; the message is reported against its row number"""
+
+
+def parse_stops(value):
+    """Split a stops cell into an ordered list of (stop_name, location)"""
+    stops = []
+    for entry in (value or '').split(STOP_SEPARATOR):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, location = entry.partition(LOCATION_SEPARATOR)
+        name, location = name.strip(), location.strip() or name.strip()
+        if len(name) > 100 or len(location) > 100:
+            raise TimetableError(f'Stop name or location too long: {entry}')
+        if (name, location) in stops:
+            raise TimetableError(f'Stop listed twice: {entry}')
+        stops.append((name, location))
+    if not stops:
+        raise TimetableError('No stops listed')
+    return stops
+
+
+def clean_row(row):
+    """Validate one CSV row; returns (bus_no, bus field values, stops) or raises TimetableError"""
+    values = {name: (row.get(name) or '').strip() for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+    missing = [name for name in REQUIRED_COLUMNS if not values[name]]
+    if missing:
+        raise TimetableError(f'Missing required fields: {", ".join(missing)}')
+
+    fields = {'route_name': values['route_name']}
+    for name in ('from_location', 'to_location'):
+        if values[name]:
+            fields[name] = values[name]
+    try:
+        fields['departure_time'] = datetime.strptime(values['departure_time'], '%H:%M').time()
+    except ValueError:
+        raise TimetableError(f"Invalid departure_time: {values['departure_time']}. Use HH:MM")
+    if values['departure_date']:
+        try:
+            fields['departure_date'] = datetime.strptime(values['departure_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise TimetableError(f"Invalid departure_date: {values['departure_date']}. Use YYYY-MM-DD")
+    if not values['capacity'].isdigit() or int(values['capacity']) == 0:
+        raise TimetableError(f"Invalid capacity: {values['capacity']}")
+    fields['capacity'] = int(values['capacity'])
+    if values['is_booking_open']:
+        flag = values['is_booking_open'].lower()
+        if flag not in TRUE_VALUES | FALSE_VALUES:
+            raise TimetableError(f"Invalid is_booking_open: {values['is_booking_open']}")
+        fields['is_booking_open'] = flag in TRUE_VALUES
+    for name in ('bus_no', 'route_name', 'from_location', 'to_location'):
+        limit = Bus._meta.get_field(name).max_length
+        if len(values[name]) > limit:
+            raise TimetableError(f'{name} is longer than {limit} characters')
+    return values['bus_no'], fields, parse_stops(values['stops'])
+
+
+def read_timetable(fileobj):
+    """
+    Parse and validate a whole timetable file.
+    Returns ({bus_no: (fields, stops)} in file order, ['Row N: error', ...]).
+    """
+    reader = csv.DictReader(fileobj)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in (reader.fieldnames or [])]
+    if missing_columns:
+        return {}, [f'Missing required columns: {", ".join(missing_columns)}']
+
+    rows = {}
+    first_rows = {}
+    errors = []
+    for row_num, row in enumerate(reader, start=2):
+        try:
+            bus_no, fields, stops = clean_row(row)
+        except TimetableError as e:
+            errors.append(f'Row {row_num}: {e}')
+            continue
+        if bus_no in first_rows:
+            errors.append(f'Row {row_num}: Duplicate bus_no {bus_no} (first seen on row {first_rows[bus_no]})')
+            continue
+        first_rows[bus_no] = row_num
+        rows[bus_no] = (fields, stops)
+    if not rows and not errors:
+        errors.append('The file has no rows')
+    return rows, errors
+
+
+@dataclass
+class TimetableDiff:
+    buses_created: list = field(default_factory=list)
+    # (bus_no, [(field, old, new), ...])
+    buses_updated: list = field(default_factory=list)
+    buses_unchanged: int = 0
+    # (bus_no, stop label, sequence)
+    stops_created: list = field(default_factory=list)
+    # (bus_no, stop label, old sequence, new sequence, reactivated)
+    stops_updated: list = field(default_factory=list)
+    # (bus_no, stop label)
+    stops_deactivated: list = field(default_factory=list)
+
+    @property
+    def has_changes(self):
+        return bool(self.buses_created or self.buses_updated or self.stops_created
+                    or self.stops_updated or self.stops_deactivated)
+
+    def summary(self):
+        return {
+            'buses_created': len(self.buses_created),
+            'buses_updated': len(self.buses_updated),
+            'buses_unchanged': self.buses_unchanged,
+            'stops_created': len(self.stops_created),
+            'stops_updated': len(self.stops_updated),
+            'stops_deactivated': len(self.stops_deactivated),
+        }
+
+    def lines(self):
+        """The diff as human-readable lines: bus changes first, then stop changes"""
+        lines = [f'+ {bus_no}: new bus' for bus_no in self.buses_created]
+        for bus_no, changes in self.buses_updated:
+            lines.append(f'~ {bus_no}: ' + ', '.join(f'{name} {old or "(blank)"} → {new}' for name, old, new in changes))
+        for bus_no, label, sequence in self.stops_created:
+            lines.append(f'+ {bus_no}: stop #{sequence} {label}')
+        for bus_no, label, old, new, reactivated in self.stops_updated:
+            change = 'reactivated' if reactivated else f'moved #{old} → #{new}'
+            if reactivated and old != new:
+                change += f' as #{new}'
+            lines.append(f'~ {bus_no}: stop {label} {change}')
+        for bus_no, label in self.stops_deactivated:
+            lines.append(f'- {bus_no}: stop {label} deactivated')
+        return lines
+
+
+def _stop_label(name, location):
+    return name if name == location else f'{name}{LOCATION_SEPARATOR}{location}'
+
+
+def reconcile(rows, dry_run=False):
+    """
+    Upsert the buses in rows and reconcile their stops. Every read and write is set-based:
+    one query each for existing buses and their stops, then bulk writes per kind of change.
+    """
+    diff = TimetableDiff()
+    existing = {bus.bus_no: bus for bus in Bus.objects.filter(bus_no__in=list(rows))}
+
+    to_create = []
+    to_update = []
+    changed_fields = set()
+    # Buses whose number, route or time is printed on upcoming manifests
+    touched_bus_ids = set()
+    for bus_no, (fields, _) in rows.items():
+        bus = existing.get(bus_no)
+        if bus is None:
+            to_create.append(Bus(bus_no=bus_no, **fields))
+            diff.buses_created.append(bus_no)
+            continue
+        changes = [(name, getattr(bus, name), value) for name, value in fields.items() if getattr(bus, name) != value]
+        if changes:
+            for name, _, value in changes:
+                setattr(bus, name, value)
+            changed_fields.update(name for name, _, _ in changes)
+            if any(name in versions.RELATED_FIELDS['Bus'][1] for name, _, _ in changes):
+                touched_bus_ids.add(bus.pk)
+            to_update.append(bus)
+            diff.buses_updated.append((bus_no, changes))
+        else:
+            diff.buses_unchanged += 1
+
+    if not dry_run:
+        Bus.objects.bulk_create(to_create)
+        if to_update:
+            Bus.objects.bulk_update(to_update, sorted(changed_fields))
+    bus_ids = dict(Bus.objects.filter(bus_no__in=list(rows)).values_list('bus_no', 'id'))
+
+    # (bus_id) -> {(stop_name, location): (id, sequence, is_active)}
+    current = {}
+    for stop_id, bus_id, name, location, sequence, is_active in Stop.objects.filter(
+        bus_id__in=list(bus_ids.values())
+    ).order_by().values_list('id', 'bus_id', 'stop_name', 'location', 'sequence', 'is_active'):
+        current.setdefault(bus_id, {})[(name, location)] = (stop_id, sequence, is_active)
+
+    new_stops = []
+    moved_stops = []
+    deactivate_ids = []
+    for bus_no, (_, stops) in rows.items():
+        bus_id = bus_ids.get(bus_no)
+        on_file = current.get(bus_id, {})
+        for sequence, (name, location) in enumerate(stops, start=1):
+            label = _stop_label(name, location)
+            found = on_file.get((name, location))
+            if found is None:
+                new_stops.append(Stop(bus_id=bus_id, stop_name=name, location=location, sequence=sequence))
+                diff.stops_created.append((bus_no, label, sequence))
+            elif found[1] != sequence or not found[2]:
+                moved_stops.append(Stop(pk=found[0], sequence=sequence, is_active=True))
+                diff.stops_updated.append((bus_no, label, found[1], sequence, not found[2]))
+            else:
+                continue
+            touched_bus_ids.add(bus_id)
+        listed = set(stops)
+        for key, (stop_id, _, is_active) in on_file.items():
+            if is_active and key not in listed:
+                deactivate_ids.append(stop_id)
+                diff.stops_deactivated.append((bus_no, _stop_label(*key)))
+                touched_bus_ids.add(bus_id)
+
+    if not dry_run:
+        Stop.objects.bulk_create(new_stops)
+        Stop.objects.bulk_update(moved_stops, ['sequence', 'is_active'])
+        Stop.objects.filter(pk__in=deactivate_ids).update(is_active=False)
+        if touched_bus_ids:
+            transaction.on_commit(lambda: _bump_upcoming(touched_bus_ids))
+    return diff
+
+
+def _bump_upcoming(bus_ids):
+    """Bus details and stop order are printed on driver sheets: rebuild upcoming ones for buses that changed"""
+    from django.utils import timezone
+    versions.bump_for_queryset(Booking.objects.filter(bus_id__in=bus_ids, trip_date__gte=timezone.localdate()))
+
+
+@dataclass
+class TimetableResult:
+    errors: list = field(default_factory=list)
+    diff: TimetableDiff = None
+
+
+def import_timetable(fileobj, dry_run=False):
+    """
+    Validate a timetable file and apply it in one transaction. Any invalid row rejects the
+    whole file, so a timetable is never half applied.
+    """
+    rows, errors = read_timetable(fileobj)
+    if errors:
+        return TimetableResult(errors=errors)
+    with transaction.atomic():
+        diff = reconcile(rows, dry_run=dry_run)
+    return TimetableResult(diff=diff)
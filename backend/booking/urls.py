@@ -23,4 +23,6 @@ urlpatterns = [
     path('admin/dropoff-list/', views.admin_dropoff_list, name='admin_dropoff_list'),
     path('admin/export-pickup-list/', views.admin_export_pickup_list, name='admin_export_pickup_list'),
     path('admin/export-dropoff-list/', views.admin_export_dropoff_list, name='admin_export_dropoff_list'),
+    path('admin/export-booking-history/', views.admin_export_booking_history, name='admin_export_booking_history'),
+    path('admin/login-rate-limit/', views.admin_login_rate_limit_stats, name='admin_login_rate_limit_stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Cache version keys for data derived from bookings.
+
+Anything cached from booking rows (the admin trip-date index, manifests,
+driver sheets) embeds one of these versions in its key. Bumping a version
+makes every entry built from the old one unreachable, so writers never need
+to know which cache entries exist.
+
+Scopes are nested: the global version changes on every booking write, the
+per-date version when a booking on that trip date changes, and the per-bus
+version when a booking on that (trip date, bus) changes. post_save /
+post_delete handle single-row writes; code that uses queryset.update() must
+call bump_bookings() itself. Edits to the student, bus and stop fields that
+manifests copy (RELATED_FIELDS) bump every (trip date, bus) booked with them.
+
+Versions have to be the same in every process (gunicorn workers, run_jobs,
+generate_manifests), or each one builds and deletes its own artifacts. They
+live in the cache when it is shared (Redis) and in the DataVersion table
+otherwise.
+"""
+
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+VERSION_KEY_PREFIX = 'booking:data-version'
+
+# Fields of related rows that manifests and driver sheets show, by model: (booking lookup, fields)
+RELATED_FIELDS = {
+    'Student': ('student', ('first_name', 'last_name', 'roll_no', 'dept', 'phone_number')),
+    'Bus': ('bus', ('bus_no', 'route_name', 'departure_time')),
+    'Stop': ('selected_stop', ('stop_name', 'sequence')),
+}
+
+# Cache backends whose contents never leave the process that wrote them
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared(alias='default'):
+    """
+    Whether a write to the cache is seen by every other process: the gunicorn workers and
+    run_jobs. LocMemCache (the default when REDIS_URL is unset) is private to each process.
+    """
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    return backend not in LOCAL_CACHE_BACKENDS
+
+
+def _key(scope):
+    return ':'.join([VERSION_KEY_PREFIX] + [str(part) for part in scope])
+
+
+def _as_date(value):
+    # Booking.trip_date defaults to timezone.now, so unsaved instances may hold a datetime
+    if isinstance(value, datetime):
+        return (timezone.localtime(value) if timezone.is_aware(value) else value).date()
+    return value
+
+
+def _db_get(key):
+    from .models import DataVersion
+    version = DataVersion.objects.filter(key=key).values_list('version', flat=True).first()
+    if version is None:
+        # Concurrent first reads race to create the row; every one of them reads back the winner
+        DataVersion.objects.bulk_create([DataVersion(key=key, version=uuid.uuid4().hex)], ignore_conflicts=True)
+        version = DataVersion.objects.filter(key=key).values_list('version', flat=True).first()
+    return version
+
+
+def _set_versions(keys):
+    """Give every key a fresh version, in one write"""
+    if cache_is_shared():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+        return
+    from .models import DataVersion
+    DataVersion.objects.bulk_create(
+        [DataVersion(key=key, version=uuid.uuid4().hex) for key in sorted(keys)],
+        update_conflicts=True, unique_fields=['key'], update_fields=['version'],
+    )
+
+
+def get_version(*scope):
+    """Return the current version for a scope, creating one if there is none yet"""
+    key = _key(scope)
+    if not cache_is_shared():
+        return _db_get(key)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump(*scope):
+    _set_versions([_key(scope)])
+
+
+def bump_bookings(pairs=()):
+    """Bump the global version plus the date and (date, bus) versions for each (trip_date, bus_id) pair"""
+    pairs = set(pairs)
+    keys = {_key(())}
+    for trip_date, bus_id in pairs:
+        trip_date = _as_date(trip_date)
+        keys.add(_key(('date', trip_date)))
+        keys.add(_key(('bus', trip_date, bus_id)))
+    _set_versions(keys)
+
+
+def bump_for_queryset(queryset):
+    """Bump versions for every (trip_date, bus) touched by a queryset; call before update()/delete()"""
+    bump_bookings(queryset.values_list('trip_date', 'bus_id').distinct())
+
+
+def stale_db_versions(before):
+    """DataVersion rows of the date and (date, bus) scopes for trip dates before `before`"""
+    from django.db.models import Q
+    from .models import DataVersion
+    # ISO dates sort as strings, so the key prefix plus the cutoff date bounds each scope
+    stale = Q()
+    for scope in ('date', 'bus'):
+        prefix = _key((scope,)) + ':'
+        stale |= Q(key__startswith=prefix, key__lt=f'{prefix}{before.isoformat()}')
+    return DataVersion.objects.filter(stale)
+
+
+def booking_changed(sender, instance, **kwargs):
+    pairs = [(instance.trip_date, instance.bus_id)]
+    # A booking moved to another date or bus also changes the place it left
+    loaded = getattr(instance, '_loaded_trip', None)
+    if loaded and None not in loaded:
+        pairs.append(loaded)
+    bump_bookings(pairs)
+
+
+def related_pre_save(sender, instance, update_fields=None, **kwargs):
+    """Note whether a save changes fields copied into manifests; post_save does the bump"""
+    _, fields = RELATED_FIELDS[sender.__name__]
+    if instance.pk is None or (update_fields is not None and not set(update_fields) & set(fields)):
+        return  # new rows have no bookings; last_login updates leave manifests alone
+    old = sender._default_manager.filter(pk=instance.pk).values_list(*fields).first()
+    instance._bookings_stale = old is not None and old != tuple(getattr(instance, f) for f in fields)
+
+
+def related_saved(sender, instance, **kwargs):
+    if getattr(instance, '_bookings_stale', False):
+        instance._bookings_stale = False
+        lookup, _ = RELATED_FIELDS[sender.__name__]
+        bump_for_queryset(_bookings_for(lookup, instance))
+
+
+def related_pre_delete(sender, instance, **kwargs):
+    # Deleting a stop only nulls selected_stop, so booking signals never fire; collect first
+    lookup, _ = RELATED_FIELDS[sender.__name__]
+    instance._booked_trips = list(_bookings_for(lookup, instance).values_list('trip_date', 'bus_id').distinct())
+
+
+def related_deleted(sender, instance, **kwargs):
+    bump_bookings(getattr(instance, '_booked_trips', ()))
+
+
+def _bookings_for(lookup, instance):
+    from .models import Booking
+    return Booking.objects.filter(**{lookup: instance})
@@ -3,34 +3,55 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth import login, logout
-from .models import Student, Bus, Booking, BookingOTP, SiteConfiguration
+from .models import Student, Bus, Booking, SiteConfiguration
 from .serializers import (
     StudentSerializer, BusSerializer, BookingSerializer, 
     CreateBookingSerializer, LoginSerializer
 )
+from .authentication import issue_token, forget_cached_user, revoke_tokens
+from .ratelimit import LoginRateLimiter, get_stats as get_login_rate_limit_stats
+from . import otp as otp_service
+from .manifests import Manifest, parse_filters
+from . import history
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-import random
 from django.utils import timezone
 from datetime import timedelta
-from django.core.mail import send_mail
-from django.conf import settings
 from django.core.exceptions import MultipleObjectsReturned
-from django.http import HttpResponse
-import csv
-from .models import PasswordResetOTP
 
 
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
+    # A JSON body that is a list or a string has no fields to read
+    if not isinstance(request.data, dict):
+        return Response({
+            'success': False,
+            'errors': {'non_field_errors': ['Expected an object with email and password.']}
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    # Throttle before LoginSerializer runs the (deliberately slow) password hasher
+    limiter = LoginRateLimiter()
+    email = request.data.get('email')
+    allowed, retry_after = limiter.check_and_record(request, email if isinstance(email, str) else None)
+    if not allowed:
+        response = Response({
+            'success': False,
+            'errors': {'non_field_errors': [f'Too many login attempts. Try again in {retry_after} seconds.']}
+        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(retry_after)
+        return response
+
     serializer = LoginSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.validated_data['user']
+        limiter.reset_email(user.email)
         login(request, user)
         return Response({
             'success': True,
-            'user': StudentSerializer(user).data
+            'user': StudentSerializer(user).data,
+            'token': issue_token(user),
         })
     return Response({
         'success': False,
@@ -41,6 +62,7 @@ def login_view(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
+    revoke_tokens(request.user)
     logout(request)
     return Response({'success': True})
 
@@ -218,19 +240,9 @@ class BookingCreateView(generics.CreateAPIView):
                 outbound_booking_date=outbound_booking_date,
                 return_trip_available_after=return_trip_available_after,
             )
-            # Generate OTP
-            otp_code = str(random.randint(100000, 999999))
-            expires_at = timezone.now() + timedelta(minutes=10)
-            BookingOTP.objects.create(
-                booking=booking,
-                otp_code=otp_code,
-                expires_at=expires_at,
-            )
-            # Send OTP email
-            subject = 'Your Bus Booking OTP'
-            message = f"Your OTP for confirming your bus booking is: {otp_code}\nThis OTP is valid for 10 minutes."
-            send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [request.user.email], fail_silently=False)
-            print(f"OTP {otp_code} sent to {request.user.email}")
+            # Generate and send OTP (kept in the OTP store, not a BookingOTP row)
+            otp_service.issue_booking_otp(booking, minutes=10)
+            print(f"OTP sent to {request.user.email}")
             return Response({
                 'success': True,
                 'otp_sent': True,
@@ -286,18 +298,20 @@ def verify_booking_otp(request):
         return Response({'success': False, 'error': 'Missing booking ID or OTP'}, status=400)
     try:
         booking = Booking.objects.get(id=booking_id, status='pending')
-        booking_otp = booking.otp
-        if booking_otp.verified:
+        store = otp_service.get_otp_store()
+        booking_otp = store.get(otp_service.BOOKING, booking.id)
+        if booking_otp is None:
+            return Response({'success': False, 'error': 'OTP expired'}, status=400)
+        if booking_otp.verified or booking_otp.used:
             return Response({'success': False, 'error': 'OTP already used'}, status=400)
-        if timezone.now() > booking_otp.expires_at:
+        if booking_otp.is_expired():
             return Response({'success': False, 'error': 'OTP expired'}, status=400)
-        if booking_otp.otp_code != otp:
+        if booking_otp.code != otp:
             return Response({'success': False, 'error': 'Invalid OTP'}, status=400)
-        # Mark OTP as verified and booking as confirmed
-        booking_otp.verified = True
-        booking_otp.save()
+        # Spend the OTP and mark booking as confirmed
+        store.consume(otp_service.BOOKING, booking.id, booking_otp)
         booking.status = 'confirmed'
-        booking.save()
+        booking.save(update_fields=['status'])
         # Send confirmation email
         booking.send_confirmation_email()
         return Response({'success': True, 'message': 'Booking confirmed'})
@@ -319,28 +333,16 @@ def resend_otp(request):
         # First check if booking exists for this user
         booking = Booking.objects.get(id=booking_id, student=request.user, status='pending')
         
-        # Check if booking has an OTP
-        try:
-            booking_otp = booking.otp
-        except BookingOTP.DoesNotExist:
-            # Create new OTP if none exists
-            otp_code = str(random.randint(100000, 999999))
-            expires_at = timezone.now() + timedelta(minutes=15)
-            booking_otp = BookingOTP.objects.create(
-                booking=booking,
-                otp_code=otp_code,
-                expires_at=expires_at,
-            )
-        
         # Check if OTP is expired - production security
-        if not booking_otp.is_expired():
+        booking_otp = otp_service.get_otp_store().get(otp_service.BOOKING, booking.id)
+        if booking_otp is not None and not booking_otp.is_expired():
             return Response({
                 'success': False, 
                 'error': 'OTP is still valid. Please use the existing OTP.'
             }, status=400)
         
-        # Regenerate OTP
-        new_otp = booking_otp.regenerate_otp()
+        # Issue a new OTP (also covers bookings whose OTP has aged out of the store)
+        otp_service.issue_booking_otp(booking, minutes=15, resend=True)
         
         return Response({
             'success': True, 
@@ -389,29 +391,16 @@ def admin_pickup_list(request):
                 'error': 'Invalid date format. Use YYYY-MM-DD'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        try:
+            manifest = Manifest(target_date, outbound=True, **parse_filters(request.GET))
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
         # Get all outbound bookings (FROM REC) for the specified date
-        pickups = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=True,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
-        
-        pickup_data = []
-        for pickup in pickups:
-            pickup_data.append({
-                'id': pickup.id,
-                'student_name': pickup.student.full_name,
-                'student_roll_no': pickup.student.roll_no,
-                'student_dept': pickup.student.dept,
-                'student_phone': pickup.student.phone_number,
-                'pickup_location': pickup.from_location,
-                'destination': pickup.to_location,
-                'departure_time': pickup.departure_time.strftime('%H:%M'),
-                'bus_number': pickup.bus.bus_no,
-                'route_name': pickup.bus.route_name,
-                'status': pickup.status,
-                'booking_date': pickup.booking_date.strftime('%Y-%m-%d %H:%M')
-            })
+        pickup_data = list(manifest.records())
         
         return Response({
             'success': True,
@@ -455,29 +444,16 @@ def admin_dropoff_list(request):
                 'error': 'Invalid date format. Use YYYY-MM-DD'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        try:
+            manifest = Manifest(target_date, outbound=False, **parse_filters(request.GET))
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
         # Get all return bookings (TO REC) for the specified date
-        dropoffs = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=False,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
-        
-        dropoff_data = []
-        for dropoff in dropoffs:
-            dropoff_data.append({
-                'id': dropoff.id,
-                'student_name': dropoff.student.full_name,
-                'student_roll_no': dropoff.student.roll_no,
-                'student_dept': dropoff.student.dept,
-                'student_phone': dropoff.student.phone_number,
-                'pickup_location': dropoff.from_location,
-                'dropoff_location': dropoff.to_location,
-                'departure_time': dropoff.departure_time.strftime('%H:%M'),
-                'bus_number': dropoff.bus.bus_no,
-                'route_name': dropoff.bus.route_name,
-                'status': dropoff.status,
-                'booking_date': dropoff.booking_date.strftime('%Y-%m-%d %H:%M')
-            })
+        dropoff_data = list(manifest.records())
         
         return Response({
             'success': True,
@@ -521,40 +497,15 @@ def admin_export_pickup_list(request):
                 'error': 'Invalid date format. Use YYYY-MM-DD'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get all outbound bookings (FROM REC) for the specified date
-        pickups = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=True,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
-        
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="pickup_list_{date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Student Name', 'Roll No', 'Department', 'Phone', 
-            'Pickup Location', 'Destination', 'Departure Time', 
-            'Bus Number', 'Route Name', 'Status', 'Booking Date'
-        ])
-        
-        for pickup in pickups:
-            writer.writerow([
-                pickup.student.full_name,
-                pickup.student.roll_no,
-                pickup.student.dept,
-                pickup.student.phone_number,
-                pickup.from_location,
-                pickup.to_location,
-                pickup.departure_time.strftime('%H:%M'),
-                pickup.bus.bus_no,
-                pickup.bus.route_name,
-                pickup.status,
-                pickup.booking_date.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        return response
+        # Stream the export straight from the manifest's values() projection
+        try:
+            manifest = Manifest(target_date, outbound=True, **parse_filters(request.GET))
+            return manifest.cached_response(request.GET.get('file_format', 'csv'))
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
         
     except Exception as e:
         return Response({
@@ -591,40 +542,15 @@ def admin_export_dropoff_list(request):
                 'error': 'Invalid date format. Use YYYY-MM-DD'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get all return bookings (TO REC) for the specified date
-        dropoffs = Booking.objects.filter(
-            trip_date=target_date,
-            is_outbound_trip=False,
-            status__in=['pending', 'confirmed']
-        ).select_related('student', 'bus').order_by('departure_time')
-        
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="dropoff_list_{date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Student Name', 'Roll No', 'Department', 'Phone', 
-            'Pickup Location', 'Drop-off Location', 'Departure Time', 
-            'Bus Number', 'Route Name', 'Status', 'Booking Date'
-        ])
-        
-        for dropoff in dropoffs:
-            writer.writerow([
-                dropoff.student.full_name,
-                dropoff.student.roll_no,
-                dropoff.student.dept,
-                dropoff.student.phone_number,
-                dropoff.from_location,
-                dropoff.to_location,
-                dropoff.departure_time.strftime('%H:%M'),
-                dropoff.bus.bus_no,
-                dropoff.bus.route_name,
-                dropoff.status,
-                dropoff.booking_date.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        return response
+        # Stream the export straight from the manifest's values() projection
+        try:
+            manifest = Manifest(target_date, outbound=False, **parse_filters(request.GET))
+            return manifest.cached_response(request.GET.get('file_format', 'csv'))
+        except ValueError as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
         
     except Exception as e:
         return Response({
@@ -633,6 +559,50 @@ def admin_export_dropoff_list(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_export_booking_history(request):
+    """Stream bookings for a trip date range as gzip-compressed CSV or JSONL"""
+    if not request.user.is_staff:
+        return Response({
+            'success': False,
+            'error': 'Admin access required'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    file_format = request.GET.get('file_format', 'csv')
+    try:
+        start_date, end_date = history.parse_range(request.GET.get('start'), request.GET.get('end'))
+        statuses = parse_filters({'status': request.GET.get('status', '')}).get('statuses')
+        content = history.iter_history(start_date, end_date, file_format, statuses=statuses)
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(content, content_type='application/gzip')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{history.history_filename(start_date, end_date, file_format)}"'
+    )
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def admin_login_rate_limit_stats(request):
+    """Login rate limiter counters, for spotting credential stuffing"""
+    if not request.user.is_staff:
+        return Response({
+            'success': False,
+            'error': 'Admin access required'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    return Response({
+        'success': True,
+        'stats': get_login_rate_limit_stats(),
+    })
+
+
 # Forgot Password Views
 @csrf_exempt
 @api_view(['POST'])
@@ -665,7 +635,7 @@ def forgot_password_request(request):
         
         # Create password reset OTP
         try:
-            otp = PasswordResetOTP.create_for_student(student)
+            otp = otp_service.issue_password_reset_otp(student)
             return Response({
                 'success': True,
                 'message': f'Password reset OTP has been sent to {email}',
@@ -709,21 +679,19 @@ def verify_password_reset_otp(request):
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Get the latest unused OTP for this student
-        try:
-            otp = PasswordResetOTP.objects.filter(
-                student=student,
-                used=False
-            ).latest('created_at')
-        except PasswordResetOTP.DoesNotExist:
+        store = otp_service.get_otp_store()
+        otp = store.get(otp_service.PASSWORD_RESET, student.pk)
+        if otp is None or otp.used:
             return Response({
                 'success': False,
                 'error': 'No OTP found. Please request a new password reset.'
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Verify OTP
-        is_valid, message = otp.verify_otp(otp_code)
+        is_valid, message = otp.verify(otp_code)
         
         if is_valid:
+            store.mark_verified(otp_service.PASSWORD_RESET, student.pk, otp)
             return Response({
                 'success': True,
                 'message': 'OTP verified successfully',
@@ -783,14 +751,9 @@ def reset_password(request):
             }, status=status.HTTP_404_NOT_FOUND)
         
         # Get and verify OTP
-        try:
-            otp = PasswordResetOTP.objects.get(
-                id=otp_id,
-                student=student,
-                verified=True,
-                used=False
-            )
-        except PasswordResetOTP.DoesNotExist:
+        store = otp_service.get_otp_store()
+        otp = store.get(otp_service.PASSWORD_RESET, student.pk)
+        if otp is None or otp.id != str(otp_id) or not otp.verified or otp.used:
             return Response({
                 'success': False,
                 'error': 'Invalid or expired OTP. Please request a new password reset.'
@@ -807,9 +770,10 @@ def reset_password(request):
         try:
             student.set_password(new_password)
             student.save()
+            forget_cached_user(student.pk)
             
             # Mark OTP as used
-            otp.mark_as_used()
+            store.consume(otp_service.PASSWORD_RESET, student.pk, otp)
             
             return Response({
                 'success': True,
@@ -860,7 +824,7 @@ def resend_password_reset_otp(request):
         
         # Create new password reset OTP
         try:
-            otp = PasswordResetOTP.create_for_student(student)
+            otp = otp_service.issue_password_reset_otp(student)
             return Response({
                 'success': True,
                 'message': f'New password reset OTP has been sent to {email}',
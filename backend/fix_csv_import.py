@@ -28,8 +28,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transport_booking.settings')
 import django
 django.setup()
 
-from booking.models import Student
-from django.contrib.auth.hashers import make_password
+from booking.student_import import StudentImporter, import_rows
+from booking.student_validation import REQUIRED_COLUMNS, RowError, clean_row
 
 
 def validate_csv_file(csv_file):
@@ -45,28 +45,10 @@ def validate_csv_file(csv_file):
 
 def validate_row(row, row_num):
     """Validate a single row of data."""
-    required_fields = ['first_name', 'last_name', 'email', 'roll_no', 'dept', 'year', 'gender']
-    
-    # Check for missing required fields
-    missing_fields = [field for field in required_fields if not row.get(field, '').strip()]
-    if missing_fields:
-        raise ValueError(f"Row {row_num}: Missing required fields: {', '.join(missing_fields)}")
-    
-    # Validate email format
-    email = row['email'].strip().lower()
-    if '@' not in email:
-        raise ValueError(f"Row {row_num}: Invalid email format: {email}")
-    
-    # Validate year
-    year = row['year'].strip()
-    if year not in ['1', '2', '3', '4']:
-        raise ValueError(f"Row {row_num}: Invalid year: {year}. Must be 1, 2, 3, or 4")
-    
-    # Validate gender
-    gender = row['gender'].strip().upper()
-    if gender not in ['M', 'F', 'O']:
-        raise ValueError(f"Row {row_num}: Invalid gender: {gender}. Must be M, F, or O")
-    
+    try:
+        clean_row(row)
+    except RowError as e:
+        raise ValueError(f"Row {row_num}: {e}")
     return True
 
 
@@ -86,73 +68,24 @@ def import_students(csv_file, update_existing=False, dry_run=False):
             reader = csv.DictReader(file)
             
             # Validate required columns
-            required_columns = ['first_name', 'last_name', 'email', 'roll_no', 'dept', 'year', 'gender']
-            missing_columns = [col for col in required_columns if col not in reader.fieldnames]
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in (reader.fieldnames or [])]
             
             if missing_columns:
                 raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
             
-            for row_num, row in enumerate(reader, start=2):
-                try:
-                    # Validate row data
-                    validate_row(row, row_num)
-                    
-                    # Clean data
-                    email = row['email'].strip().lower()
-                    first_name = row['first_name'].strip()
-                    last_name = row['last_name'].strip()
-                    roll_no = row['roll_no'].strip()
-                    dept = row['dept'].strip()
-                    year = row['year'].strip()
-                    gender = row['gender'].strip().upper()
-                    phone_number = row.get('phone_number', '').strip()
-                    
-                    # Check if student already exists
-                    existing_student = None
-                    try:
-                        existing_student = Student.objects.get(email=email)
-                    except Student.DoesNotExist:
-                        pass
-                    
-                    if existing_student:
-                        if update_existing:
-                            # Update existing student
-                            if not dry_run:
-                                existing_student.first_name = first_name
-                                existing_student.last_name = last_name
-                                existing_student.roll_no = roll_no
-                                existing_student.dept = dept
-                                existing_student.year = year
-                                existing_student.gender = gender
-                                if phone_number:
-                                    existing_student.phone_number = phone_number
-                                existing_student.save()
-                            
-                            print(f"✓ Row {row_num}: Updated student {email}")
-                            update_count += 1
-                        else:
-                            print(f"⚠ Row {row_num}: Student {email} already exists (use --update to update)")
-                            error_count += 1
-                    else:
-                        # Create new student
-                        if not dry_run:
-                            Student.objects.create(
-                                email=email,
-                                first_name=first_name,
-                                last_name=last_name,
-                                roll_no=roll_no,
-                                dept=dept,
-                                year=year,
-                                gender=gender,
-                                phone_number=phone_number,
-                                password=make_password('Changeme@123')
-                            )
-                        
-                        print(f"✓ Row {row_num}: Created student {email}")
-                        success_count += 1
-                
-                except Exception as e:
-                    print(f"✗ Row {row_num}: Error - {str(e)}")
+            importer = StudentImporter(update_existing=update_existing, dry_run=dry_run)
+            for outcome in import_rows(reader, importer):
+                if outcome.status == 'created':
+                    print(f"✓ Row {outcome.row_num}: {outcome.message}")
+                    success_count += 1
+                elif outcome.status == 'updated':
+                    print(f"✓ Row {outcome.row_num}: {outcome.message}")
+                    update_count += 1
+                elif outcome.status == 'exists':
+                    print(f"⚠ Row {outcome.row_num}: {outcome.message}")
+                    error_count += 1
+                else:
+                    print(f"✗ Row {outcome.row_num}: Error - {outcome.message}")
                     error_count += 1
     
     except UnicodeDecodeError:
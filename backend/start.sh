@@ -32,6 +32,10 @@ python test_startup.py
 echo "🔍 Checking Django configuration..."
 python manage.py check --settings=transport_booking.settings_production
 
+# Start the background job worker (queued admin actions)
+echo "⚙️  Starting background job worker..."
+DJANGO_SETTINGS_MODULE=transport_booking.settings_production bash start_worker.sh &
+
 # Start Gunicorn
 echo "🚀 Starting Gunicorn server..."
 exec gunicorn transport_booking.wsgi:application \
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# Bus Booking System - background job worker
+# Keeps `manage.py run_jobs` running next to the web server, restarting it if it exits,
+# so queued admin actions (OTP emails, default passwords, CSV imports) are picked up.
+# Run from the backend directory; DJANGO_SETTINGS_MODULE selects the settings.
+
+while true; do
+    python manage.py run_jobs
+    echo "⚠️  run_jobs exited with status $?; restarting in 5 seconds..."
+    sleep 5
+done
@@ -124,6 +124,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -131,14 +134,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    # No BasicAuthentication: it runs the password hasher on every call with no rate limit.
+    # Clients log in once through /api/login/ (throttled) and send the bearer token after that.
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'booking.authentication.SignedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
 }
 
+# Bearer tokens issued by login_view (see booking/authentication.py)
+AUTH_TOKEN_MAX_AGE = int(os.environ.get('AUTH_TOKEN_MAX_AGE', 60 * 60 * 12))  # 12 hours
+AUTH_TOKEN_USER_CACHE_SECONDS = 60
+
+# Where booking / password-reset OTPs live: 'cache' (TTL-native, needs a shared cache such
+# as Redis) or 'database' (BookingOTP / PasswordResetOTP rows, kept for auditing).
+# Empty picks 'cache' when the cache is shared across processes and 'database' otherwise.
+OTP_STORE_BACKEND = os.environ.get('OTP_STORE_BACKEND', '')
+
+# Retention for purge_stale_data (see booking/retention.py)
+DATA_RETENTION = {
+    'OTP_DAYS': 30,  # days after expiry
+    'PENDING_BOOKING_HOURS': 48,
+    'VERSION_DAYS': 30,  # days after the trip date; DataVersion rows only (see booking/versions.py)
+    'BATCH_SIZE': 5000,
+}
+
+# Background jobs for long-running admin actions (see booking/jobs.py)
+BACKGROUND_JOBS = {
+    'POLL_SECONDS': 2,
+    'STALE_SECONDS': 300,  # running jobs without a heartbeat for this long are requeued
+    'MAX_ATTEMPTS': 3,
+    # CSV files uploaded for admin import jobs are kept in default_storage under this prefix,
+    # so a worker on any node can read them; use shared storage when workers run on several nodes
+    'UPLOAD_PREFIX': 'job_uploads/',
+}
+
+# On-disk pickup / drop-off manifest downloads (see booking/manifests.py)
+MANIFEST_CACHE = {
+    'ROOT': BASE_DIR / 'manifest_cache',
+    # Set to 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache) to let the web server send the files
+    'SENDFILE_HEADER': os.environ.get('MANIFEST_SENDFILE_HEADER', ''),
+    'SENDFILE_URL_PREFIX': '/protected/manifests/',
+}
+
+# Login throttling (see booking/ratelimit.py)
+LOGIN_RATE_LIMIT = {
+    'WINDOW_SECONDS': 300,
+    'EMAIL_LIMIT': 10,
+    'IP_LIMIT': 50,
+    'TRUST_X_FORWARDED_FOR': False,
+    'TRUSTED_PROXY_COUNT': 1,  # proxies appending to X-Forwarded-For; the client IP is this many hops from the right
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -156,6 +205,9 @@ CORS_ALLOWED_ORIGIN_REGEXES = [r"^https://.*\.netlify\.app$"]
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Let the frontend read the login throttle's back-off hint
+CORS_EXPOSE_HEADERS = ['Retry-After']
+
 # CSRF trusted origins (for secure POST from frontend if needed)
 CSRF_TRUSTED_ORIGINS = [
     "https://recbusbooking25.netlify.app",
@@ -135,11 +135,29 @@ LOGGING = {
 }
 
 # Cache settings (optional, for performance)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Login throttling, OTPs and the SiteConfiguration version key rely on this cache
+# being shared between workers; set REDIS_URL when running more than one worker.
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Railway terminates TLS at its proxy, so the client IP is the hop that proxy appends to
+# X-Forwarded-For (the last one); raise LOGIN_RATE_LIMIT_PROXY_COUNT if another proxy sits in front
+LOGIN_RATE_LIMIT = dict(
+    LOGIN_RATE_LIMIT,
+    TRUST_X_FORWARDED_FOR=True,
+    TRUSTED_PROXY_COUNT=int(os.environ.get('LOGIN_RATE_LIMIT_PROXY_COUNT', 1)),
+)
 
 # Session settings
 SESSION_COOKIE_AGE = 3600  # 1 hour
@@ -163,8 +181,9 @@ else:
 
 # REST Framework production settings
 REST_FRAMEWORK = {
+    # Bearer tokens only; see settings.py for why BasicAuthentication is not enabled
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'booking.authentication.SignedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -9,12 +9,11 @@ export class ApiError extends Error {
   }
 }
 
-export const setBasicAuth = (email: string, password: string) => {
-  basicAuth = 'Basic ' + btoa(`${email}:${password}`);
-  // Store credentials in localStorage for persistence
+// The signed bearer token returned by /login/; the password is never re-sent
+// (and re-hashed server-side) on later calls.
+export const setBearerToken = (token: string) => {
+  basicAuth = `Bearer ${token}`;
   localStorage.setItem('basicAuth', basicAuth);
-  localStorage.setItem('userEmail', email);
-  console.log('Basic auth set and stored:', basicAuth ? 'Yes' : 'No');
 };
 
 export const getBasicAuth = () => {
@@ -23,7 +22,8 @@ export const getBasicAuth = () => {
 
 export const restoreBasicAuth = () => {
   const storedAuth = localStorage.getItem('basicAuth');
-  if (storedAuth) {
+  // Stored Basic credentials predate bearer tokens; the API no longer accepts them
+  if (storedAuth && storedAuth.startsWith('Bearer ')) {
     basicAuth = storedAuth;
     console.log('Basic auth restored from localStorage');
     return true;
@@ -92,12 +92,17 @@ const apiCall = async (endpoint: string, options: RequestInit = {}) => {
 };
 
 export const login = async (email: string, password: string) => {
-  setBasicAuth(email, password);
+  // /login/ authenticates from the request body; only the returned token is stored
+  clearBasicAuth();
+  localStorage.setItem('userEmail', email);
   const response = await apiCall('/login/', {
     method: 'POST',
     body: JSON.stringify({ email, password }),
   });
   if (response.success) {
+    if (response.token) {
+      setBearerToken(response.token);
+    }
     return response.user;
   } else {
     basicAuth = null; // clear on failure